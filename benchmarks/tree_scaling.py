@@ -0,0 +1,42 @@
+import hashlib
+import time
+from typing import Callable
+
+from pgz import git_object
+from pgz import types
+
+
+def make_tree_raw(n: int) -> bytes:
+    return b''.join(
+        f'100644 file-{i:07d}.txt\x00'.encode() + hashlib.sha1(str(i).encode()).digest()
+        for i in range(n)
+    )
+
+
+def measure(fn: Callable[[], object]) -> float:
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main() -> None:
+    print(f'{"entries":>8} {"parse":>10} {"serialize":>10} {"prettify":>10}')
+
+    for n in (1_000, 10_000, 100_000):
+        raw = make_tree_raw(n)
+        tree = types.GitObjectTree(items=types.parse_tree_items(raw))
+
+        parse = measure(lambda: sum(1 for _ in types.iter_tree_items(raw)))
+        serialize = measure(lambda: git_object.serialize(tree))
+        prettify = measure(lambda: git_object.prettify(tree))
+
+        assert git_object.serialize(tree) == raw
+        print(f'{n:>8} {parse * 1000:>8.1f}ms {serialize * 1000:>8.1f}ms {prettify * 1000:>8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
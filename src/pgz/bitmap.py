@@ -0,0 +1,403 @@
+import array
+import hashlib
+import os
+import pathlib
+import struct
+import sys
+import tempfile
+from typing import Callable, Iterator, Optional
+
+from . import pack
+from . import repository
+from . import revwalk
+from . import types
+
+
+SIGNATURE = b'BITM'
+VERSION = 1
+OPT_FULL_DAG = 0x1
+OPT_HASH_CACHE = 0x4
+OPT_LOOKUP_TABLE = 0x10
+HEADER = struct.Struct('>4sHHI20s')
+ENTRY = struct.Struct('>IBB')
+
+# the type bitmaps come in this order after the header
+TYPE_ORDER = (
+    types.GitObjectTypeEnum.COMMIT,
+    types.GitObjectTypeEnum.TREE,
+    types.GitObjectTypeEnum.BLOB,
+    types.GitObjectTypeEnum.TAG,
+)
+
+# an EWAH run-length word: bit 0 the running bit, 32 bits of run length
+# (in words), then 31 bits counting the literal words that follow
+ALL_ONES = (1 << 64) - 1
+RLW_MAX_RUN = (1 << 32) - 1
+RLW_MAX_LITERALS = (1 << 31) - 1
+
+# commit selection as in git: every commit among the newest MUST_REGION,
+# one in MIN_COMMITS up to MIN_REGION, then ever wider up to MAX_COMMITS
+MUST_REGION = 100
+MIN_REGION = 20000
+MIN_COMMITS = 100
+MAX_COMMITS = 5000
+# how many earlier bitmaps are tried as XOR bases
+MAX_XOR_OFFSET = 10
+
+# A bitmap is held as a Python int, bit N standing for the object at
+# position N of the pack (in offset order), so OR, AND-NOT and counting
+# are single C-level operations.
+Bitmap = int
+
+
+def read_ewah(buf: bytes, pos: int) -> tuple[Bitmap, int]:
+    # (bitmap, position after it)
+    bit_size, word_count = struct.unpack_from('>II', buf, pos)
+    pos += 8
+
+    words = array.array('Q', buf[pos:pos + 8 * word_count])
+    if sys.byteorder == 'little':
+        words.byteswap()
+    pos += 8 * word_count + 4  # the position of the last run-length word
+
+    res = array.array('Q')
+    i = 0
+    while i < word_count:
+        rlw = words[i]
+        run = (rlw >> 1) & RLW_MAX_RUN
+        literals = rlw >> 33
+        if run:
+            res.extend(array.array('Q', [ALL_ONES if rlw & 1 else 0]) * run)
+        res.extend(words[i + 1:i + 1 + literals])
+        i += 1 + literals
+
+    if sys.byteorder != 'little':
+        res.byteswap()
+
+    return int.from_bytes(res.tobytes(), 'little') & ((1 << bit_size) - 1), pos
+
+
+def encode_ewah(bitmap: Bitmap) -> bytes:
+    bit_size = bitmap.bit_length()
+    count = (bit_size + 63) // 64
+
+    words = array.array('Q', bitmap.to_bytes(8 * count, 'little'))
+    if sys.byteorder != 'little':
+        words.byteswap()
+
+    res = array.array('Q')
+    last_rlw = 0
+    i = 0
+    while i < count:
+        word = words[i]
+        run = 0
+        if word in (0, ALL_ONES):
+            while i < count and words[i] == word and run < RLW_MAX_RUN:
+                i += 1
+                run += 1
+
+        start = i
+        while i < count and words[i] not in (0, ALL_ONES) and i - start < RLW_MAX_LITERALS:
+            i += 1
+
+        last_rlw = len(res)
+        res.append((word == ALL_ONES and run > 0) | (run << 1) | ((i - start) << 33))
+        res.extend(words[start:i])
+
+    if sys.byteorder == 'little':
+        res.byteswap()
+
+    return struct.pack('>II', bit_size, len(res)) + res.tobytes() + struct.pack('>I', last_rlw)
+
+
+def fill(
+    repo: repository.Repository,
+    tips: list[str],
+    position: Callable[[str], int],
+    stored: Callable[[str], Optional[Bitmap]],
+) -> Bitmap:
+    # The bitmap of everything reachable from `tips`.  A commit with a
+    # stored bitmap contributes it whole; the commits above those are
+    # walked first, then their trees, skipping objects already set.
+    base = 0
+    commits: list[tuple[str, types.GitObjectCommit]] = []
+    others: list[tuple[str, types.GitObject]] = []
+    seen: set[str] = set()
+    stack = list(reversed(tips))
+
+    while stack:
+        sha = stack.pop()
+        if sha in seen:
+            continue
+        seen.add(sha)
+
+        bitmap = stored(sha)
+        if bitmap is not None:
+            base |= bitmap
+            continue
+
+        obj = repo.read_object(sha)
+        if isinstance(obj, types.GitObjectCommit):
+            if (base >> position(sha)) & 1:
+                continue
+            commits.append((sha, obj))
+            stack.extend(reversed(obj.parents))
+        else:
+            others.append((sha, obj))
+            if isinstance(obj, types.GitObjectTag):
+                stack.append(obj.object)
+
+    bits = bytearray(base.to_bytes((base.bit_length() + 7) // 8, 'little'))
+
+    def mark(sha: str) -> bool:
+        # sets the bit of `sha`, False when it was set already
+        pos = position(sha)
+        i = pos >> 3
+        if i >= len(bits):
+            bits.extend(bytes(i + 1 - len(bits)))
+
+        mask = 1 << (pos & 7)
+        if bits[i] & mask:
+            return False
+        bits[i] |= mask
+
+        return True
+
+    def add_tree(tree: str) -> None:
+        pending = [tree]
+        while pending:
+            _, data = repo.read_raw(pending.pop())
+            for item in types.iter_tree_items(data):
+                if item.mode == '160000':
+                    # a submodule commit is not part of this repository
+                    continue
+                if mark(item.sha) and item.mode.startswith('04'):
+                    pending.append(item.sha)
+
+    for sha, obj in others:
+        if mark(sha) and isinstance(obj, types.GitObjectTree):
+            add_tree(sha)
+
+    for sha, commit in commits:
+        mark(sha)
+        if mark(commit.tree):
+            add_tree(commit.tree)
+
+    return int.from_bytes(bits, 'little')
+
+
+class PackBitmap:
+    # A pack's `.bitmap` (version 1): for selected commits, the set of
+    # objects reachable from them.  Entries are located when the file is
+    # opened but decoded only on first use; an entry may be stored XORed
+    # with an earlier one.  Objects that are not in the pack (newer loose
+    # ones) get positions past its end, as git's "extended index" does.
+    __slots__ = (
+        'path', 'pack', 'mm', 'order', 'pack_positions', 'type_bitmaps', 'entries', 'located', 'decoded', 'extended',
+    )
+
+    def __init__(self, path: pathlib.Path, pack_: pack.Pack) -> None:
+        self.path = path
+        self.pack = pack_
+        self.mm = pack.mmap_file(path)
+
+        signature, version, options, count, checksum = HEADER.unpack_from(self.mm, 0)
+        if signature != SIGNATURE or version != VERSION:
+            raise Exception(f'Unsupported bitmap: {path}')
+        if not options & OPT_FULL_DAG:
+            raise Exception(f'Unsupported bitmap options {options:#x}: {path}')
+        if checksum != pack_.mm[-20:]:
+            raise Exception(f'Bitmap does not match its pack: {path}')
+
+        self.order = pack.reverse_index(pack_)
+        self.pack_positions = array.array('I', bytes(4 * len(self.order)))
+        for pos, idx_pos in enumerate(self.order):
+            self.pack_positions[idx_pos] = pos
+
+        pos = HEADER.size
+        self.type_bitmaps: dict[types.GitObjectTypeEnum, Bitmap] = {}
+        for type_ in TYPE_ORDER:
+            self.type_bitmaps[type_], pos = read_ewah(self.mm, pos)
+
+        # commit -> entry number; per entry, (XOR offset, position of its EWAH)
+        self.entries: dict[str, int] = {}
+        self.located: list[tuple[int, int]] = []
+        for i in range(count):
+            idx_pos, xor_offset, _flags = ENTRY.unpack_from(self.mm, pos)
+            pos += ENTRY.size
+            self.entries[pack_.index.sha_at(idx_pos).hex()] = i
+            self.located.append((xor_offset, pos))
+
+            _bit_size, word_count = struct.unpack_from('>II', self.mm, pos)
+            pos += 8 + 8 * word_count + 4
+
+        self.decoded: dict[int, Bitmap] = {}
+        self.extended: dict[str, int] = {}
+
+    def decode(self, i: int) -> Bitmap:
+        res = self.decoded.get(i)
+        if res is None:
+            xor_offset, pos = self.located[i]
+            res, _ = read_ewah(self.mm, pos)
+            if xor_offset:
+                res ^= self.decode(i - xor_offset)
+            self.decoded[i] = res
+
+        return res
+
+    def bitmap(self, sha: str) -> Optional[Bitmap]:
+        i = self.entries.get(sha)
+        if i is None:
+            return None
+
+        return self.decode(i)
+
+    def position(self, sha: str) -> int:
+        idx_pos = self.pack.index.find(bytes.fromhex(sha))
+        if idx_pos is not None:
+            return self.pack_positions[idx_pos]
+
+        pos = self.extended.get(sha)
+        if pos is None:
+            pos = self.extended[sha] = len(self.order) + len(self.extended)
+
+        return pos
+
+    def reachable(self, repo: repository.Repository, tips: list[str]) -> Bitmap:
+        return fill(repo, tips, self.position, self.bitmap)
+
+    def of_type(self, repo: repository.Repository, bitmap: Bitmap, type_: types.GitObjectTypeEnum) -> Bitmap:
+        res = bitmap & self.type_bitmaps[type_]
+        for sha, pos in self.extended.items():
+            if (bitmap >> pos) & 1 and repo.read_header(sha)[0] == type_:
+                res |= 1 << pos
+
+        return res
+
+    def shas(self, bitmap: Bitmap) -> Iterator[str]:
+        # the objects of `bitmap` in pack order
+        extended = {pos: sha for sha, pos in self.extended.items()}
+        count = len(self.order)
+
+        for i, byte in enumerate(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')):
+            if not byte:
+                continue
+            for bit in range(8):
+                if not (byte >> bit) & 1:
+                    continue
+                pos = 8 * i + bit
+                yield self.pack.index.sha_at(self.order[pos]).hex() if pos < count else extended[pos]
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+_bitmaps: dict[pathlib.Path, tuple[int, PackBitmap]] = {}
+
+
+def load(gitdir: pathlib.Path) -> Optional[PackBitmap]:
+    # the bitmap of the first pack that has one, as git uses only one
+    for pack_ in pack.packs(gitdir):
+        path = pack_.path.with_suffix('.bitmap')
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            continue
+
+        cached = _bitmaps.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        res = PackBitmap(path, pack_)
+        _bitmaps[path] = (mtime, res)
+
+        return res
+
+    return None
+
+
+def select_commits(repo: repository.Repository, tips: list[str]) -> list[str]:
+    # the tips and a spread of their history, oldest first
+    commits = [sha for sha, _ in revwalk.walk(repo.gitdir, tips)]
+    selected = set(tips)
+
+    i = 0
+    while i < len(commits):
+        selected.add(commits[i])
+        if i < MUST_REGION:
+            i += 1
+        elif i < MIN_REGION:
+            i += MIN_COMMITS
+        else:
+            i += max(MIN_COMMITS, min(i - MIN_REGION, MAX_COMMITS))
+
+    return [sha for sha in reversed(commits) if sha in selected]
+
+
+def write(repo: repository.Repository, pack_: pack.Pack, tips: list[str]) -> pathlib.Path:
+    # Writes `.rev` and `.bitmap` files for `pack_`, which has to hold
+    # everything reachable from `tips` (commits).  Bitmaps are built oldest
+    # first, so each one only walks down to the previous ones.
+    order = pack.reverse_index(pack_)
+    pack_positions = array.array('I', bytes(4 * len(order)))
+    for pos, idx_pos in enumerate(order):
+        pack_positions[idx_pos] = pos
+
+    # every root tree lists all top-level entries again, so the binary
+    # search in the index is done once per object
+    positions: dict[str, int] = {}
+
+    def position(sha: str) -> int:
+        pos = positions.get(sha)
+        if pos is None:
+            idx_pos = pack_.index.find(bytes.fromhex(sha))
+            if idx_pos is None:
+                raise Exception(f'{sha} is reachable but not in {pack_.path}; repack with -a first')
+            pos = positions[sha] = pack_positions[idx_pos]
+
+        return pos
+
+    type_bitmaps = dict.fromkeys(TYPE_ORDER, 0)
+    for pos, idx_pos in enumerate(order):
+        type_, _ = pack_.read_header_at(pack_.index.offset_at(idx_pos))
+        type_bitmaps[type_] |= 1 << pos
+
+    bitmaps: dict[str, Bitmap] = {}
+    entries: list[bytes] = []
+    written: list[Bitmap] = []
+
+    for sha in select_commits(repo, tips):
+        bitmap = bitmaps[sha] = fill(repo, [sha], position, bitmaps.get)
+
+        # stored against the earlier bitmap it differs least from, if that
+        # encodes smaller
+        encoded = encode_ewah(bitmap)
+        xor_offset = 0
+        candidates = [((bitmap ^ other).bit_count(), offset) for offset, other in enumerate(reversed(written[-MAX_XOR_OFFSET:]), 1)]
+        if candidates:
+            _, offset = min(candidates)
+            xored = encode_ewah(bitmap ^ written[-offset])
+            if len(xored) < len(encoded):
+                encoded, xor_offset = xored, offset
+
+        idx_pos = pack_.index.find(bytes.fromhex(sha))
+        assert idx_pos is not None
+        entries.append(ENTRY.pack(idx_pos, xor_offset, 0) + encoded)
+        written.append(bitmap)
+
+    body = b''.join([
+        HEADER.pack(SIGNATURE, VERSION, OPT_FULL_DAG, len(entries), pack_.mm[-20:]),
+        *(encode_ewah(type_bitmaps[type_]) for type_ in TYPE_ORDER),
+        *entries,
+    ])
+
+    pack.write_reverse_index(pack_, order)
+
+    path = pack_.path.with_suffix('.bitmap')
+    with tempfile.NamedTemporaryFile(prefix='tmp_bitmap_', dir=path.parent, delete=False) as f:
+        f.write(body + hashlib.sha1(body).digest())
+
+    os.chmod(f.name, 0o444)
+    pathlib.Path(f.name).replace(path)
+
+    return path
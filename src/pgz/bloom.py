@@ -0,0 +1,169 @@
+import itertools
+import pathlib
+import struct
+from typing import Optional
+
+from . import commit_graph
+from . import diff
+
+
+CHUNK_BLOOM_INDEXES = b'BIDX'
+CHUNK_BLOOM_DATA = b'BDAT'
+
+SEED0 = 0x293ae76f
+SEED1 = 0x7e646e2c
+HASH_VERSION = 1
+NUM_HASHES = 7
+BITS_PER_ENTRY = 10
+MAX_CHANGED_PATHS = 512
+
+# a one-byte filter with every bit set answers "maybe" for any path
+TRUNCATED_FILTER = b'\xff'
+
+
+def rotl32(x: int, r: int) -> int:
+    return ((x << r) | (x >> (32 - r))) & 0xffffffff
+
+
+def murmur3(data: bytes, seed: int, version: int = HASH_VERSION) -> int:
+    # version 1 is git's original implementation, which sign-extends bytes
+    # >= 0x80 (it reads them through a `char`); version 2 is plain murmur3.
+    if version == 1:
+        values = [byte | 0xffffff00 if byte & 0x80 else byte for byte in data]
+    else:
+        values = list(data)
+
+    c1 = 0xcc9e2d51
+    c2 = 0x1b873593
+    h = seed
+    length = len(values)
+    tail_start = length - length % 4
+
+    for i in range(0, tail_start, 4):
+        k = (values[i] | (values[i + 1] << 8) | (values[i + 2] << 16) | (values[i + 3] << 24)) & 0xffffffff
+        k = (k * c1) & 0xffffffff
+        k = rotl32(k, 15)
+        k = (k * c2) & 0xffffffff
+        h ^= k
+        h = rotl32(h, 13)
+        h = (h * 5 + 0xe6546b64) & 0xffffffff
+
+    k = 0
+    for i in range(length - 1, tail_start - 1, -1):
+        k ^= (values[i] << (8 * (i - tail_start))) & 0xffffffff
+    if length % 4:
+        k = (k * c1) & 0xffffffff
+        k = rotl32(k, 15)
+        k = (k * c2) & 0xffffffff
+        h ^= k
+
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & 0xffffffff
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & 0xffffffff
+    h ^= h >> 16
+
+    return h
+
+
+def key_hashes(path: str, version: int = HASH_VERSION) -> list[int]:
+    data = path.encode()
+    hash0 = murmur3(data, SEED0, version)
+    hash1 = murmur3(data, SEED1, version)
+
+    return [(hash0 + i * hash1) & 0xffffffff for i in range(NUM_HASHES)]
+
+
+def build_filter(paths: set[str], version: int = HASH_VERSION) -> bytes:
+    filter_ = bytearray(max((len(paths) * BITS_PER_ENTRY + 7) // 8, 1))
+    bits = len(filter_) * 8
+
+    for path in paths:
+        for hash_ in key_hashes(path, version):
+            pos = hash_ % bits
+            filter_[pos // 8] |= 1 << (pos % 8)
+
+    return bytes(filter_)
+
+
+def might_contain(filter_: bytes, path: str, version: int = HASH_VERSION) -> bool:
+    if not filter_:
+        return True
+
+    bits = len(filter_) * 8
+    for hash_ in key_hashes(path.strip('/'), version):
+        pos = hash_ % bits
+        if not filter_[pos // 8] & (1 << (pos % 8)):
+            return False
+
+    return True
+
+
+def changed_path_set(gitdir: pathlib.Path, old_tree: Optional[str], new_tree: Optional[str]) -> Optional[set[str]]:
+    # every changed path plus all of its leading directories, or None when
+    # there are too many changes to be worth filtering
+    changes = list(itertools.islice(diff.changed_paths(gitdir, old_tree, new_tree), MAX_CHANGED_PATHS + 1))
+    if len(changes) > MAX_CHANGED_PATHS:
+        return None
+
+    res: set[str] = set()
+    for path in changes:
+        while path:
+            res.add(path)
+            path = path.rpartition('/')[0]
+
+    return res
+
+
+def compute_filter(gitdir: pathlib.Path, old_tree: Optional[str], new_tree: Optional[str]) -> bytes:
+    paths = changed_path_set(gitdir, old_tree, new_tree)
+    if paths is None:
+        return TRUNCATED_FILTER
+
+    return build_filter(paths)
+
+
+class ChangedPathFilters:
+    __slots__ = ('graph', 'version', 'index_start', 'data_start')
+
+    def __init__(self, graph: commit_graph.CommitGraph) -> None:
+        self.graph = graph
+
+        index = graph.chunks.get(CHUNK_BLOOM_INDEXES)
+        data = graph.chunks.get(CHUNK_BLOOM_DATA)
+        if not index or not data:
+            raise Exception(f'No changed-path filters in {graph.path}')
+
+        self.version, num_hashes, bits_per_entry = struct.unpack_from('>III', graph.mm, data[0])
+        if self.version not in (1, 2) or num_hashes != NUM_HASHES or bits_per_entry != BITS_PER_ENTRY:
+            raise Exception(f'Unsupported changed-path filter settings in {graph.path}')
+
+        self.index_start = index[0]
+        self.data_start = data[0] + 12
+
+    @classmethod
+    def load(cls, graph: Optional[commit_graph.CommitGraph]) -> Optional['ChangedPathFilters']:
+        if not graph or CHUNK_BLOOM_INDEXES not in graph.chunks or CHUNK_BLOOM_DATA not in graph.chunks:
+            return None
+
+        return cls(graph)
+
+    def filter_at(self, pos: int) -> bytes:
+        mm = self.graph.mm
+        start = struct.unpack_from('>I', mm, self.index_start + 4 * (pos - 1))[0] if pos else 0
+        end, = struct.unpack_from('>I', mm, self.index_start + 4 * pos)
+
+        return mm[self.data_start + start:self.data_start + end]
+
+    def might_change(self, pos: int, path: str) -> bool:
+        return might_contain(self.filter_at(pos), path, self.version)
+
+
+def chunks(filters: list[bytes]) -> list[tuple[bytes, bytes]]:
+    offsets = list(itertools.accumulate(len(filter_) for filter_ in filters))
+
+    return [
+        (CHUNK_BLOOM_INDEXES, struct.pack(f'>{len(offsets)}I', *offsets)),
+        (CHUNK_BLOOM_DATA, struct.pack('>III', HASH_VERSION, NUM_HASHES, BITS_PER_ENTRY) + b''.join(filters)),
+    ]
@@ -5,3 +5,15 @@ from .log import main_log as main_log
 from .update_ref import main_update_ref as main_update_ref
 from .symbolic_ref import main_symbolic_ref as main_symbolic_ref
 from .tag import main_tag as main_tag
+from .repack import main_repack as main_repack
+from .commit_graph import main_commit_graph as main_commit_graph
+from .pack_refs import main_pack_refs as main_pack_refs
+from .ls_tree import main_ls_tree as main_ls_tree
+from .diff_tree import main_diff_tree as main_diff_tree
+from .status import main_status as main_status
+from .write_tree import main_write_tree as main_write_tree
+from .commit_tree import main_commit_tree as main_commit_tree
+from .fast_import import main_fast_import as main_fast_import
+from .unpack_objects import main_unpack_objects as main_unpack_objects
+from .rev_list import main_rev_list as main_rev_list
+from .merge_base import main_merge_base as main_merge_base
@@ -1,14 +1,15 @@
 from __future__ import annotations
 
-import pathlib
 import sys
 from typing import Optional
 
 import pydantic
 
-from .. import lib
 from .. import types
 from .. import git_object
+from .. import object_names
+from .. import revparse
+from .. import repository
 
 
 class Argument(pydantic.BaseModel):
@@ -16,6 +17,11 @@ class Argument(pydantic.BaseModel):
     object: Optional[str] = None
     pretty: bool = False
     show_type: bool = False
+    show_size: bool = False
+    check_exists: bool = False
+    batch: bool = False
+    batch_check: bool = False
+    buffer: bool = False
 
     @classmethod
     def parse_args(cls, args_: list[str]) -> Argument:
@@ -26,6 +32,7 @@ cat-file: Provide content or type and size information for repository objects.
 Usage: pgz cat-file [options...] <type> <object>
        pgz cat-file (-e | -p) <object>
        pgz cat-file (-t | -s) <object>
+       pgz cat-file (--batch | --batch-check) [--buffer]
 
 Arguments:
     <type>      Specify the type.  (commit, tree, tag, blob)
@@ -33,7 +40,13 @@ Arguments:
 
 Options:
     -p            Pretty-print the contents of <object> based on its type.
+    -e            Exit with zero status if <object> exists, non-zero otherwise.
     -t            Instead of the content, show the object type identified by <object>.
+    -s            Instead of the content, show the object size identified by <object>.
+    --batch       Read object names from stdin and print type, size and content of each.
+    --batch-check
+                  Read object names from stdin and print type and size of each.
+    --buffer      With --batch or --batch-check, flush the output only at the end.
     -h, --help    Show this message and exit.
 ''')
 
@@ -47,8 +60,18 @@ Options:
                 break
             elif arg == '-p':
                 obj.pretty = True
+            elif arg == '-e':
+                obj.check_exists = True
             elif arg == '-t':
                 obj.show_type = True
+            elif arg == '-s':
+                obj.show_size = True
+            elif arg == '--batch':
+                obj.batch = True
+            elif arg == '--batch-check':
+                obj.batch_check = True
+            elif arg == '--buffer':
+                obj.buffer = True
             elif arg in ('-h', '--help'):
                 help()
                 exit(0)
@@ -57,7 +80,10 @@ Options:
             else:
                 args.append(arg)
 
-        if len(args) == 2:
+        if obj.batch or obj.batch_check:
+            if args:
+                raise Exception(f'Unknown arguments: {args}')
+        elif len(args) == 2:
             type_, obj.object = args
 
             enum_type = types.GitObjectTypeEnum.from_str(type_)
@@ -73,37 +99,65 @@ Options:
         return obj
 
 
+def main_batch(repo: repository.Repository, args: Argument) -> None:
+    out = sys.stdout.buffer
+
+    for line in sys.stdin.buffer:
+        name = line.rstrip(b'\r\n').decode()
+
+        try:
+            sha = revparse.resolve(repo.gitdir, name)
+            if args.batch:
+                type_, data = repo.read_raw(sha)
+                size = len(data)
+            else:
+                type_, size = repo.read_header(sha)
+        except object_names.AmbiguousObjectName:
+            out.write(f'{name} ambiguous\n'.encode())
+        except Exception:
+            out.write(f'{name} missing\n'.encode())
+        else:
+            out.write(f'{sha} {type_.name.lower()} {size}\n'.encode())
+            if args.batch:
+                out.write(data)
+                out.write(b'\n')
+
+        if not args.buffer:
+            out.flush()
+
+    out.flush()
+
+
 def main_cat_file(args_: list[str]) -> None:
     args = Argument.parse_args(args_)
 
+    repo = repository.discover()
+    gitdir = repo.gitdir
+
+    if args.batch or args.batch_check:
+        main_batch(repo, args)
+        return
+
     if not args.object:
         raise Exception('No object specified')
 
-    gitdir = lib.locate_dominating_file(pathlib.Path.cwd(), '.git')
-    if not gitdir:
-        raise Exception('Not a git repository')
-
-    obj = git_object.from_sha(gitdir, args.object)
+    if args.check_exists:
+        try:
+            sha = revparse.resolve(gitdir, args.object)
+        except Exception:
+            exit(1)
+        exit(0 if repo.exists(sha) else 1)
 
-    if args.type and obj.type_ != args.type:
-        raise Exception(f'Object {args.object} is of type {obj.type_.name.lower()}, not {args.type.name.lower()}')
+    sha = revparse.resolve(gitdir, args.object)
 
-    if args.show_type:
-        print(obj.type_.name.lower())
+    if args.show_type or args.show_size:
+        type_, size = repo.read_header(sha)
+        print(type_.name.lower() if args.show_type else size)
         return
 
-    if isinstance(obj, types.GitObjectTree):
-        type_mapping = {
-            '04': 'tree',
-            '10': 'blob',
-            '12': 'blob',
-            '16': 'commit',
-        }
-        for item in obj.items:
-            type_ = type_mapping.get(item.mode[:2])
-            if not type_:
-                raise Exception(f'Unknown mode: {item.mode}')
-            print(f'{item.mode} {type_} {item.sha}\t{item.path}')
-        return
+    obj = repo.read_object(sha)
+
+    if args.type and obj.type_ != args.type:
+        raise Exception(f'Object {args.object} is of type {obj.type_.name.lower()}, not {args.type.name.lower()}')
 
     sys.stdout.buffer.write(git_object.prettify(obj))
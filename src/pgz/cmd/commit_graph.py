@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import sys
+from typing import Optional
+
+import pydantic
+
+from .. import bloom
+from .. import commit_graph
+from .. import repository
+
+
+class Argument(pydantic.BaseModel):
+    subcommand: Optional[str] = None
+    stdin_commits: bool = False
+    changed_paths: bool = False
+
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+commit-graph: Write and verify commit-graph files.
+
+Usage: pgz commit-graph write [options...]
+
+Options:
+    --stdin-commits    Read the tip commits from stdin instead of walking from all refs.
+    --changed-paths    Also write changed-path Bloom filters used by `pgz log -- <path>`.
+    -h, --help         Show this message and exit.
+''')
+
+        obj = cls()
+        args: list[str] = []
+
+        while args_:
+            arg = args_.pop(0)
+            if arg == '--stdin-commits':
+                obj.stdin_commits = True
+            elif arg == '--changed-paths':
+                obj.changed_paths = True
+            elif arg in ('-h', '--help'):
+                help()
+                exit(0)
+            elif arg.startswith('-'):
+                raise Exception(f'Unknown option: {arg}')
+            else:
+                args.append(arg)
+
+        if args != ['write']:
+            raise Exception('Invalid arguments')
+
+        obj.subcommand = args[0]
+
+        return obj
+
+
+def main_commit_graph(args_: list[str]) -> None:
+    args = Argument.parse_args(args_)
+
+    repo = repository.discover()
+    gitdir = repo.gitdir
+
+    if args.stdin_commits:
+        tips = [line.strip() for line in sys.stdin if line.strip()]
+    else:
+        tips = list(repo.refs.refs().values())
+        head = repo.refs.resolve('HEAD')
+        if head:
+            tips.append(head)
+
+    existing = commit_graph.load(gitdir)
+    commits = commit_graph.collect(gitdir, tips, existing)
+
+    extra_chunks: list[tuple[bytes, bytes]] = []
+    existing_filters = bloom.ChangedPathFilters.load(existing)
+    if args.changed_paths or existing_filters:
+        filters: list[bytes] = []
+        for sha in sorted(commits):
+            pos = existing.find(bytes.fromhex(sha)) if existing_filters and existing else None
+            if existing_filters and pos is not None and existing_filters.version == bloom.HASH_VERSION:
+                filters.append(existing_filters.filter_at(pos))
+                continue
+
+            tree, parents, _commit_time, _generation = commits[sha]
+            parent_tree = commits[parents[0]][0] if parents else None
+            filters.append(bloom.compute_filter(gitdir, parent_tree, tree))
+
+        extra_chunks = bloom.chunks(filters)
+
+    commit_graph.write(gitdir, commits, extra_chunks)
+
+    print(f'Wrote {len(commits)} commits ({len(commits) - (existing.count if existing else 0)} new) to commit-graph')
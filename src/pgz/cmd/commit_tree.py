@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import pathlib
+import sys
+from typing import Optional
+
+import pydantic
+
+from .. import git_object
+from .. import repository
+from .. import revparse
+from .. import types
+
+
+class Argument(pydantic.BaseModel):
+    tree: Optional[str] = None
+    parents: list[str] = []
+    messages: list[str] = []
+    message_file: Optional[pathlib.Path] = None
+
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+commit-tree: Create a new commit object.
+
+Usage: pgz commit-tree [options...] <tree>
+
+Arguments:
+    <tree>  Specify the tree, or a commit or tag that points to one.
+
+The message is read from standard input unless -m or -F is given.  Author and
+committer come from GIT_AUTHOR_* / GIT_COMMITTER_* or user.name / user.email.
+
+Options:
+    -p <parent>   Add a parent commit.  (may be repeated)
+    -m <message>  Add a message paragraph.  (may be repeated)
+    -F <file>     Read the message from the file.  (- for standard input)
+    -h, --help    Show this message and exit.
+''')
+
+        obj = cls()
+        args: list[str] = []
+
+        while args_:
+            arg = args_.pop(0)
+            if arg == '-p':
+                obj.parents.append(args_.pop(0))
+            elif arg == '-m':
+                obj.messages.append(args_.pop(0))
+            elif arg == '-F':
+                obj.message_file = pathlib.Path(args_.pop(0))
+            elif arg in ('-h', '--help'):
+                help()
+                exit(0)
+            elif arg.startswith('-'):
+                raise Exception(f'Unknown option: {arg}')
+            else:
+                args.append(arg)
+
+        if len(args) != 1:
+            raise Exception(f'Expected a tree, got {args}')
+
+        obj.tree = args[0]
+
+        return obj
+
+
+def read_message(args: Argument) -> bytes:
+    if args.messages:
+        # one paragraph per -m
+        return ('\n\n'.join(args.messages) + '\n').encode()
+
+    if args.message_file and str(args.message_file) != '-':
+        return args.message_file.read_bytes()
+
+    return sys.stdin.buffer.read()
+
+
+def main_commit_tree(args_: list[str]) -> None:
+    args = Argument.parse_args(args_)
+
+    assert args.tree
+    repo = repository.discover()
+    gitdir = repo.gitdir
+
+    headers = [('tree', revparse.peel(gitdir, revparse.resolve(gitdir, args.tree), types.GitObjectTypeEnum.TREE).encode())]
+    for parent in args.parents:
+        headers.append(('parent', revparse.resolve_commit(gitdir, parent).encode()))
+    headers.append(('author', repo.ident('author')))
+    headers.append(('committer', repo.ident('committer')))
+
+    data = git_object.serialize_key_value_list_with_message(headers, read_message(args))
+    sha = repo.writer().write(types.GitObjectTypeEnum.COMMIT, data)
+
+    print(sha)
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import pathlib
+import sys
+from typing import Optional
+
+import pydantic
+
+from .. import diff
+from .. import repository
+from .. import revparse
+from .. import types
+
+
+ZERO_SHA = '0' * 40
+
+
+class Argument(pydantic.BaseModel):
+    tree_ishes: list[str] = []
+    recursive: bool = False
+    name_only: bool = False
+    name_status: bool = False
+    root: bool = False
+    stdin: bool = False
+
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+diff-tree: Compare the content and mode of blobs found via two tree objects.
+
+Usage: pgz diff-tree [options...] <tree-ish> <tree-ish>
+       pgz diff-tree [options...] <commit>
+       pgz diff-tree [options...] --stdin
+
+Arguments:
+    <tree-ish>  Specify the trees to compare, or commits or tags that point to them.
+    <commit>    Compare the commit with its parent.  (merge commits are skipped)
+
+Options:
+    -r             Recurse into subtrees.
+    --name-only    Show only the names of changed files.
+    --name-status  Show only the names and status of changed files.
+    --root         Show a root commit as adding every file.
+    --stdin        Read commits from stdin, one per line, and compare each with its parent.
+    -h, --help     Show this message and exit.
+''')
+
+        obj = cls()
+        args: list[str] = []
+
+        while args_:
+            arg = args_.pop(0)
+            if arg == '--':
+                args.extend(args_)
+                break
+            elif arg == '-r':
+                obj.recursive = True
+            elif arg == '--name-only':
+                obj.name_only = True
+            elif arg == '--name-status':
+                obj.name_status = True
+            elif arg == '--root':
+                obj.root = True
+            elif arg == '--stdin':
+                obj.stdin = True
+            elif arg in ('-h', '--help'):
+                help()
+                exit(0)
+            elif arg.startswith('-'):
+                raise Exception(f'Unknown option: {arg}')
+            else:
+                args.append(arg)
+
+        if obj.stdin:
+            if args:
+                raise Exception(f'Unknown arguments: {args}')
+        elif len(args) not in (1, 2):
+            raise Exception(f'Expected 1 or 2 arguments, got {args}')
+
+        obj.tree_ishes = args
+
+        return obj
+
+
+def format_change(change: diff.Change, args: Argument) -> str:
+    status, path, old, new = change
+    if args.name_only:
+        return f'{path}\n'
+    if args.name_status:
+        return f'{status}\t{path}\n'
+
+    return (
+        f':{old.mode if old else "000000"} {new.mode if new else "000000"}'
+        f' {old.sha if old else ZERO_SHA} {new.sha if new else ZERO_SHA} {status}\t{path}\n'
+    )
+
+
+def write_diff(gitdir: pathlib.Path, old_tree: Optional[str], new_tree: str, args: Argument) -> None:
+    out = sys.stdout
+    for change in diff.diff_trees(gitdir, old_tree, new_tree, args.recursive):
+        out.write(format_change(change, args))
+
+
+def main_commit(repo: repository.Repository, rev: str, args: Argument) -> None:
+    sha = revparse.resolve_commit(repo.gitdir, rev)
+    commit = repo.read_object(sha)
+    assert isinstance(commit, types.GitObjectCommit)
+
+    parents = commit.parents
+    if len(parents) > 1 or (not parents and not args.root):
+        return
+
+    parent_tree: Optional[str] = None
+    if parents:
+        parent = repo.read_object(parents[0])
+        assert isinstance(parent, types.GitObjectCommit)
+        parent_tree = parent.tree
+
+    sys.stdout.write(f'{sha}\n')
+    write_diff(repo.gitdir, parent_tree, commit.tree, args)
+
+
+def main_diff_tree(args_: list[str]) -> None:
+    args = Argument.parse_args(args_)
+
+    repo = repository.discover()
+
+    if args.stdin:
+        for line in sys.stdin:
+            if line.strip():
+                main_commit(repo, line.split()[0], args)
+        return
+
+    if len(args.tree_ishes) == 1:
+        main_commit(repo, args.tree_ishes[0], args)
+        return
+
+    old_tree, new_tree = (
+        revparse.peel(repo.gitdir, revparse.resolve(repo.gitdir, tree_ish), types.GitObjectTypeEnum.TREE)
+        for tree_ish in args.tree_ishes
+    )
+    write_diff(repo.gitdir, old_tree, new_tree, args)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import pathlib
+import sys
+from typing import Optional
+
+import pydantic
+
+from .. import fast_import
+from .. import repository
+
+
+class Argument(pydantic.BaseModel):
+    force: bool = False
+    quiet: bool = False
+    import_marks: Optional[pathlib.Path] = None
+    export_marks: Optional[pathlib.Path] = None
+
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+fast-import: Import a fast-import stream from standard input into a packfile.
+
+Usage: pgz fast-import [options...] < <stream>
+
+Blobs, trees, commits and tags are written straight into a packfile, and the
+branches and tags of the stream are updated once it is complete.
+
+Options:
+    --force       Update branches even when that loses commits.
+    --quiet       Do not print statistics.
+    --import-marks=<file>
+                  Load marks from the file before reading the stream.
+    --export-marks=<file>
+                  Write the marks to the file when done.
+    -h, --help    Show this message and exit.
+''')
+
+        obj = cls()
+        args: list[str] = []
+
+        while args_:
+            arg = args_.pop(0)
+            if arg == '--force':
+                obj.force = True
+            elif arg == '--quiet':
+                obj.quiet = True
+            elif arg.startswith('--import-marks='):
+                obj.import_marks = pathlib.Path(arg.partition('=')[2])
+            elif arg.startswith('--export-marks='):
+                obj.export_marks = pathlib.Path(arg.partition('=')[2])
+            elif arg in ('-h', '--help'):
+                help()
+                exit(0)
+            elif arg.startswith('-'):
+                raise Exception(f'Unknown option: {arg}')
+            else:
+                args.append(arg)
+
+        if len(args) != 0:
+            raise Exception(f'Unknown arguments: {args}')
+
+        return obj
+
+
+def main_fast_import(args_: list[str]) -> None:
+    args = Argument.parse_args(args_)
+
+    repo = repository.discover()
+    importer = fast_import.FastImport(repo, sys.stdin.buffer, args.force)
+    importer.export_marks = args.export_marks
+
+    try:
+        if args.import_marks:
+            importer.import_marks(args.import_marks)
+        importer.run()
+    finally:
+        importer.close()
+
+    if not args.quiet:
+        counts = ', '.join(f'{count} {type_.name.lower()}s' for type_, count in sorted(importer.counts.items(), key=lambda elm: elm[0].value))
+        packs = ', '.join(path.name for path in importer.packs) or 'no pack'
+        print(f'Imported {sum(importer.counts.values())} objects ({counts or "none new"}) into {packs}', file=sys.stderr)
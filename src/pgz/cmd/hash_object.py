@@ -1,20 +1,23 @@
 from __future__ import annotations
 
+import os
 import pathlib
 import sys
 from typing import Optional
 
 import pydantic
 
-from .. import lib
 from .. import types
 from .. import git_object
+from .. import repository
 
 
 class Argument(pydantic.BaseModel):
     type: types.GitObjectTypeEnum = types.GitObjectTypeEnum.BLOB
     write: bool = False
     stdin: bool = False
+    stdin_paths: bool = False
+    threads: Optional[int] = None
     filepath: Optional[pathlib.Path] = None
 
     @classmethod
@@ -24,6 +27,7 @@ class Argument(pydantic.BaseModel):
 hash-object: Compute object ID and optionally creates a blob from a file.
 
 Usage: pgz hash-object [options...] <file>
+       pgz hash-object [options...] --stdin-paths
 
 Arguments:
     <file>    Specify the file.
@@ -32,6 +36,10 @@ Options:
     -w            Actually write the object into the object database.
     -t <type>     Specify the type.  (commit, tree, tag, blob) (default: blob)
     --stdin       Read the object from standard input instead of from a file.
+    --stdin-paths
+                  Read file paths from standard input, one per line, and hash each of them.
+    --threads <n>
+                  Number of threads used with --stdin-paths.  (default: cpu count)
     -h, --help    Show this message and exit.
 ''')
 
@@ -50,6 +58,10 @@ Options:
                 obj.type = type_
             elif arg == '--stdin':
                 obj.stdin = True
+            elif arg == '--stdin-paths':
+                obj.stdin_paths = True
+            elif arg == '--threads':
+                obj.threads = int(args_.pop(0))
             elif arg in ('-h', '--help'):
                 help()
                 exit(0)
@@ -72,20 +84,36 @@ Options:
 def main_hash_object(args_: list[str]) -> None:
     args = Argument.parse_args(args_)
 
+    gitdir: Optional[pathlib.Path] = None
+    if args.write:
+        gitdir = repository.discover().gitdir
+
+    if args.stdin_paths:
+        main_stdin_paths(gitdir, args)
+        return
+
     if args.stdin:
-        bytes = sys.stdin.buffer.read()
+        f, size = git_object.spool(sys.stdin.buffer)
+        with f:
+            sha = git_object.hash_stream(f, size, args.type, gitdir)
     else:
         if not args.filepath:
             return
-        bytes = args.filepath.read_bytes()
+        with args.filepath.open('rb') as f:
+            sha = git_object.hash_stream(f, os.fstat(f.fileno()).st_size, args.type, gitdir)
 
-    obj = types.GitObjectBlob(type_=args.type, blob=bytes)
+    print(sha)
 
-    if args.write:
-        gitdir = lib.locate_dominating_file(pathlib.Path.cwd(), '.git')
-        if not gitdir:
-            raise Exception('Not a git repository')
 
-        git_object.write_(obj, gitdir)
+def main_stdin_paths(gitdir: Optional[pathlib.Path], args: Argument) -> None:
+    paths = (line.rstrip('\r\n') for line in sys.stdin if line.rstrip('\r\n'))
+
+    if not gitdir:
+        for sha in git_object.hash_files(paths, args.type, None, args.threads):
+            print(sha)
+        return
 
-    print(git_object.hash_(obj))
+    # a single batch: objects are synced once and appear together at the end
+    with git_object.ObjectWriter(gitdir) as writer:
+        for sha in git_object.hash_files(paths, args.type, writer, args.threads):
+            print(sha)
@@ -1,16 +1,18 @@
 from __future__ import annotations
 
-import pathlib
+from typing import Optional
 
 import pydantic
 
-from .. import lib
-from .. import types
-from .. import git_object
+from .. import revwalk
+from .. import repository
 
 
 class Argument(pydantic.BaseModel):
-    revision_range: str = 'HEAD'
+    revisions: list[str] = ['HEAD']
+    paths: list[str] = []
+    max_count: Optional[int] = None
+    first_parent: bool = False
 
     @classmethod
     def parse_args(cls, args_: list[str]) -> Argument:
@@ -18,13 +20,17 @@ class Argument(pydantic.BaseModel):
             print('''\
 log: Show commit logs.
 
-Usage: pgz log [options...] [<revision range>]
+Usage: pgz log [options...] [<revision range>...] [-- <path>...]
 
 Arguments:
-    <revision range>    Specify the revision range.
+    <revision range>    Specify the revision range.  (<rev>, ^<rev>, <rev>..<rev>, <rev>...<rev>) (default: HEAD)
+                        <rev> may be a ref, an abbreviated SHA, or <rev>^N / <rev>~N.
+    <path>              Show only commits that change any of the paths.
 
 Options:
-    -h, --help    Show this message and exit.
+    -n, --max-count <n>  Limit the number of commits to output.
+    --first-parent       Follow only the first parent of merge commits.
+    -h, --help           Show this message and exit.
 ''')
 
         obj = cls()
@@ -33,8 +39,14 @@ Options:
         while args_:
             arg = args_.pop(0)
             if arg == '--':
-                args.extend(args_)
+                obj.paths = list(args_)
                 break
+            elif arg in ('-n', '--max-count'):
+                obj.max_count = int(args_.pop(0))
+            elif arg.startswith('--max-count='):
+                obj.max_count = int(arg[len('--max-count='):])
+            elif arg == '--first-parent':
+                obj.first_parent = True
             elif arg in ('-h', '--help'):
                 help()
                 exit(0)
@@ -43,31 +55,19 @@ Options:
             else:
                 args.append(arg)
 
-        if len(args) == 1:
-            obj.revision_range = args[0]
-        else:
-            raise Exception('Invalid arguments')
+        if args:
+            obj.revisions = args
 
         return obj
 
 
-def main_log_1(gitdir: pathlib.Path, sha: str, seen: list[str]) -> None:
-    obj = git_object.from_sha(gitdir, sha)
-    if not isinstance(obj, types.GitObjectCommit):
-        raise Exception(f'Not a commit: {sha}')
-
-    print(f'commit {sha} -> {obj.parent}')
-
-    if obj.parent and not obj.parent in seen:
-        seen.append(obj.parent)
-        main_log_1(gitdir, obj.parent, seen)
-
-
 def main_log(args_: list[str]) -> None:
     args = Argument.parse_args(args_)
 
-    gitdir = lib.locate_dominating_file(pathlib.Path.cwd(), '.git')
-    if not gitdir:
-        raise Exception('Not a git repository')
+    repo = repository.discover()
+    gitdir = repo.gitdir
+
+    include, exclude = revwalk.resolve_revisions(gitdir, args.revisions)
 
-    main_log_1(gitdir, args.revision_range, [])
+    for sha, parents in revwalk.walk(gitdir, include, exclude, args.max_count, args.first_parent, paths=args.paths):
+        print(f'commit {sha} -> {" ".join(parents) or None}')
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import sys
+from typing import Optional
+
+import pydantic
+
+from .. import git_object
+from .. import repository
+from .. import revparse
+from .. import treewalk
+from .. import types
+
+
+class Argument(pydantic.BaseModel):
+    tree_ish: Optional[str] = None
+    paths: list[str] = []
+    recursive: bool = False
+    show_trees: bool = False
+    name_only: bool = False
+
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+ls-tree: List the contents of a tree object.
+
+Usage: pgz ls-tree [options...] <tree-ish> [<path>...]
+
+Arguments:
+    <tree-ish>  Specify the tree, or a commit or tag that points to one.
+    <path>      Show only entries matching the paths (relative to the top of the tree).
+
+Options:
+    -r            Recurse into subtrees.
+    -t            Show tree entries even when recursing into them.
+    --name-only   List only file names.
+    -h, --help    Show this message and exit.
+''')
+
+        obj = cls()
+        args: list[str] = []
+
+        while args_:
+            arg = args_.pop(0)
+            if arg == '--':
+                args.extend(args_)
+                break
+            elif arg == '-r':
+                obj.recursive = True
+            elif arg == '-t':
+                obj.show_trees = True
+            elif arg in ('--name-only', '--name-status'):
+                obj.name_only = True
+            elif arg in ('-h', '--help'):
+                help()
+                exit(0)
+            elif arg.startswith('-'):
+                raise Exception(f'Unknown option: {arg}')
+            else:
+                args.append(arg)
+
+        if not args:
+            raise Exception('No tree-ish specified')
+
+        obj.tree_ish, *obj.paths = args
+
+        return obj
+
+
+def main_ls_tree(args_: list[str]) -> None:
+    args = Argument.parse_args(args_)
+
+    assert args.tree_ish
+    repo = repository.discover()
+    tree = revparse.peel(repo.gitdir, revparse.resolve(repo.gitdir, args.tree_ish), types.GitObjectTypeEnum.TREE)
+
+    out = sys.stdout
+    for path, item in treewalk.walk(repo.gitdir, tree, args.paths, args.recursive, args.show_trees):
+        if args.name_only:
+            out.write(f'{path}\n')
+        else:
+            out.write(f'{item.mode} {git_object.tree_item_type(item)} {item.sha}\t{path}\n')
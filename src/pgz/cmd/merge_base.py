@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import pydantic
+
+from .. import merge_base
+from .. import repository
+from .. import revparse
+
+
+class Argument(pydantic.BaseModel):
+    commits: list[str] = []
+    all: bool = False
+    is_ancestor: bool = False
+
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+merge-base: Find the best common ancestors of commits.
+
+Usage: pgz merge-base [--all] <commit> <commit>...
+       pgz merge-base --is-ancestor <commit> <commit>
+
+Arguments:
+    <commit>         The commits.  With more than two, the common ancestors of the
+                     first and of a merge of all the others.
+
+Options:
+    --all            Print every best common ancestor, not just one.
+    --is-ancestor    Exit with 0 if the first commit is an ancestor of the second,
+                     with 1 if not.
+    -h, --help       Show this message and exit.
+
+Generation numbers from the commit-graph, when it has been written, let the
+walk stop early.
+''')
+
+        obj = cls()
+        args: list[str] = []
+
+        while args_:
+            arg = args_.pop(0)
+            if arg == '--all':
+                obj.all = True
+            elif arg == '--is-ancestor':
+                obj.is_ancestor = True
+            elif arg in ('-h', '--help'):
+                help()
+                exit(0)
+            elif arg.startswith('-'):
+                raise Exception(f'Unknown option: {arg}')
+            else:
+                args.append(arg)
+
+        if obj.is_ancestor and len(args) != 2:
+            raise Exception('--is-ancestor takes exactly two commits')
+        if len(args) < 2:
+            raise Exception('At least two commits are required')
+        obj.commits = args
+
+        return obj
+
+
+def main_merge_base(args_: list[str]) -> None:
+    args = Argument.parse_args(args_)
+
+    repo = repository.discover()
+    commits = [revparse.resolve_commit(repo.gitdir, rev) for rev in args.commits]
+
+    if args.is_ancestor:
+        exit(0 if merge_base.is_ancestor(repo, commits[0], commits[1]) else 1)
+
+    bases = merge_base.merge_bases(repo, commits[0], commits[1:], args.all)
+    if not bases:
+        exit(1)
+
+    for sha in bases:
+        print(sha)
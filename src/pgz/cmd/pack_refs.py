@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import pydantic
+
+from .. import repository
+
+
+class Argument(pydantic.BaseModel):
+    all: bool = False
+    prune: bool = True
+
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+pack-refs: Pack heads and tags for efficient repository access.
+
+Usage: pgz pack-refs [options...]
+
+Options:
+    --all         Pack all refs, not only tags and refs that are already packed.
+    --no-prune    Keep the loose refs after packing them.
+    -h, --help    Show this message and exit.
+''')
+
+        obj = cls()
+
+        while args_:
+            arg = args_.pop(0)
+            if arg == '--all':
+                obj.all = True
+            elif arg == '--no-prune':
+                obj.prune = False
+            elif arg in ('-h', '--help'):
+                help()
+                exit(0)
+            else:
+                raise Exception(f'Unknown option: {arg}')
+
+        return obj
+
+
+def main_pack_refs(args_: list[str]) -> None:
+    args = Argument.parse_args(args_)
+
+    repo = repository.discover()
+
+    repo.refs.pack(all_refs=args.all, prune=args.prune)
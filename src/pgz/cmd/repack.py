@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pathlib
+from typing import Iterator, Optional
+
+import pydantic
+
+from .. import types
+from .. import bitmap
+from .. import git_object
+from .. import delta
+from .. import pack
+from .. import refs
+from .. import repository
+
+
+# uncompressed bytes of objects read and delta-searched at a time; deltas
+# are not looked for across two batches
+BATCH_SIZE = 64 * 1024 * 1024
+
+
+class Argument(pydantic.BaseModel):
+    all: bool = False
+    prune: bool = False
+    write_bitmap: bool = False
+    window: int = 10
+    depth: int = 50
+    threads: Optional[int] = None
+
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+repack: Pack loose objects into a packfile.
+
+Usage: pgz repack [options...]
+
+Options:
+    -a                 Pack every object, including those already packed, into a single pack.
+    -d                 After packing, remove the loose objects that were packed
+                       (and, with -a, the old packs).
+    -b, --write-bitmap-index
+                       Write a reachability bitmap for the new pack.  (requires -a)
+    --window <n>       Number of objects to consider as delta bases.  (default: 10)
+    --depth <n>        Maximum delta chain length.  (default: 50)
+    --threads <n>      Number of processes used for the delta search.  (default: cpu count)
+    -h, --help         Show this message and exit.
+
+Objects are read and delta-searched in batches of about 64 MiB, in order of
+type and size, so memory stays bounded however large the repository is.
+''')
+
+        obj = cls()
+        args: list[str] = []
+
+        while args_:
+            arg = args_.pop(0)
+            if arg == '-a':
+                obj.all = True
+            elif arg == '-d':
+                obj.prune = True
+            elif arg in ('-b', '--write-bitmap-index'):
+                obj.write_bitmap = True
+            elif arg == '--window':
+                obj.window = int(args_.pop(0))
+            elif arg == '--depth':
+                obj.depth = int(args_.pop(0))
+            elif arg == '--threads':
+                obj.threads = int(args_.pop(0))
+            elif arg in ('-h', '--help'):
+                help()
+                exit(0)
+            elif arg.startswith('-'):
+                raise Exception(f'Unknown option: {arg}')
+            else:
+                args.append(arg)
+
+        if len(args) != 0:
+            raise Exception(f'Unknown arguments: {args}')
+        if obj.write_bitmap and not obj.all:
+            raise Exception('Bitmaps can only be written for a pack of everything (-a)')
+
+        return obj
+
+
+def verify_pack(idx_path: pathlib.Path, shas: list[str]) -> None:
+    packed = pack.Pack(idx_path)
+    cache = pack.DeltaBaseCache()
+
+    try:
+        if packed.index.count != len(shas):
+            raise Exception(f'{packed.path} has {packed.index.count} objects, expected {len(shas)}')
+
+        offsets: list[tuple[int, str]] = []
+        for sha in shas:
+            offset = packed.offset_of(bytes.fromhex(sha))
+            if offset is None:
+                raise Exception(f'Object {sha} is missing from {packed.path}')
+            offsets.append((offset, sha))
+
+        # in pack order, so delta bases are still cached when read again
+        for offset, sha in sorted(offsets):
+            packed_type, packed_data = packed.read_at(offset, cache=cache)
+            raw = f'{packed_type.name.lower()} {len(packed_data)}\x00'.encode() + packed_data
+            if hashlib.sha1(raw).hexdigest() != sha:
+                raise Exception(f'Object {sha} is corrupt in {packed.path}')
+    finally:
+        packed.close()
+
+
+def sort_objects(gitdir: pathlib.Path, shas: list[str]) -> list[tuple[str, int]]:
+    # (sha, size) by type and descending size, the order of the delta
+    # search, from the object headers only
+    headers = [(sha, *git_object.read_header(gitdir, sha)) for sha in shas]
+    headers.sort(key=lambda elm: (pack.TYPE_NUMS[elm[1]], -elm[2]))
+
+    return [(sha, size) for sha, _type, size in headers]
+
+
+def read_batches(gitdir: pathlib.Path, objects: list[tuple[str, int]]) -> Iterator[list[tuple[str, types.GitObjectTypeEnum, bytes]]]:
+    # the objects in order, in lists of about BATCH_SIZE bytes
+    start = 0
+    while start < len(objects):
+        end = start + 1
+        size = objects[start][1]
+        while end < len(objects) and size + objects[end][1] <= BATCH_SIZE:
+            size += objects[end][1]
+            end += 1
+
+        shas = [sha for sha, _ in objects[start:end]]
+        found = {sha: (type_, data) for sha, type_, data in git_object.read_many(gitdir, shas)}
+        yield [(sha, *found.pop(sha)) for sha in shas]
+        start = end
+
+
+def prune_loose(gitdir: pathlib.Path, shas: list[str]) -> None:
+    for sha in shas:
+        (gitdir / 'objects' / sha[:2] / sha[2:]).unlink(missing_ok=True)
+
+    for dirname in sorted({sha[:2] for sha in shas}):
+        try:
+            (gitdir / 'objects' / dirname).rmdir()
+        except OSError:
+            pass
+
+
+def prune_packs(packs: list[pack.Pack], keep: pathlib.Path) -> None:
+    for old in packs:
+        if old.index.path == keep:
+            continue
+        for suffix in ('.pack', '.rev', '.bitmap', '.idx'):
+            old.path.with_suffix(suffix).unlink(missing_ok=True)
+
+
+def bitmap_tips(repo: repository.Repository) -> list[str]:
+    # the commits that refs (and HEAD) point to, through tags
+    head = repo.refs.resolve('HEAD')
+    shas = [sha for _, sha in refs.iter_refs(repo.gitdir)] + ([head] if head else [])
+
+    tips: list[str] = []
+    for sha in dict.fromkeys(shas):
+        obj = repo.read_object(sha)
+        while isinstance(obj, types.GitObjectTag):
+            sha = obj.object
+            obj = repo.read_object(sha)
+        if isinstance(obj, types.GitObjectCommit) and sha not in tips:
+            tips.append(sha)
+
+    return tips
+
+
+def main_repack(args_: list[str]) -> None:
+    args = Argument.parse_args(args_)
+
+    repo = repository.discover()
+    gitdir = repo.gitdir
+
+    loose = list(git_object.loose_shas(gitdir))
+    old_packs = pack.packs(gitdir) if args.all else []
+    if args.all:
+        packed = (old.index.sha_at(pos).hex() for old in old_packs for pos in range(old.index.count))
+        unpacked = list(dict.fromkeys([*packed, *loose]))
+    else:
+        unpacked = [sha for sha in loose if not pack.find(gitdir, bytes.fromhex(sha))]
+
+    objects = sort_objects(gitdir, unpacked)
+    deltas = 0
+
+    idx_path: Optional[pathlib.Path] = None
+    with pack.PackWriter(gitdir) as writer:
+        for batch in read_batches(gitdir, objects):
+            found = delta.find_deltas(
+                [(type_, data) for _sha, type_, data in batch],
+                args.window,
+                args.depth,
+                args.threads or os.cpu_count() or 1,
+            )
+            for (sha, type_, data), base in zip(batch, found):
+                if base:
+                    writer.add_delta(sha, batch[base[0]][0], base[1])
+                    deltas += 1
+                else:
+                    writer.add(sha, type_, data)
+
+        idx_path = writer.finish()
+
+    if idx_path:
+        verify_pack(idx_path, [sha for sha, _ in objects])
+        print(f'Packed {len(objects)} objects ({deltas} deltas) into {idx_path.with_suffix(".pack").name}')
+    else:
+        print('Nothing new to pack.')
+
+    if idx_path and args.write_bitmap:
+        bitmap_path = bitmap.write(repo, pack.Pack(idx_path), bitmap_tips(repo))
+        print(f'Wrote {bitmap_path.name}')
+
+    if args.prune:
+        prune_loose(gitdir, loose)
+        if idx_path:
+            prune_packs(old_packs, idx_path)
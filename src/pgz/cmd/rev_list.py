@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import sys
+
+import pydantic
+
+from .. import bitmap
+from .. import refs
+from .. import repository
+from .. import revparse
+from .. import revwalk
+from .. import types
+
+
+class Argument(pydantic.BaseModel):
+    revisions: list[str] = []
+    all: bool = False
+    objects: bool = False
+    count: bool = False
+    use_bitmap_index: bool = False
+
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+rev-list: List the commits (and objects) reachable from the given revisions.
+
+Usage: pgz rev-list [options...] <revision range>...
+
+Arguments:
+    <revision range>    Specify the revision range.  (<rev>, ^<rev>, <rev>..<rev>, <rev>...<rev>)
+
+Options:
+    --all               Start from every ref and HEAD.
+    --objects           Also list the tags, trees and blobs, with their paths.
+    --count             Print only the number of commits (objects with --objects).
+                        Answered from the pack bitmap when there is one.
+    --use-bitmap-index  List from the pack bitmap, by type in pack order and without paths.
+    -h, --help          Show this message and exit.
+''')
+
+        obj = cls()
+        args: list[str] = []
+
+        while args_:
+            arg = args_.pop(0)
+            if arg == '--all':
+                obj.all = True
+            elif arg == '--objects':
+                obj.objects = True
+            elif arg == '--count':
+                obj.count = True
+            elif arg == '--use-bitmap-index':
+                obj.use_bitmap_index = True
+            elif arg in ('-h', '--help'):
+                help()
+                exit(0)
+            elif arg.startswith('-'):
+                raise Exception(f'Unknown option: {arg}')
+            else:
+                args.append(arg)
+
+        if not args and not obj.all:
+            raise Exception('No revisions given')
+        obj.revisions = args
+
+        return obj
+
+
+def main_rev_list(args_: list[str]) -> None:
+    args = Argument.parse_args(args_)
+
+    repo = repository.discover()
+    gitdir = repo.gitdir
+
+    include, exclude = revwalk.resolve_revisions(gitdir, args.revisions, revparse.resolve)
+    if args.all:
+        head = repo.refs.resolve('HEAD')
+        include.extend(sha for _, sha in refs.iter_refs(gitdir))
+        include.extend([head] if head else [])
+
+    out = sys.stdout
+    bitmaps = bitmap.load(gitdir) if args.count or args.use_bitmap_index else None
+
+    if bitmaps:
+        # reachable from `include` AND NOT reachable from `exclude`
+        found = bitmaps.reachable(repo, include) & ~bitmaps.reachable(repo, exclude)
+        if not args.objects:
+            found = bitmaps.of_type(repo, found, types.GitObjectTypeEnum.COMMIT)
+
+        if args.count:
+            out.write(f'{found.bit_count()}\n')
+            return
+
+        for type_ in bitmap.TYPE_ORDER:
+            for sha in bitmaps.shas(bitmaps.of_type(repo, found, type_)):
+                out.write(f'{sha}\n')
+        return
+
+    count = 0
+    for sha, name in revwalk.walk_objects(gitdir, include, exclude, args.objects):
+        if args.count:
+            count += 1
+        elif name is None:
+            out.write(f'{sha}\n')
+        else:
+            out.write(f'{sha} {name}\n')
+
+    if args.count:
+        out.write(f'{count}\n')
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import sys
+from typing import Optional
+
+import pydantic
+
+from .. import index
+from .. import repository
+from .. import revparse
+from .. import status
+from .. import types
+
+
+class Argument(pydantic.BaseModel):
+    untracked: str = 'normal'
+    threads: Optional[int] = None
+
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+status: Show the working tree status.
+
+Usage: pgz status [options...]
+
+Each changed path is shown as `XY <path>`, where X is the state of the index
+against HEAD and Y the state of the working tree against the index
+(A: added, M: modified, D: deleted, T: type changed, U: unmerged).
+Untracked paths are shown as `?? <path>`.
+
+Options:
+    -s, --short, --porcelain
+                  Give the output in the short format.  (the only format)
+    -u<mode>, --untracked-files=<mode>
+                  Show untracked files.  (no, normal, all) (default: normal)
+    --threads <n>
+                  Number of threads used to hash modified files.  (default: cpu count)
+    -h, --help    Show this message and exit.
+''')
+
+        obj = cls()
+        args: list[str] = []
+
+        while args_:
+            arg = args_.pop(0)
+            if arg in ('-s', '--short', '--porcelain'):
+                pass
+            elif arg.startswith('-u') or arg.startswith('--untracked-files'):
+                mode = arg[2:] if arg.startswith('-u') else arg.partition('=')[2]
+                if mode and mode not in status.UNTRACKED_MODES:
+                    raise Exception(f'Invalid untracked files mode: {mode}')
+                obj.untracked = mode or 'all'
+            elif arg == '--threads':
+                obj.threads = int(args_.pop(0))
+            elif arg in ('-h', '--help'):
+                help()
+                exit(0)
+            elif arg.startswith('-'):
+                raise Exception(f'Unknown option: {arg}')
+            else:
+                args.append(arg)
+
+        if len(args) != 0:
+            raise Exception(f'Unknown arguments: {args}')
+
+        return obj
+
+
+def main_status(args_: list[str]) -> None:
+    args = Argument.parse_args(args_)
+
+    repo = repository.discover()
+    idx = index.read(index.index_path(repo.gitdir))
+
+    head = repo.refs.resolve('HEAD')
+    tree = revparse.peel(repo.gitdir, head, types.GitObjectTypeEnum.TREE) if head else None
+
+    changes, untracked, refreshed = status.status(repo, idx, tree, args.untracked, args.threads)
+
+    out = sys.stdout
+    for code, path in changes:
+        out.write(f'{code} {path}\n')
+    for path in untracked:
+        out.write(f'?? {path}\n')
+
+    if refreshed:
+        # like git, save the refreshed stat data when nobody else holds the
+        # index lock, so the same files are not hashed again next time
+        try:
+            index.write(idx)
+        except Exception:
+            pass
@@ -1,11 +1,10 @@
 from __future__ import annotations
 
-import pathlib
 from typing import Optional
 
 import pydantic
 
-from .. import lib
+from .. import repository
 
 
 class Argument(pydantic.BaseModel):
@@ -60,13 +59,19 @@ def main_symbolic_ref(args_: list[str]) -> None:
     if not args.name:
         raise Exception('Invalid arguments')
 
-    gitdir = lib.locate_dominating_file(pathlib.Path.cwd(), '.git')
-    if not gitdir:
-        raise Exception('Not a git repository')
+    store = repository.discover().refs
 
     if args.ref:
-        with lib.get_or_create_repo_file(gitdir, args.name).open('w') as f:
-            f.write(f'ref: {args.ref}\n')
+        if not args.ref.startswith('refs/'):
+            raise Exception(f'Refusing to point {args.name} outside of refs/: {args.ref}')
+
+        transaction = store.transaction()
+        transaction.update(args.name, f'ref: {args.ref}', deref=False)
+        transaction.commit()
         return
 
-    print(lib.get_or_create_repo_file(gitdir, args.name).read_text().strip()[5:])
+    value = store.read_raw(args.name)
+    if not value or not value.startswith('ref: '):
+        raise Exception(f'Not a symbolic ref: {args.name}')
+
+    print(value[5:])
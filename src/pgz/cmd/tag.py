@@ -1,13 +1,12 @@
 from __future__ import annotations
 
-import pathlib
 from typing import Optional
 
 import pydantic
 
-from .. import lib
+from .. import revparse
 from .. import types
-from .. import git_object
+from .. import repository
 
 
 class Argument(pydantic.BaseModel):
@@ -16,6 +15,7 @@ class Argument(pydantic.BaseModel):
 
     annotate: bool = False
     message: Optional[str] = None
+    force: bool = False
 
     @classmethod
     def parse_args(cls, args_: list[str]) -> Argument:
@@ -24,14 +24,16 @@ class Argument(pydantic.BaseModel):
 tag: Create, list, delete tag object
 
 Usage: pgz tag [options...] <tagname> [<object>]
+       pgz tag
 
 Arguments:
-    <tagname>  Specify the tag name.
-    <object>   Specify the object.
+    <tagname>  Specify the tag name.  (list tags when omitted)
+    <object>   Specify the object.  (default: HEAD)
 
 Options:
     -a, --annotate  Create an annotated tag object.
     -m <message>    Specify the tag message.
+    -f, --force     Replace an existing tag.
     -h, --help      Show this message and exit.
 ''')
 
@@ -42,9 +44,11 @@ Options:
             arg = args_.pop(0)
             if arg in ('-a', '--annotate'):
                 obj.annotate = True
-            if arg == '-m':
+            elif arg == '-m':
                 obj.message = args_.pop(0)
                 obj.annotate = True
+            elif arg in ('-f', '--force'):
+                obj.force = True
             elif arg in ('-h', '--help'):
                 help()
                 exit(0)
@@ -64,34 +68,39 @@ Options:
 def main_tag(args_: list[str]) -> None:
     args = Argument.parse_args(args_)
 
-    gitdir = lib.locate_dominating_file(pathlib.Path.cwd(), '.git')
-    if not gitdir:
-        raise Exception('Not a git repository')
+    repo = repository.discover()
+    gitdir = repo.gitdir
+
+    store = repo.refs
 
     if not args.tagname:
-        raise Exception('Invalid arguments')
+        for name in store.refs():
+            if name.startswith('refs/tags/'):
+                print(name[len('refs/tags/'):])
+        return
 
-    if not args.obj:
-        raise Exception('Invalid arguments')
+    target = revparse.resolve(gitdir, args.obj or 'HEAD')
+    sha = target
 
     if args.annotate:
         if not args.message:
             raise Exception('Invalid arguments')
 
+        type_, _ = repo.read_header(target)
         obj = types.GitObjectTag(
             type_=types.GitObjectTypeEnum.TAG,
-            object=args.obj,
-            type='commit',
+            object=target,
+            type=type_.name.lower(),
             tag=args.tagname,
             tagger=b'',
             message=args.message.encode(),
         )
 
-        sha, _ = git_object.write_(obj, gitdir)
-
-        filepath = lib.get_or_create_repo_file(gitdir, f'refs/tags/{args.tagname}')
-        filepath.write_text(f'{sha}\n')
-        return
+        sha = repo.write_object(obj)
 
-    filepath = lib.get_or_create_repo_file(gitdir, f'refs/tags/{args.tagname}')
-    filepath.write_text(f'{args.obj}\n')
+    transaction = store.transaction()
+    if args.force:
+        transaction.update(f'refs/tags/{args.tagname}', sha)
+    else:
+        transaction.create(f'refs/tags/{args.tagname}', sha)
+    transaction.commit()
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import sys
+
+import pydantic
+
+from .. import repository
+from .. import unpack_objects
+
+
+class Argument(pydantic.BaseModel):
+    quiet: bool = False
+
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+unpack-objects: Unpack objects from a packfile on standard input.
+
+Usage: pgz unpack-objects [options...] < <pack>
+
+Every object of the pack is written as a loose object, unless the repository
+already has it.  The pack is read as a stream, so it may come from a pipe.
+
+Options:
+    -q            Do not print statistics.
+    -h, --help    Show this message and exit.
+''')
+
+        obj = cls()
+        args: list[str] = []
+
+        while args_:
+            arg = args_.pop(0)
+            if arg == '-q':
+                obj.quiet = True
+            elif arg in ('-h', '--help'):
+                help()
+                exit(0)
+            elif arg.startswith('-'):
+                raise Exception(f'Unknown option: {arg}')
+            else:
+                args.append(arg)
+
+        if len(args) != 0:
+            raise Exception(f'Unknown arguments: {args}')
+
+        return obj
+
+
+def main_unpack_objects(args_: list[str]) -> None:
+    args = Argument.parse_args(args_)
+
+    repo = repository.discover()
+    unpacker = unpack_objects.Unpacker(repo, sys.stdin.buffer)
+    unpacker.run()
+
+    if not args.quiet:
+        counts = ', '.join(f'{count} {type_.name.lower()}s' for type_, count in sorted(unpacker.counts.items(), key=lambda elm: elm[0].value))
+        print(f'Unpacked {sum(unpacker.counts.values())} objects ({counts or "none"}, {unpacker.deltas} from deltas), {unpacker.written} written', file=sys.stderr)
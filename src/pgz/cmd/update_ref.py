@@ -1,16 +1,24 @@
 from __future__ import annotations
 
 import pathlib
-from typing import Optional
+import sys
+from typing import Iterator, Optional
 
 import pydantic
 
-from .. import lib
+from .. import refs
+from .. import revparse
+from .. import repository
 
 
 class Argument(pydantic.BaseModel):
     ref: Optional[str] = None
     newvalue: Optional[str] = None
+    oldvalue: Optional[str] = None
+    delete: bool = False
+    no_deref: bool = False
+    stdin: bool = False
+    nul_terminated: bool = False
 
     @classmethod
     def parse_args(cls, args_: list[str]) -> Argument:
@@ -18,13 +26,26 @@ class Argument(pydantic.BaseModel):
             print('''\
 update-ref: Update the object name stored in a ref safely.
 
-Usage: pgz update-ref [options...] <ref> <newvalue>
+Usage: pgz update-ref [options...] <ref> <newvalue> [<oldvalue>]
+       pgz update-ref [options...] -d <ref> [<oldvalue>]
+       pgz update-ref [options...] --stdin [-z]
 
 Arguments:
     <ref>       Specify the ref.
     <newvalue>  Specify the new value.
+    <oldvalue>  Update only if the ref currently has this value.  (40 zeros: only if it does not exist)
 
 Options:
+    -d            Delete the ref.
+    --no-deref    Update the ref itself rather than the ref it points to.
+    --stdin       Read commands from stdin and apply them as one transaction:
+                      update SP <ref> SP <newvalue> [SP <oldvalue>] LF
+                      create SP <ref> SP <newvalue> LF
+                      delete SP <ref> [SP <oldvalue>] LF
+                      verify SP <ref> [SP <oldvalue>] LF
+                      option SP no-deref LF
+    -z            With --stdin, values are NUL-terminated:
+                      update SP <ref> NUL <newvalue> NUL [<oldvalue>] NUL
     -h, --help    Show this message and exit.
 ''')
 
@@ -36,6 +57,14 @@ Options:
             if arg == '--':
                 args.extend(args_)
                 break
+            elif arg == '-d':
+                obj.delete = True
+            elif arg == '--no-deref':
+                obj.no_deref = True
+            elif arg == '--stdin':
+                obj.stdin = True
+            elif arg == '-z':
+                obj.nul_terminated = True
             elif arg in ('-h', '--help'):
                 help()
                 exit(0)
@@ -44,8 +73,15 @@ Options:
             else:
                 args.append(arg)
 
-        if len(args) == 2:
-            obj.ref, obj.newvalue = args
+        if obj.stdin:
+            if args or obj.delete:
+                raise Exception('--stdin takes no arguments')
+        elif obj.nul_terminated:
+            raise Exception('-z requires --stdin')
+        elif obj.delete and len(args) in (1, 2):
+            obj.ref, obj.oldvalue, *_ = args + [None]
+        elif not obj.delete and len(args) in (2, 3):
+            obj.ref, obj.newvalue, obj.oldvalue, *_ = args + [None]
         else:
             raise Exception('Invalid arguments')
 
@@ -55,12 +91,126 @@ Options:
 def main_update_ref(args_: list[str]) -> None:
     args = Argument.parse_args(args_)
 
-    if not args.ref or not args.newvalue:
+    repo = repository.discover()
+    gitdir = repo.gitdir
+
+    if args.stdin:
+        main_stdin(repo, args)
+        return
+
+    if not args.ref or not (args.delete or args.newvalue):
         raise Exception('Invalid arguments')
 
-    gitdir = lib.locate_dominating_file(pathlib.Path.cwd(), '.git')
-    if not gitdir:
-        raise Exception('Not a git repository')
+    oldvalue = resolve_value(gitdir, args.oldvalue)
+
+    transaction = repo.refs.transaction()
+    if args.delete:
+        transaction.delete(args.ref, oldvalue, deref=not args.no_deref)
+    else:
+        assert args.newvalue
+        transaction.update(args.ref, revparse.resolve(gitdir, args.newvalue), oldvalue, deref=not args.no_deref)
+    transaction.commit()
+
+
+def resolve_value(gitdir: pathlib.Path, value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    if value in ('', refs.ZERO_SHA):
+        return refs.ZERO_SHA
+
+    return revparse.resolve(gitdir, value)
+
+
+# command -> (required values, optional values) after the ref name
+STDIN_COMMANDS = {
+    'update': (1, 1),
+    'create': (1, 0),
+    'delete': (0, 1),
+    'verify': (0, 1),
+}
+
+
+def read_commands(data: bytes, nul_terminated: bool) -> Iterator[tuple[str, str, list[Optional[str]]]]:
+    # yields (command, ref, values); a missing optional value is None
+    if not nul_terminated:
+        for lineno, line in enumerate(data.decode().splitlines(), 1):
+            if not line:
+                continue
+            command, _, rest = line.partition(' ')
+            fields = rest.split(' ') if rest else []
+            if command == 'option':
+                yield command, rest, []
+                continue
+            if command not in STDIN_COMMANDS or not fields:
+                raise Exception(f'Invalid command on line {lineno}: {line}')
+
+            required, optional = STDIN_COMMANDS[command]
+            values: list[Optional[str]] = list(fields[1:])
+            if not required <= len(values) <= required + optional:
+                raise Exception(f'Wrong number of values on line {lineno}: {line}')
+            yield command, fields[0], values + [None] * (required + optional - len(values))
+        return
+
+    # -z: `<command> SP <ref>` and every value are NUL-terminated; an empty
+    # value stands for a missing one
+    tokens = data.split(b'\x00')
+    if tokens and tokens[-1] == b'':
+        tokens.pop()
+    tokens.reverse()
+
+    while tokens:
+        head = tokens.pop().decode()
+        command, _, name = head.partition(' ')
+        if command == 'option':
+            yield command, name, []
+            continue
+        if command not in STDIN_COMMANDS or not name:
+            raise Exception(f'Invalid command: {head}')
+
+        required, optional = STDIN_COMMANDS[command]
+        if len(tokens) < required + optional:
+            raise Exception(f'Missing values for: {head}')
+        yield command, name, [tokens.pop().decode() or None for _ in range(required + optional)]
+
+
+def main_stdin(repo: repository.Repository, args: Argument) -> None:
+    # every command is queued into a single transaction, so the locks are
+    # taken once and either all refs change or none do
+    gitdir = repo.gitdir
+    transaction = repo.refs.transaction()
+    no_deref_next = False
+
+    for command, name, values in read_commands(sys.stdin.buffer.read(), args.nul_terminated):
+        if command == 'option':
+            if name != 'no-deref':
+                raise Exception(f'Unknown option: {name}')
+            no_deref_next = True
+            continue
+
+        deref = not (args.no_deref or no_deref_next)
+        no_deref_next = False
+
+        if command == 'update':
+            newvalue = resolve_value(gitdir, values[0])
+            oldvalue = resolve_value(gitdir, values[1])
+            if newvalue in (None, refs.ZERO_SHA):
+                transaction.delete(name, oldvalue, deref=deref)
+            else:
+                assert newvalue
+                transaction.update(name, newvalue, oldvalue, deref=deref)
+        elif command == 'create':
+            newvalue = resolve_value(gitdir, values[0])
+            if newvalue in (None, refs.ZERO_SHA):
+                raise Exception(f'create {name}: zero new value')
+            assert newvalue
+            transaction.create(name, newvalue, deref=deref)
+        elif command == 'delete':
+            oldvalue = resolve_value(gitdir, values[0])
+            if oldvalue == refs.ZERO_SHA:
+                raise Exception(f'delete {name}: zero old value')
+            transaction.delete(name, oldvalue, deref=deref)
+        else:
+            # a missing old value means the ref must not exist
+            transaction.verify(name, resolve_value(gitdir, values[0]) or refs.ZERO_SHA, deref=deref)
 
-    with lib.get_or_create_repo_file(gitdir, args.ref).open('w') as f:
-        f.write(args.newvalue + '\n')
+    transaction.commit()
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import pydantic
+
+from .. import index
+from .. import repository
+
+
+class Argument(pydantic.BaseModel):
+    @classmethod
+    def parse_args(cls, args_: list[str]) -> Argument:
+        def help() -> None:
+            print('''\
+write-tree: Create a tree object from the current index.
+
+Usage: pgz write-tree [options...]
+
+Options:
+    -h, --help    Show this message and exit.
+''')
+
+        obj = cls()
+        args: list[str] = []
+
+        while args_:
+            arg = args_.pop(0)
+            if arg in ('-h', '--help'):
+                help()
+                exit(0)
+            elif arg.startswith('-'):
+                raise Exception(f'Unknown option: {arg}')
+            else:
+                args.append(arg)
+
+        if len(args) != 0:
+            raise Exception(f'Unknown arguments: {args}')
+
+        return obj
+
+
+def main_write_tree(args_: list[str]) -> None:
+    Argument.parse_args(args_)
+
+    repo = repository.discover()
+    idx = index.read(index.index_path(repo.gitdir))
+
+    with repo.writer() as writer:
+        sha = index.write_tree(idx, writer)
+
+    # keep the rebuilt cache tree so that the next write-tree (and status)
+    # can skip unchanged directories; skipped when the index is locked
+    try:
+        index.write(idx)
+    except Exception:
+        pass
+
+    print(sha)
@@ -0,0 +1,276 @@
+import hashlib
+import os
+import pathlib
+import struct
+import tempfile
+from typing import Iterable, Optional
+
+from . import lib
+from . import pack
+from . import repository
+from . import types
+
+
+SIGNATURE = b'CGPH'
+CHUNK_OID_FANOUT = b'OIDF'
+CHUNK_OID_LOOKUP = b'OIDL'
+CHUNK_COMMIT_DATA = b'CDAT'
+CHUNK_EXTRA_EDGES = b'EDGE'
+
+PARENT_NONE = 0x70000000
+PARENT_OCTOPUS = 0x80000000
+EDGE_LAST = 0x80000000
+GENERATION_MAX = 0x3fffffff
+COMMIT_DATA_SIZE = 36
+
+# tree, parents, commit time, generation
+CommitData = tuple[str, list[str], int, int]
+
+
+class CommitGraph:
+    __slots__ = ('path', 'mm', 'chunks', 'fanout', 'count', 'oid_start', 'data_start', 'edge_start')
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.mm = pack.mmap_file(path)
+
+        signature, version, hash_version, num_chunks, _num_bases = struct.unpack_from('>4sBBBB', self.mm, 0)
+        if signature != SIGNATURE or version != 1 or hash_version != 1:
+            raise Exception(f'Unsupported commit-graph: {path}')
+
+        self.chunks: dict[bytes, tuple[int, int]] = {}
+        for i in range(num_chunks):
+            chunk_id, start = struct.unpack_from('>4sQ', self.mm, 8 + 12 * i)
+            _, end = struct.unpack_from('>4sQ', self.mm, 8 + 12 * (i + 1))
+            self.chunks[chunk_id] = (start, end)
+
+        for chunk_id in (CHUNK_OID_FANOUT, CHUNK_OID_LOOKUP, CHUNK_COMMIT_DATA):
+            if chunk_id not in self.chunks:
+                raise Exception(f'Missing {chunk_id.decode()} chunk in {path}')
+
+        self.fanout = struct.unpack_from('>256I', self.mm, self.chunks[CHUNK_OID_FANOUT][0])
+        self.count = self.fanout[255]
+        self.oid_start = self.chunks[CHUNK_OID_LOOKUP][0]
+        self.data_start = self.chunks[CHUNK_COMMIT_DATA][0]
+        self.edge_start = self.chunks.get(CHUNK_EXTRA_EDGES, (0, 0))[0]
+
+    def chunk(self, chunk_id: bytes) -> Optional[memoryview]:
+        if chunk_id not in self.chunks:
+            return None
+
+        start, end = self.chunks[chunk_id]
+
+        return memoryview(self.mm)[start:end]
+
+    def binsha_at(self, pos: int) -> bytes:
+        start = self.oid_start + 20 * pos
+        return self.mm[start:start + 20]
+
+    def sha_at(self, pos: int) -> str:
+        return self.binsha_at(pos).hex()
+
+    def find(self, sha: bytes) -> Optional[int]:
+        lo = self.fanout[sha[0] - 1] if sha[0] else 0
+        hi = self.fanout[sha[0]]
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_sha = self.binsha_at(mid)
+            if mid_sha < sha:
+                lo = mid + 1
+            elif mid_sha > sha:
+                hi = mid
+            else:
+                return mid
+
+        return None
+
+    def tree(self, pos: int) -> str:
+        start = self.data_start + COMMIT_DATA_SIZE * pos
+        return self.mm[start:start + 20].hex()
+
+    def parent_positions(self, pos: int) -> list[int]:
+        parent1, parent2 = struct.unpack_from('>II', self.mm, self.data_start + COMMIT_DATA_SIZE * pos + 20)
+        if parent1 == PARENT_NONE:
+            return []
+        if parent2 == PARENT_NONE:
+            return [parent1]
+        if not parent2 & PARENT_OCTOPUS:
+            return [parent1, parent2]
+
+        res = [parent1]
+        edge = parent2 & ~PARENT_OCTOPUS
+        while True:
+            value, = struct.unpack_from('>I', self.mm, self.edge_start + 4 * edge)
+            res.append(value & ~EDGE_LAST)
+            if value & EDGE_LAST:
+                return res
+            edge += 1
+
+    def parents(self, pos: int) -> list[str]:
+        return [self.sha_at(parent) for parent in self.parent_positions(pos)]
+
+    def generation_and_time(self, pos: int) -> tuple[int, int]:
+        high, low = struct.unpack_from('>II', self.mm, self.data_start + COMMIT_DATA_SIZE * pos + 28)
+        return high >> 2, ((high & 0x3) << 32) | low
+
+    def generation(self, pos: int) -> int:
+        return self.generation_and_time(pos)[0]
+
+    def commit_time(self, pos: int) -> int:
+        return self.generation_and_time(pos)[1]
+
+    def commit_data(self, pos: int) -> CommitData:
+        generation, commit_time = self.generation_and_time(pos)
+        return self.tree(pos), self.parents(pos), commit_time, generation
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+_graphs: dict[pathlib.Path, tuple[int, CommitGraph]] = {}
+
+
+def graph_path(gitdir: pathlib.Path) -> pathlib.Path:
+    return gitdir / 'objects' / 'info' / 'commit-graph'
+
+
+def load(gitdir: pathlib.Path) -> Optional[CommitGraph]:
+    path = graph_path(gitdir)
+
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cached = _graphs.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    graph = CommitGraph(path)
+    _graphs[path] = (mtime, graph)
+
+    return graph
+
+
+def collect(
+    gitdir: pathlib.Path,
+    tips: Iterable[str],
+    existing: Optional[CommitGraph] = None,
+) -> dict[str, CommitData]:
+    # Every commit of an existing graph is carried over as-is; since a graph
+    # is closed under parents, the walk from `tips` stops at any commit it
+    # already contains and only new commits are read from the object store.
+    commits: dict[str, CommitData] = {}
+    if existing:
+        for pos in range(existing.count):
+            commits[existing.sha_at(pos)] = existing.commit_data(pos)
+
+    new_commits: list[str] = []
+    stack = [sha for sha in tips if sha not in commits]
+    while stack:
+        sha = stack.pop()
+        if sha in commits:
+            continue
+
+        obj = repository.load(gitdir).read_object(sha)
+        if isinstance(obj, types.GitObjectTag):
+            stack.append(obj.object)
+            continue
+        if not isinstance(obj, types.GitObjectCommit):
+            continue
+
+        commits[sha] = (obj.tree, obj.parents, obj.commit_time, 0)
+        new_commits.append(sha)
+        stack.extend(parent for parent in obj.parents if parent not in commits)
+
+    # generation (topological level) = 1 + max(parent generations)
+    for sha in new_commits:
+        if commits[sha][3]:
+            continue
+
+        pending = [sha]
+        while pending:
+            current = pending[-1]
+            tree, parents, commit_time, _ = commits[current]
+            missing = [parent for parent in parents if not commits[parent][3]]
+            if missing:
+                pending.extend(missing)
+                continue
+
+            generation = 1 + max((commits[parent][3] for parent in parents), default=0)
+            commits[current] = (tree, parents, commit_time, min(generation, GENERATION_MAX))
+            pending.pop()
+
+    return commits
+
+
+def write(
+    gitdir: pathlib.Path,
+    commits: dict[str, CommitData],
+    extra_chunks: Optional[list[tuple[bytes, bytes]]] = None,
+) -> pathlib.Path:
+    shas = sorted(commits)
+    positions = {sha: pos for pos, sha in enumerate(shas)}
+
+    fanout = [0] * 256
+    for sha in shas:
+        fanout[int(sha[:2], 16)] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+
+    data: list[bytes] = []
+    edges: list[int] = []
+    for sha in shas:
+        tree, parents, commit_time, generation = commits[sha]
+        parent_positions = [positions[parent] for parent in parents]
+
+        parent1 = parent_positions[0] if parent_positions else PARENT_NONE
+        if len(parent_positions) < 2:
+            parent2 = PARENT_NONE
+        elif len(parent_positions) == 2:
+            parent2 = parent_positions[1]
+        else:
+            parent2 = PARENT_OCTOPUS | len(edges)
+            edges.extend(parent_positions[1:])
+            edges[-1] |= EDGE_LAST
+
+        data.append(struct.pack(
+            '>20sIIII',
+            bytes.fromhex(tree),
+            parent1,
+            parent2,
+            (generation << 2) | ((commit_time >> 32) & 0x3),
+            commit_time & 0xffffffff,
+        ))
+
+    chunks = [
+        (CHUNK_OID_FANOUT, struct.pack('>256I', *fanout)),
+        (CHUNK_OID_LOOKUP, b''.join(bytes.fromhex(sha) for sha in shas)),
+        (CHUNK_COMMIT_DATA, b''.join(data)),
+    ]
+    if edges:
+        chunks.append((CHUNK_EXTRA_EDGES, struct.pack(f'>{len(edges)}I', *edges)))
+    chunks.extend(extra_chunks or [])
+
+    header = struct.pack('>4sBBBB', SIGNATURE, 1, 1, len(chunks), 0)
+    offset = len(header) + 12 * (len(chunks) + 1)
+    table = b''
+    for chunk_id, chunk in chunks:
+        table += struct.pack('>4sQ', chunk_id, offset)
+        offset += len(chunk)
+    table += struct.pack('>4sQ', b'\x00' * 4, offset)
+
+    path = graph_path(gitdir)
+    info_dir = lib.get_or_create_repo_dir(gitdir, 'objects/info')
+    checksum = hashlib.sha1()
+    with tempfile.NamedTemporaryFile(prefix='tmp_graph_', dir=info_dir, delete=False) as f:
+        for part in [header, table, *(chunk for _, chunk in chunks)]:
+            checksum.update(part)
+            f.write(part)
+        f.write(checksum.digest())
+
+    os.chmod(f.name, 0o444)
+    pathlib.Path(f.name).replace(path)
+
+    return path
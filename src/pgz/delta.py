@@ -0,0 +1,235 @@
+import concurrent.futures
+from typing import Optional
+
+from . import types
+
+
+BLOCK_SIZE = 16
+MAX_COPY_SIZE = 0x10000
+MAX_INSERT_SIZE = 0x7f
+
+
+def read_size(delta: bytes, pos: int) -> tuple[int, int]:
+    size = 0
+    shift = 0
+
+    while True:
+        c = delta[pos]
+        pos += 1
+        size |= (c & 0x7f) << shift
+        shift += 7
+        if not c & 0x80:
+            return size, pos
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    base_size, pos = read_size(delta, 0)
+    if base_size != len(base):
+        raise Exception('Malformed delta: base size mismatch')
+
+    result_size, pos = read_size(delta, pos)
+
+    base_view = memoryview(base)
+    res = bytearray()
+    delta_len = len(delta)
+
+    while pos < delta_len:
+        cmd = delta[pos]
+        pos += 1
+
+        if cmd & 0x80:
+            # copy from base: bits 0-3 select offset bytes, bits 4-6 size bytes
+            offset = 0
+            for i in range(4):
+                if cmd & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+
+            size = 0
+            for i in range(3):
+                if cmd & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+
+            if size == 0:
+                size = 0x10000
+
+            if offset + size > base_size:
+                raise Exception('Malformed delta: copy out of range')
+
+            res += base_view[offset:offset + size]
+
+        elif cmd:
+            # insert the next `cmd` literal bytes
+            res += delta[pos:pos + cmd]
+            pos += cmd
+
+        else:
+            raise Exception('Malformed delta: unexpected opcode 0')
+
+    if len(res) != result_size:
+        raise Exception('Malformed delta: result size mismatch')
+
+    return bytes(res)
+
+
+def encode_size(size: int) -> bytes:
+    res = bytearray()
+
+    while True:
+        c = size & 0x7f
+        size >>= 7
+        if size:
+            res.append(c | 0x80)
+        else:
+            res.append(c)
+            return bytes(res)
+
+
+def encode_insert(res: bytearray, data: bytes) -> None:
+    for pos in range(0, len(data), MAX_INSERT_SIZE):
+        chunk = data[pos:pos + MAX_INSERT_SIZE]
+        res.append(len(chunk))
+        res += chunk
+
+
+def encode_copy(res: bytearray, offset: int, size: int) -> None:
+    while size:
+        chunk = min(size, MAX_COPY_SIZE)
+        cmd = 0x80
+        args = bytearray()
+
+        for i in range(4):
+            c = (offset >> (8 * i)) & 0xff
+            if c:
+                cmd |= 1 << i
+                args.append(c)
+
+        # a 0x10000 copy is encoded with no size bytes at all
+        for i in range(3):
+            c = (chunk >> (8 * i)) & 0xff
+            if c:
+                cmd |= 0x10 << i
+                args.append(c)
+
+        res.append(cmd)
+        res += args
+        offset += chunk
+        size -= chunk
+
+
+def create_delta(base: bytes, target: bytes, max_size: Optional[int] = None) -> Optional[bytes]:
+    # greedy matcher over a hash of the base's aligned blocks.  Returns None
+    # as soon as the delta grows past `max_size`.
+    index: dict[bytes, int] = {}
+    for pos in range(len(base) - BLOCK_SIZE, -1, -BLOCK_SIZE):
+        index[base[pos:pos + BLOCK_SIZE]] = pos
+
+    res = bytearray(encode_size(len(base)) + encode_size(len(target)))
+    base_len = len(base)
+    target_len = len(target)
+    insert_start = 0
+    pos = 0
+
+    while pos <= target_len - BLOCK_SIZE:
+        offset = index.get(target[pos:pos + BLOCK_SIZE])
+        if offset is None:
+            pos += 1
+            continue
+
+        start = pos
+        while offset > 0 and start > insert_start and base[offset - 1] == target[start - 1]:
+            offset -= 1
+            start -= 1
+
+        end = pos + BLOCK_SIZE
+        base_end = offset + (end - start)
+        while (
+            end + BLOCK_SIZE <= target_len and base_end + BLOCK_SIZE <= base_len
+            and base[base_end:base_end + BLOCK_SIZE] == target[end:end + BLOCK_SIZE]
+        ):
+            end += BLOCK_SIZE
+            base_end += BLOCK_SIZE
+        while end < target_len and base_end < base_len and base[base_end] == target[end]:
+            end += 1
+            base_end += 1
+
+        encode_insert(res, target[insert_start:start])
+        encode_copy(res, offset, end - start)
+        pos = insert_start = end
+
+        if max_size is not None and len(res) > max_size:
+            return None
+
+    encode_insert(res, target[insert_start:])
+
+    if max_size is not None and len(res) > max_size:
+        return None
+
+    return bytes(res)
+
+
+def search_window(
+    objects: list[tuple[types.GitObjectTypeEnum, bytes]],
+    window: int,
+    max_depth: int,
+) -> list[Optional[tuple[int, bytes]]]:
+    # `objects` is expected to be sorted by type and descending size, so that
+    # every candidate base precedes its target.  Returns the chosen base index
+    # and delta for each object, or None to store it whole.
+    res: list[Optional[tuple[int, bytes]]] = [None] * len(objects)
+    depths = [0] * len(objects)
+
+    for i, (type_, data) in enumerate(objects):
+        best: Optional[tuple[int, bytes]] = None
+        max_size = len(data) // 2 - 20
+
+        for j in range(i - 1, max(i - window, 0) - 1, -1):
+            base_type, base = objects[j]
+            if base_type != type_:
+                break
+            if depths[j] >= max_depth or len(base) < len(data) // 32:
+                continue
+
+            limit = len(best[1]) - 1 if best else max_size
+            if limit <= 0:
+                break
+
+            delta_data = create_delta(base, data, limit)
+            if delta_data is not None:
+                best = (j, delta_data)
+
+        if best:
+            res[i] = best
+            depths[i] = depths[best[0]] + 1
+
+    return res
+
+
+def find_deltas(
+    objects: list[tuple[types.GitObjectTypeEnum, bytes]],
+    window: int,
+    max_depth: int,
+    jobs: int = 1,
+) -> list[Optional[tuple[int, bytes]]]:
+    # like git's threaded delta search, each worker owns a contiguous slice of
+    # the sorted list, so windows never span two workers.
+    if jobs <= 1 or len(objects) < 2 * window:
+        return search_window(objects, window, max_depth)
+
+    chunk_size = -(-len(objects) // jobs)
+    starts = range(0, len(objects), chunk_size)
+
+    res: list[Optional[tuple[int, bytes]]] = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(search_window, objects[start:start + chunk_size], window, max_depth)
+            for start in starts
+        ]
+        for start, future in zip(starts, futures):
+            res.extend(
+                (start + found[0], found[1]) if found else None
+                for found in future.result()
+            )
+
+    return res
@@ -0,0 +1,96 @@
+import pathlib
+from typing import Iterator, Optional
+
+from . import repository
+from . import types
+
+
+# status ('A', 'D' or 'M'), path, old entry, new entry
+Change = tuple[str, str, Optional[types.GitObjectTreeItem], Optional[types.GitObjectTreeItem]]
+
+
+def is_tree(item: types.GitObjectTreeItem) -> bool:
+    return item.mode.startswith('04')
+
+
+def sort_key(item: types.GitObjectTreeItem) -> str:
+    # git orders tree entries as if directory names had a trailing slash
+    return item.path + '/' if is_tree(item) else item.path
+
+
+def read_tree(gitdir: pathlib.Path, sha: Optional[str]) -> list[types.GitObjectTreeItem]:
+    if not sha:
+        return []
+
+    obj = repository.load(gitdir).read_object(sha)
+    if not isinstance(obj, types.GitObjectTree):
+        raise Exception(f'Not a tree: {sha}')
+
+    return obj.items
+
+
+def diff_trees(
+    gitdir: pathlib.Path,
+    old_tree: Optional[str],
+    new_tree: Optional[str],
+    recursive: bool = True,
+    prefix: str = '',
+) -> Iterator[Change]:
+    # merge-join over the two sorted entry lists; subtrees whose SHA is the
+    # same on both sides are skipped without being read.
+    if old_tree == new_tree:
+        return
+
+    old_items = read_tree(gitdir, old_tree)
+    new_items = read_tree(gitdir, new_tree)
+    i = j = 0
+
+    while i < len(old_items) or j < len(new_items):
+        old = old_items[i] if i < len(old_items) else None
+        new = new_items[j] if j < len(new_items) else None
+
+        if new is None or (old is not None and sort_key(old) < sort_key(new)):
+            new = None
+            i += 1
+        elif old is None or sort_key(new) < sort_key(old):
+            old = None
+            j += 1
+        else:
+            i += 1
+            j += 1
+            if old.sha == new.sha and old.mode == new.mode:
+                continue
+
+        item = old or new
+        assert item
+        path = prefix + item.path
+
+        if recursive and is_tree(item):
+            yield from diff_trees(
+                gitdir,
+                old.sha if old else None,
+                new.sha if new else None,
+                recursive,
+                path + '/',
+            )
+            continue
+
+        yield ('A' if old is None else 'D' if new is None else 'M'), path, old, new
+
+
+def changed_paths(gitdir: pathlib.Path, old_tree: Optional[str], new_tree: Optional[str]) -> Iterator[str]:
+    for _status, path, _old, _new in diff_trees(gitdir, old_tree, new_tree):
+        yield path
+
+
+def lookup_path(gitdir: pathlib.Path, tree: Optional[str], path: str) -> Optional[types.GitObjectTreeItem]:
+    # reads only the trees along `path`
+    *dirnames, basename = path.strip('/').split('/')
+
+    for dirname in dirnames:
+        entry = next((item for item in read_tree(gitdir, tree) if item.path == dirname and is_tree(item)), None)
+        if not entry:
+            return None
+        tree = entry.sha
+
+    return next((item for item in read_tree(gitdir, tree) if item.path == basename), None)
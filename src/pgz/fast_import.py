@@ -0,0 +1,616 @@
+import collections
+import pathlib
+import sys
+from typing import BinaryIO, Optional
+
+from . import git_object
+from . import object_names
+from . import pack
+from . import refs
+from . import repository
+from . import revparse
+from . import types
+
+
+MODE_TREE = '40000'
+# an empty tree is never stored as an entry; `M 040000` of it deletes
+EMPTY_TREE = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+# the short forms are accepted too, as by git
+MODES = {
+    '644': '100644',
+    '100644': '100644',
+    '755': '100755',
+    '100755': '100755',
+    '120000': '120000',
+    '160000': '160000',
+    '40000': MODE_TREE,
+    '040000': MODE_TREE,
+}
+
+FEATURES = ('date-format=raw', 'date-format=raw-permissive', 'done', 'force', 'relative-marks', 'no-relative-marks')
+
+C_ESCAPES = {
+    ord('a'): 0x07,
+    ord('b'): 0x08,
+    ord('f'): 0x0c,
+    ord('n'): 0x0a,
+    ord('r'): 0x0d,
+    ord('t'): 0x09,
+    ord('v'): 0x0b,
+    ord('"'): ord('"'),
+    ord('\\'): ord('\\'),
+}
+
+
+def split_path(raw: bytes) -> tuple[str, bytes]:
+    # a path at the start of `raw` (C-style quoted when it starts with `"`,
+    # else up to the first space) and what follows it
+    if not raw.startswith(b'"'):
+        path, _, rest = raw.partition(b' ')
+        return path.decode(), rest
+
+    res = bytearray()
+    i = 1
+
+    while i < len(raw):
+        c = raw[i]
+        if c == ord('"'):
+            return res.decode(), raw[i + 1:].lstrip(b' ')
+
+        if c == ord('\\') and i + 1 < len(raw):
+            i += 1
+            c = raw[i]
+            if ord('0') <= c <= ord('7'):
+                res.append(int(raw[i:i + 3], 8))
+                i += 3
+                continue
+            if c not in C_ESCAPES:
+                raise Exception(f'Invalid escape in path: {raw!r}')
+            c = C_ESCAPES[c]
+
+        res.append(c)
+        i += 1
+
+    raise Exception(f'Unterminated quoted path: {raw!r}')
+
+
+def parse_path(raw: bytes) -> str:
+    # a path that ends the line: only a quoted one can be followed by junk
+    if raw.startswith(b'"'):
+        path, rest = split_path(raw)
+        if rest:
+            raise Exception(f'Garbage after path: {raw!r}')
+        return path
+
+    return raw.decode()
+
+
+def tree_sort_key(name: str, mode: str) -> str:
+    return name + '/' if mode == MODE_TREE else name
+
+
+def tree_line(mode: str, name: str, sha: str) -> bytes:
+    return f'{mode} {name}\x00'.encode() + bytes.fromhex(sha)
+
+
+class TreeNode:
+    # A directory of a branch being imported, loaded from `sha` on first
+    # use.  `entries` maps names to (mode, SHA, node); subdirectories get a
+    # node only once they are entered.  `lines` keeps every entry encoded,
+    # by sort key, so writing the directory again only encodes what
+    # changed.  A change drops the SHA of each directory above it and
+    # records the way down in their `dirty` sets.
+    __slots__ = ('sha', 'entries', 'lines', 'dirty')
+
+    def __init__(self, sha: Optional[str] = None) -> None:
+        self.sha = sha
+        self.entries: Optional[dict[str, tuple[str, Optional[str], Optional[TreeNode]]]] = None if sha else {}
+        self.lines: dict[str, bytes] = {}
+        self.dirty: set[str] = set()
+
+    def load(self, data: bytes) -> None:
+        self.entries = {}
+        for item in types.iter_tree_items(data):
+            mode = item.mode.lstrip('0')
+            self.entries[item.path] = (mode, item.sha, None)
+            self.lines[tree_sort_key(item.path, mode)] = tree_line(mode, item.path, item.sha)
+
+    def set(self, name: str, mode: str, sha: str) -> None:
+        self.remove(name)
+        assert self.entries is not None
+        self.entries[name] = (mode, sha, None)
+        self.lines[tree_sort_key(name, mode)] = tree_line(mode, name, sha)
+
+    def remove(self, name: str) -> bool:
+        assert self.entries is not None
+        entry = self.entries.pop(name, None)
+        if not entry:
+            return False
+
+        self.lines.pop(tree_sort_key(name, entry[0]), None)
+        self.dirty.discard(name)
+        self.sha = None
+
+        return True
+
+
+class Branch:
+    __slots__ = ('tip', 'tree')
+
+    def __init__(self, tip: Optional[str], tree: TreeNode) -> None:
+        self.tip = tip
+        self.tree = tree
+
+
+class FastImport:
+    # Reads git's fast-import stream and writes every object into a single
+    # packfile (one per checkpoint) instead of one loose file each; refs
+    # are updated together once the pack is in place.  Objects already
+    # packed, here or earlier, are not written again.
+    __slots__ = (
+        'repo', 'input', 'out', 'force', 'writer', 'existing', 'marks', 'branches', 'tags',
+        'parents', 'counts', 'duplicates', 'pushed_back', 'packs', 'export_marks', 'done_required',
+    )
+
+    def __init__(self, repo: repository.Repository, input: BinaryIO, force: bool = False) -> None:
+        self.repo = repo
+        self.input = input
+        self.out = sys.stdout
+        self.force = force
+        self.writer = pack.PackWriter(repo.gitdir)
+        self.existing = pack.packs(repo.gitdir)
+        self.marks: dict[int, str] = {}
+        self.branches: dict[str, Branch] = {}
+        self.tags: dict[str, str] = {}
+        # parents of the imported commits, to tell fast-forwards
+        self.parents: dict[str, list[str]] = {}
+        self.counts: collections.Counter[types.GitObjectTypeEnum] = collections.Counter()
+        self.duplicates = 0
+        self.pushed_back: Optional[bytes] = None
+        self.packs: list[pathlib.Path] = []
+        self.export_marks: Optional[pathlib.Path] = None
+        self.done_required = False
+
+    # -- input
+
+    def next_line(self) -> Optional[bytes]:
+        if self.pushed_back is not None:
+            line, self.pushed_back = self.pushed_back, None
+            return line
+
+        while True:
+            line = self.input.readline()
+            if not line:
+                return None
+            if line.endswith(b'\n'):
+                line = line[:-1]
+            # comments and blank lines may appear between any two commands
+            if line and not line.startswith(b'#'):
+                return line
+
+    def push_back(self, line: bytes) -> None:
+        self.pushed_back = line
+
+    def next_arg(self, keyword: bytes) -> Optional[bytes]:
+        # the argument of an optional `<keyword> <arg>` line
+        line = self.next_line()
+        if line is not None and line.startswith(keyword + b' '):
+            return line[len(keyword) + 1:]
+
+        if line is not None:
+            self.push_back(line)
+
+        return None
+
+    def read_data(self) -> bytes:
+        line = self.next_line()
+        if line is None or not line.startswith(b'data '):
+            raise Exception(f'Expected data, got {line!r}')
+
+        arg = line[5:]
+        if not arg.startswith(b'<<'):
+            size = int(arg)
+            data = self.input.read(size)
+            if len(data) != size:
+                raise Exception(f'Unexpected end of input: expected {size} bytes of data')
+            return data
+
+        delimiter = arg[2:] + b'\n'
+        chunks: list[bytes] = []
+        while True:
+            chunk = self.input.readline()
+            if not chunk:
+                raise Exception(f'Unexpected end of input: missing {arg[2:]!r}')
+            if chunk == delimiter:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def read_mark(self) -> Optional[int]:
+        arg = self.next_arg(b'mark')
+        if arg is None:
+            return None
+        if not arg.startswith(b':'):
+            raise Exception(f'Invalid mark: {arg!r}')
+
+        return int(arg[1:])
+
+    # -- objects
+
+    def add(self, type_: types.GitObjectTypeEnum, data: bytes) -> str:
+        sha, _raw = git_object.encode(type_, data)
+        # like git, objects are looked up in the packs only: a loose copy
+        # does not save the packed one
+        binsha = bytes.fromhex(sha)
+        if binsha in self.writer.entries or any(existing.offset_of(binsha) is not None for existing in self.existing):
+            self.duplicates += 1
+            return sha
+
+        self.writer.add(sha, type_, data)
+        self.counts[type_] += 1
+
+        return sha
+
+    def read_object(self, sha: str) -> tuple[types.GitObjectTypeEnum, bytes]:
+        return self.writer.read(sha) or self.repo.read_raw(sha)
+
+    def resolve(self, raw: bytes) -> str:
+        # `:<mark>`, a full SHA, a branch of this import or any revision
+        name = raw.decode()
+        if name.startswith(':'):
+            sha = self.marks.get(int(name[1:]))
+            if not sha:
+                raise Exception(f'Unknown mark: {name}')
+            return sha
+
+        if len(name) == 40 and object_names.is_hex(name):
+            return name
+
+        branch = self.branches.get(name)
+        if branch and branch.tip:
+            return branch.tip
+
+        return revparse.resolve_commit(self.repo.gitdir, name)
+
+    def commit_tree(self, sha: str) -> str:
+        type_, data = self.read_object(sha)
+        if type_ != types.GitObjectTypeEnum.COMMIT or not data.startswith(b'tree '):
+            raise Exception(f'Not a commit: {sha}')
+
+        return data[5:45].decode()
+
+    # -- trees
+
+    def load(self, node: TreeNode) -> dict[str, tuple[str, Optional[str], Optional[TreeNode]]]:
+        if node.entries is None:
+            assert node.sha
+            node.load(self.read_object(node.sha)[1])
+        assert node.entries is not None
+
+        return node.entries
+
+    def walk(self, root: TreeNode, dirnames: list[str], create: bool) -> Optional[list[TreeNode]]:
+        # the nodes from `root` down to the directory `dirnames`
+        nodes = [root]
+
+        for name in dirnames:
+            parent = nodes[-1]
+            entry = self.load(parent).get(name)
+            if entry and entry[0] == MODE_TREE:
+                child = entry[2] or TreeNode(entry[1])
+                self.load(parent)[name] = (MODE_TREE, entry[1], child)
+            elif create:
+                parent.remove(name)
+                child = TreeNode()
+                self.load(parent)[name] = (MODE_TREE, None, child)
+                parent.dirty.add(name)
+            else:
+                return None
+
+            nodes.append(child)
+
+        return nodes
+
+    def touch(self, nodes: list[TreeNode], dirnames: list[str]) -> None:
+        for node, name in zip(nodes, dirnames):
+            node.dirty.add(name)
+        for node in nodes:
+            node.sha = None
+
+    def set_path(self, root: TreeNode, path: str, mode: str, sha: str) -> None:
+        *dirnames, basename = path.split('/')
+        nodes = self.walk(root, dirnames, True)
+        assert nodes
+
+        self.load(nodes[-1])
+        nodes[-1].set(basename, mode, sha)
+        self.touch(nodes, dirnames)
+
+    def get_path(self, root: TreeNode, path: str) -> Optional[tuple[str, str]]:
+        *dirnames, basename = path.split('/')
+        nodes = self.walk(root, dirnames, False)
+        if not nodes:
+            return None
+
+        entry = self.load(nodes[-1]).get(basename)
+        if not entry:
+            return None
+
+        mode, sha, node = entry
+        if node:
+            sha = self.store(node)
+        assert sha
+
+        return mode, sha
+
+    def delete_path(self, root: TreeNode, path: str) -> None:
+        *dirnames, basename = path.split('/')
+        nodes = self.walk(root, dirnames, False)
+        if not nodes:
+            return
+
+        self.load(nodes[-1])
+        if not nodes[-1].remove(basename):
+            return
+        self.touch(nodes, dirnames)
+
+        # directories left empty disappear, as they cannot be stored
+        for depth in range(len(dirnames), 0, -1):
+            if self.load(nodes[depth]):
+                break
+            nodes[depth - 1].remove(dirnames[depth - 1])
+
+    def store(self, node: TreeNode) -> str:
+        if node.sha:
+            return node.sha
+
+        entries = self.load(node)
+        for name in node.dirty:
+            mode, _sha, child = entries[name]
+            assert child
+            sha = self.store(child)
+            entries[name] = (mode, sha, child)
+            node.lines[tree_sort_key(name, mode)] = tree_line(mode, name, sha)
+        node.dirty.clear()
+
+        data = b''.join([node.lines[key] for key in sorted(node.lines)])
+        node.sha = self.add(types.GitObjectTypeEnum.TREE, data)
+
+        return node.sha
+
+    # -- commands
+
+    def run(self) -> None:
+        while (line := self.next_line()) is not None:
+            command, _, arg = line.partition(b' ')
+
+            if command == b'blob':
+                self.cmd_blob()
+            elif command == b'commit':
+                self.cmd_commit(arg.decode())
+            elif command == b'tag':
+                self.cmd_tag(arg.decode())
+            elif command == b'reset':
+                self.cmd_reset(arg.decode())
+            elif command == b'checkpoint':
+                self.checkpoint()
+            elif command == b'progress':
+                self.out.write(f'progress {arg.decode(errors="replace")}\n')
+                self.out.flush()
+            elif command == b'feature':
+                self.feature(arg.decode())
+            elif command == b'option':
+                # options meant for other importers are to be ignored
+                pass
+            elif command == b'done':
+                break
+            else:
+                raise Exception(f'Unsupported command: {line.decode(errors="replace")}')
+        else:
+            if self.done_required:
+                raise Exception('Stream ended without the `done` command')
+
+        self.checkpoint()
+
+    def feature(self, feature: str) -> None:
+        name, _, value = feature.partition('=')
+        if name == 'done':
+            self.done_required = True
+        elif name == 'force':
+            self.force = True
+        elif name in ('import-marks', 'import-marks-if-exists'):
+            self.import_marks(pathlib.Path(value), name == 'import-marks-if-exists')
+        elif name == 'export-marks':
+            self.export_marks = pathlib.Path(value)
+        elif feature not in FEATURES:
+            raise Exception(f'Unsupported feature: {feature}')
+
+    def cmd_blob(self) -> None:
+        mark = self.read_mark()
+        self.next_arg(b'original-oid')
+
+        sha = self.add(types.GitObjectTypeEnum.BLOB, self.read_data())
+        if mark is not None:
+            self.marks[mark] = sha
+
+    def cmd_commit(self, ref: str) -> None:
+        mark = self.read_mark()
+        self.next_arg(b'original-oid')
+        author = self.next_arg(b'author')
+        committer = self.next_arg(b'committer')
+        if committer is None:
+            raise Exception(f'Missing committer in commit to {ref}')
+        encoding = self.next_arg(b'encoding')
+        message = self.read_data()
+
+        branch = self.branches.get(ref)
+        base = self.next_arg(b'from')
+        if base is not None:
+            tip = self.resolve(base)
+            if tip == refs.ZERO_SHA:
+                branch = Branch(None, TreeNode())
+            elif not branch or branch.tip != tip:
+                branch = Branch(tip, TreeNode(self.commit_tree(tip)))
+        elif not branch:
+            branch = Branch(None, TreeNode())
+        self.branches[ref] = branch
+
+        parents = [branch.tip] if branch.tip else []
+        while (merge := self.next_arg(b'merge')) is not None:
+            parents.append(self.resolve(merge))
+
+        while (line := self.next_line()) is not None:
+            if not self.file_command(branch, line):
+                self.push_back(line)
+                break
+
+        headers = [('tree', self.store(branch.tree).encode())]
+        headers.extend(('parent', parent.encode()) for parent in parents)
+        headers.append(('author', author or committer))
+        headers.append(('committer', committer))
+        if encoding:
+            headers.append(('encoding', encoding))
+
+        sha = self.add(types.GitObjectTypeEnum.COMMIT, git_object.serialize_key_value_list_with_message(headers, message))
+        self.parents[sha] = parents
+        branch.tip = sha
+        if mark is not None:
+            self.marks[mark] = sha
+
+    def file_command(self, branch: Branch, line: bytes) -> bool:
+        command, _, arg = line.partition(b' ')
+
+        if command == b'M':
+            mode_, dataref, path_ = arg.split(b' ', 2)
+            mode = MODES.get(mode_.decode())
+            if not mode:
+                raise Exception(f'Invalid file mode: {mode_!r}')
+
+            if dataref == b'inline':
+                sha = self.add(types.GitObjectTypeEnum.BLOB, self.read_data())
+            else:
+                sha = self.resolve(dataref)
+
+            path = parse_path(path_)
+            if mode == MODE_TREE and sha == EMPTY_TREE:
+                if path:
+                    self.delete_path(branch.tree, path)
+                else:
+                    branch.tree = TreeNode()
+                return True
+            if mode == MODE_TREE:
+                if sha not in self.writer and not self.repo.exists(sha):
+                    raise Exception(f'Tree not found: {sha}')
+                if self.read_object(sha)[0] != types.GitObjectTypeEnum.TREE:
+                    raise Exception(f'Not a tree: {sha}')
+
+            if not path and mode == MODE_TREE:
+                branch.tree = TreeNode(sha)
+            else:
+                self.set_path(branch.tree, path, mode, sha)
+        elif command == b'D':
+            self.delete_path(branch.tree, parse_path(arg))
+        elif command in (b'C', b'R'):
+            source, rest = split_path(arg)
+            entry = self.get_path(branch.tree, source)
+            if not entry:
+                raise Exception(f'Path {source} not in branch')
+            if command == b'R':
+                self.delete_path(branch.tree, source)
+            self.set_path(branch.tree, parse_path(rest), *entry)
+        elif command == b'deleteall':
+            branch.tree = TreeNode()
+        elif command == b'N':
+            raise Exception('Notes are not supported')
+        else:
+            return False
+
+        return True
+
+    def cmd_tag(self, name: str) -> None:
+        mark = self.read_mark()
+        base = self.next_arg(b'from')
+        if base is None:
+            raise Exception(f'Missing from in tag {name}')
+        self.next_arg(b'original-oid')
+        tagger = self.next_arg(b'tagger')
+        message = self.read_data()
+
+        target = self.resolve(base)
+        type_, _data = self.read_object(target)
+
+        headers = [('object', target.encode()), ('type', type_.name.lower().encode()), ('tag', name.encode())]
+        if tagger is not None:
+            headers.append(('tagger', tagger))
+
+        sha = self.add(types.GitObjectTypeEnum.TAG, git_object.serialize_key_value_list_with_message(headers, message))
+        self.tags[f'refs/tags/{name}'] = sha
+        if mark is not None:
+            self.marks[mark] = sha
+
+    def cmd_reset(self, ref: str) -> None:
+        base = self.next_arg(b'from')
+        if base is None:
+            self.branches[ref] = Branch(None, TreeNode())
+            return
+
+        tip = self.resolve(base)
+        self.branches[ref] = Branch(tip, TreeNode(self.commit_tree(tip)))
+
+    # -- output
+
+    def contains(self, tip: str, old: str) -> bool:
+        # whether `old` is reachable from `tip` through imported commits
+        pending = [tip]
+        seen = {tip}
+
+        while pending:
+            sha = pending.pop()
+            if sha == old:
+                return True
+            for parent in self.parents.get(sha, ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    pending.append(parent)
+
+        return False
+
+    def checkpoint(self) -> None:
+        idx_path = self.writer.finish()
+        if idx_path:
+            self.packs.append(idx_path.with_suffix('.pack'))
+        self.writer = pack.PackWriter(self.repo.gitdir)
+        self.existing = pack.packs(self.repo.gitdir)
+
+        store = self.repo.refs
+        store.invalidate()
+        transaction = store.transaction()
+        rejected: list[str] = []
+
+        updates = {ref: branch.tip for ref, branch in self.branches.items() if branch.tip}
+        for ref, sha in (updates | self.tags).items():
+            old = store.resolve(ref)
+            if old == sha:
+                continue
+            if old and ref in updates and not self.force and not self.contains(sha, old):
+                rejected.append(ref)
+                continue
+            transaction.update(ref, sha, old or refs.ZERO_SHA)
+
+        transaction.commit()
+
+        if self.export_marks:
+            self.export_marks.write_text(''.join(f':{mark} {sha}\n' for mark, sha in sorted(self.marks.items())))
+
+        if rejected:
+            raise Exception(f'Not updating {", ".join(rejected)}: not a fast-forward (use --force)')
+
+    def import_marks(self, path: pathlib.Path, if_exists: bool = False) -> None:
+        if if_exists and not path.exists():
+            return
+
+        for line in path.read_text().splitlines():
+            mark, _, sha = line.partition(' ')
+            self.marks[int(mark.lstrip(':'))] = sha
+
+    def close(self) -> None:
+        self.writer.abort()
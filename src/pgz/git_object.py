@@ -1,16 +1,144 @@
+import collections
+import concurrent.futures
+import ctypes
 import hashlib
+import os
 import pathlib
-from typing import Any
+import shutil
+import tempfile
+import threading
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
 import zlib
 
 from . import types
 from . import lib
+from . import pack
+
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+PEEK_CHUNK_SIZE = 64
+MAX_HEADER_SIZE = 32
 
 
 def from_sha(gitdir: pathlib.Path, sha: str) -> types.GitObject:
+    return from_data(*read_raw(gitdir, sha))
+
+
+def read_raw(gitdir: pathlib.Path, sha: str) -> tuple[types.GitObjectTypeEnum, bytes]:
+    packed = pack.read(gitdir, sha, lambda base_sha: read_raw(gitdir, base_sha.hex()))
+    if packed:
+        return packed
+
+    return read_loose(gitdir, sha)
+
+
+def read_many(
+    gitdir: pathlib.Path,
+    shas: Iterable[str],
+    threads: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    batch_size: int = 32,
+) -> Iterator[tuple[str, types.GitObjectTypeEnum, bytes]]:
+    # Reads `shas` on a thread pool and yields (sha, type, data) in
+    # completion order, not input order.  File reads and zlib release the
+    # GIL, so this overlaps disk latency and uses idle cores.  Names are
+    # handed out `batch_size` at a time to keep the per-task overhead small
+    # next to a single read, and at most `max_in_flight` batches are queued,
+    # so `shas` may be a long lazy iterator.
+    threads = threads or min(32, (os.cpu_count() or 1) + 4)
+    max_in_flight = max_in_flight or threads * 2
+
+    def read_batch(batch: list[str]) -> list[tuple[str, types.GitObjectTypeEnum, bytes]]:
+        return [(sha, *read_raw(gitdir, sha)) for sha in batch]
+
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        pending: set[concurrent.futures.Future[list[tuple[str, types.GitObjectTypeEnum, bytes]]]] = set()
+        batch: list[str] = []
+        try:
+            for sha in shas:
+                batch.append(sha)
+                if len(batch) < batch_size:
+                    continue
+
+                pending.add(executor.submit(read_batch, batch))
+                batch = []
+                if len(pending) >= max_in_flight:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+
+            if batch:
+                pending.add(executor.submit(read_batch, batch))
+
+            for future in concurrent.futures.as_completed(pending):
+                yield from future.result()
+        finally:
+            # the consumer stopped early or a read failed
+            for future in pending:
+                future.cancel()
+
+
+def read_loose(gitdir: pathlib.Path, sha: str) -> tuple[types.GitObjectTypeEnum, bytes]:
     object_path = gitdir / 'objects' / sha[:2] / sha[2:]
 
-    return from_bytes(zlib.decompress(object_path.read_bytes()))
+    return split_header(zlib.decompress(object_path.read_bytes()))
+
+
+def read_header(gitdir: pathlib.Path, sha: str) -> tuple[types.GitObjectTypeEnum, int]:
+    packed = pack.read_header(gitdir, sha, lambda base_sha: read_header(gitdir, base_sha.hex()))
+    if packed:
+        return packed
+
+    return read_loose_header(gitdir, sha)
+
+
+def read_loose_header(gitdir: pathlib.Path, sha: str) -> tuple[types.GitObjectTypeEnum, int]:
+    object_path = gitdir / 'objects' / sha[:2] / sha[2:]
+    decompressor = zlib.decompressobj()
+    raw = b''
+
+    with object_path.open('rb') as f:
+        while b'\x00' not in raw:
+            if len(raw) >= MAX_HEADER_SIZE or decompressor.eof:
+                raise Exception(f'Malformed object {sha}: bad header')
+
+            chunk = decompressor.unconsumed_tail or f.read(PEEK_CHUNK_SIZE)
+            if not chunk:
+                raise Exception(f'Malformed object {sha}: bad header')
+            raw += decompressor.decompress(chunk, MAX_HEADER_SIZE - len(raw))
+
+    type_, _, size = raw[:raw.index(b'\x00')].decode().partition(' ')
+    enum_type = types.GitObjectTypeEnum.from_str(type_)
+    if not enum_type:
+        raise Exception(f'Unknown object type: {type_}')
+
+    return enum_type, int(size)
+
+
+def exists(gitdir: pathlib.Path, sha: str) -> bool:
+    if len(sha) != 40:
+        return False
+
+    try:
+        binsha = bytes.fromhex(sha)
+    except ValueError:
+        return False
+
+    return bool(pack.find(gitdir, binsha)) or (gitdir / 'objects' / sha[:2] / sha[2:]).is_file()
+
+
+def loose_shas(gitdir: pathlib.Path) -> Iterator[str]:
+    objects_dir = gitdir / 'objects'
+    if not objects_dir.is_dir():
+        return
+
+    for dirpath in sorted(objects_dir.iterdir()):
+        if len(dirpath.name) != 2 or not dirpath.is_dir():
+            continue
+
+        for path in sorted(dirpath.iterdir()):
+            if len(path.name) == 38:
+                yield dirpath.name + path.name
 
 
 def from_path(path: pathlib.Path) -> types.GitObject:
@@ -20,6 +148,10 @@ def from_path(path: pathlib.Path) -> types.GitObject:
 
 
 def from_bytes(raw: bytes) -> types.GitObject:
+    return from_data(*split_header(raw))
+
+
+def split_header(raw: bytes) -> tuple[types.GitObjectTypeEnum, bytes]:
     type_end = raw.find(b' ')
     size_end = raw.find(b'\x00')
 
@@ -32,8 +164,10 @@ def from_bytes(raw: bytes) -> types.GitObject:
     if size != len(raw) - size_end - 1:
         raise Exception('Malformed object {sha}: bad length')
 
-    data = raw[size_end + 1:]
+    return type_, raw[size_end + 1:]
+
 
+def from_data(type_: types.GitObjectTypeEnum, data: bytes) -> types.GitObject:
     if type_ == types.GitObjectTypeEnum.BLOB:
         return types.GitObjectBlob(type_=type_, blob=data)
     elif type_ == types.GitObjectTypeEnum.TREE:
@@ -47,120 +181,62 @@ def from_bytes(raw: bytes) -> types.GitObject:
 
 
 def parse_key_value_list_with_message(raw: bytes) -> dict[str, bytes]:
-    res: dict[str, bytes] = {}
-
-    while (space_pos := raw.find(b' ')) < (newline_pos := raw.find(b'\n')):
-        key = raw[:space_pos].decode()
-        value = raw[space_pos + 1:newline_pos]
-
-        res[key] = value
-        raw = raw[newline_pos + 1:]
+    headers, message = types.parse_headers(raw)
 
-    res['message'] = raw[1:]
+    return dict(headers) | {'message': message}
 
-    return res
 
+def serialize_key_value_list_with_message(headers: list[tuple[str, bytes]], message: bytes) -> bytes:
+    res: list[bytes] = []
 
-def serialize_key_value_list_with_message(data: dict[str, Any]) -> bytes:
-    res = b''
+    for key, value in headers:
+        res.append(key.encode() + b' ' + value.replace(b'\n', b'\n ') + b'\n')
 
-    for key, value in data.items():
-        if key == 'message':
-            continue
-
-        if isinstance(value, str):
-            value = value.encode()
-        res += key.encode() + b' ' + value + b'\n'
-
-    res += b'\n'
-    res += data['message']
+    res.append(b'\n')
+    res.append(message)
 
-    return res
+    return b''.join(res)
 
 
 def parse_commit(raw: bytes) -> types.GitObjectCommit:
-    body = parse_key_value_list_with_message(raw)
-
-    return types.GitObjectCommit.model_validate(
-        body |
-        {
-            "tree": body['tree'].decode(),
-            "parent": body.get('parent') and body['parent'].decode(),
-            "author": body['author'],
-            "committer": body['committer'],
-        } |
-        {
-            "type_": types.GitObjectTypeEnum.COMMIT,
-            "data": raw,
-        }
-    )
+    return types.GitObjectCommit.from_raw(raw)
 
 
 def parse_tree(raw: bytes) -> types.GitObjectTree:
-    items: list[types.GitObjectTreeItem] = []
+    return types.GitObjectTree.from_raw(raw)
 
-    while raw:
-        mode_end = raw.find(b' ')
-        path_end = raw.find(b'\x00')
 
-        mode = raw[:mode_end].decode()
-        mode = f'{mode:0>6}'  # pad 0 with right align
-        path = raw[mode_end + 1:path_end].decode()
-        sha = raw[path_end + 1:path_end + 21].hex()
-
-        items.append(types.GitObjectTreeItem(mode=mode, path=path, sha=sha))
+def parse_tag(raw: bytes) -> types.GitObjectTag:
+    return types.GitObjectTag.from_raw(raw)
 
-        raw = raw[path_end + 21:]
 
-    return types.GitObjectTree(type_=types.GitObjectTypeEnum.TREE, items=items)
+def tree_item_type(item: types.GitObjectTreeItem) -> str:
+    type_mapping = {
+        '04': 'tree',
+        '10': 'blob',
+        '12': 'blob',
+        '16': 'commit',
+    }
 
+    type_ = type_mapping.get(item.mode[:2])
+    if not type_:
+        raise Exception(f'Unknown mode: {item.mode}')
 
-def parse_tag(raw: bytes) -> types.GitObjectTag:
-    body = parse_key_value_list_with_message(raw)
-
-    return types.GitObjectTag.model_validate(
-        body |
-        {
-            "type": body['type'].decode(),
-            "tag": body['tag'].decode(),
-            "tagger": body['tagger'],
-        } |
-        {
-            "type_": types.GitObjectTypeEnum.TAG,
-            "data": raw,
-        }
-    )
+    return type_
 
 
 def prettify(obj: types.GitObject) -> bytes:
     if isinstance(obj, types.GitObjectBlob):
         return obj.blob
 
-    elif isinstance(obj, types.GitObjectCommit):
-        data = obj.model_dump()
-        data.pop('type_')
-        return serialize_key_value_list_with_message(data)
+    elif isinstance(obj, (types.GitObjectCommit, types.GitObjectTag)):
+        return serialize(obj)
 
     elif isinstance(obj, types.GitObjectTree):
-        res = b''
-        type_mapping = {
-            '04': 'tree',
-            '10': 'blob',
-            '12': 'blob',
-            '16': 'commit',
-        }
-        for item in obj.items:
-            type_ = type_mapping.get(item.mode[:2])
-            if not type_:
-                raise Exception(f'Unknown mode: {item.mode}')
-            res += f'{item.mode} {type_} {item.sha}\t{item.path}\n'.encode()
-
-        return res
-
-    elif isinstance(obj, types.GitObjectTag):
-        data = obj.model_dump()
-        data.pop('type_')
-        return serialize_key_value_list_with_message(data)
+        return ''.join(
+            f'{item.mode} {tree_item_type(item)} {item.sha}\t{item.path}\n'
+            for item in obj.iter_items()
+        ).encode()
 
     raise Exception(f'Unknown object type: {obj.type_}')
 
@@ -169,39 +245,342 @@ def serialize(obj: types.GitObject) -> bytes:
     if isinstance(obj, types.GitObjectBlob):
         return obj.blob
 
-    elif isinstance(obj, types.GitObjectCommit):
-        data = obj.model_dump()
-        data.pop('type_')
-        return serialize_key_value_list_with_message(data)
+    elif isinstance(obj, (types.GitObjectCommit, types.GitObjectTag)):
+        if obj.raw is not None:
+            return obj.raw
+        return serialize_key_value_list_with_message(obj.headers, obj.message)
 
     elif isinstance(obj, types.GitObjectTree):
-        res = b''
-
-        for item in obj.items:
-            res += item.mode.encode() + b' ' + item.path.encode() + b'\x00' + bytes.fromhex(item.sha)
+        if obj.raw is not None:
+            return obj.raw
 
-        return res
-
-    elif isinstance(obj, types.GitObjectTag):
-        data = obj.model_dump()
-        data.pop('type_')
-        return serialize_key_value_list_with_message(data)
+        # git writes tree modes without the leading zero (`40000`)
+        return b''.join(
+            f'{item.mode.lstrip("0")} {item.path}\x00'.encode() + bytes.fromhex(item.sha)
+            for item in obj.items
+        )
 
     raise Exception(f'Unknown object type: {obj.type_}')
 
 
-def hash_(obj: types.GitObject) -> tuple[str, bytes]:
-    data = serialize(obj)
-    raw = f'{obj.type_.name.lower()} {len(data)}\x00'.encode() + data
-
-    return hashlib.sha1(raw).hexdigest(), data
-
+def encode(type_: types.GitObjectTypeEnum, data: bytes) -> tuple[str, bytes]:
+    # the object id and the loose-object bytes (header + data), built once
+    raw = f'{type_.name.lower()} {len(data)}\x00'.encode() + data
 
-def write_(obj: types.GitObject, gitdir: pathlib.Path) -> tuple[str, pathlib.Path]:
-    sha, data = hash_(obj)
-    filepath = lib.get_or_create_repo_file(gitdir, f'objects/{sha[:2]}/{sha[2:]}')
+    return hashlib.sha1(raw).hexdigest(), raw
 
-    raw = f'{obj.type_.name.lower()} {len(data)}\x00'.encode() + data
-    filepath.write_bytes(zlib.compress(raw))
 
-    return sha, filepath
+def hash_(obj: types.GitObject) -> tuple[str, bytes]:
+    data = serialize(obj)
+    sha, _ = encode(obj.type_, data)
+
+    return sha, data
+
+
+def object_path(gitdir: pathlib.Path, sha: str) -> pathlib.Path:
+    return gitdir / 'objects' / sha[:2] / sha[2:]
+
+
+# from <fcntl.h>: start writing back dirty pages, without waiting
+SYNC_FILE_RANGE_WRITE = 2
+
+
+def libc_function(name: str, argtypes: list[type]) -> Optional[Callable[..., int]]:
+    # a libc function that not every platform has (Linux-only syscalls)
+    try:
+        fn = getattr(ctypes.CDLL(None, use_errno=True), name)
+    except (OSError, AttributeError):
+        return None
+    fn.argtypes = argtypes
+
+    return fn
+
+
+_sync_file_range = libc_function('sync_file_range', [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_uint])
+_syncfs = libc_function('syncfs', [ctypes.c_int])
+
+
+def writeout(fd: int) -> None:
+    # a hint to start writing `fd` back now, so that the sync that ends the
+    # batch finds little left to do
+    if _sync_file_range:
+        _sync_file_range(fd, 0, 0, SYNC_FILE_RANGE_WRITE)
+    elif hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def syncfs(path: pathlib.Path) -> bool:
+    # flushes the filesystem holding `path` (only that one, unlike sync(2));
+    # False where syncfs(2) is not available
+    if not _syncfs:
+        return False
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if _syncfs(fd) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+    finally:
+        os.close(fd)
+
+    return True
+
+
+def fsync_path(path: pathlib.Path) -> None:
+    # works for directories too, which cannot be opened as files
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ObjectWriter:
+    # Writes loose objects crash-safely: the compressed object goes to a
+    # temporary file that is fsynced and renamed into place only when
+    # complete, so a crash never leaves a truncated object under its final
+    # name.  Objects that already exist (loose, packed or earlier in this
+    # writer) are not written again.
+    #
+    # Used as a context manager the writer batches, like git's
+    # `core.fsyncMethod=batch`: temporary files are written without fsync,
+    # only with a hint to start writing them back, and on exit a single
+    # syncfs(2) of the objects directory makes them all durable before they
+    # are renamed.  Objects of a batch become visible only at that point.
+    # Where syncfs is not available (anything but Linux), each temporary
+    # file is fsynced instead, and then the directories they are renamed
+    # into.  A writer may be shared between threads.
+    __slots__ = ('gitdir', 'objects_dir', 'fsync', 'batch', 'pending', 'seen', 'dirs', 'written', 'skipped', 'lock')
+
+    def __init__(self, gitdir: pathlib.Path, fsync: bool = True) -> None:
+        self.gitdir = gitdir
+        self.objects_dir = lib.get_or_create_repo_dir(gitdir, 'objects')
+        self.fsync = fsync
+        self.batch = False
+        self.pending: dict[str, pathlib.Path] = {}
+        self.seen: set[str] = set()
+        self.dirs: set[str] = set()
+        self.written = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self) -> 'ObjectWriter':
+        self.batch = True
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: object,
+    ) -> None:
+        self.batch = False
+        if exc_type is None:
+            self.flush()
+        else:
+            self.abort()
+
+    def __contains__(self, sha: str) -> bool:
+        return sha in self.seen or sha in self.pending or exists(self.gitdir, sha)
+
+    def write(self, type_: types.GitObjectTypeEnum, data: bytes) -> str:
+        sha, raw = encode(type_, data)
+        if sha in self:
+            with self.lock:
+                self.skipped += 1
+            return sha
+
+        fd, tmp_path = tempfile.mkstemp(prefix='tmp_obj_', dir=self.objects_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(zlib.compress(raw))
+                self.sync_temp(out)
+        except BaseException:
+            pathlib.Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        self.add_temp(sha, pathlib.Path(tmp_path))
+
+        return sha
+
+    def sync_temp(self, out: BinaryIO) -> None:
+        # for a temporary object file that is complete
+        if not self.fsync:
+            return
+
+        out.flush()
+        if self.batch:
+            writeout(out.fileno())
+        else:
+            os.fsync(out.fileno())
+
+    def write_object(self, obj: types.GitObject) -> str:
+        return self.write(obj.type_, serialize(obj))
+
+    def read(self, sha: str) -> Optional[tuple[types.GitObjectTypeEnum, bytes]]:
+        # an object of the current batch, not yet visible under its name
+        with self.lock:
+            tmp_path = self.pending.get(sha)
+        if not tmp_path:
+            return None
+
+        return split_header(zlib.decompress(tmp_path.read_bytes()))
+
+    def add_temp(self, sha: str, tmp_path: pathlib.Path) -> None:
+        # takes ownership of a finished temporary object file
+        with self.lock:
+            if sha in self.seen or sha in self.pending:
+                tmp_path.unlink()
+                self.skipped += 1
+                return
+
+            if self.batch:
+                self.pending[sha] = tmp_path
+            else:
+                self.install(sha, tmp_path)
+
+    def install(self, sha: str, tmp_path: pathlib.Path) -> None:
+        if sha[:2] not in self.dirs:
+            (self.objects_dir / sha[:2]).mkdir(exist_ok=True)
+            self.dirs.add(sha[:2])
+
+        path = self.objects_dir / sha[:2] / sha[2:]
+        if path.exists():
+            tmp_path.unlink()
+            self.skipped += 1
+        else:
+            tmp_path.replace(path)
+            self.written += 1
+        self.seen.add(sha)
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.pending:
+                return
+
+            synced = self.fsync and syncfs(self.objects_dir)
+            if self.fsync and not synced:
+                for tmp_path in self.pending.values():
+                    fsync_path(tmp_path)
+
+            for sha, tmp_path in self.pending.items():
+                self.install(sha, tmp_path)
+
+            if self.fsync and not synced:
+                # the renames, and the new fan-out directories
+                for dirname in {sha[:2] for sha in self.pending}:
+                    fsync_path(self.objects_dir / dirname)
+                fsync_path(self.objects_dir)
+            self.pending.clear()
+
+    def abort(self) -> None:
+        with self.lock:
+            for tmp_path in self.pending.values():
+                tmp_path.unlink(missing_ok=True)
+            self.pending.clear()
+
+
+def write_(obj: types.GitObject, gitdir: pathlib.Path, writer: Optional[ObjectWriter] = None) -> tuple[str, pathlib.Path]:
+    sha = (writer or ObjectWriter(gitdir)).write_object(obj)
+
+    return sha, object_path(gitdir, sha)
+
+
+def spool(f: BinaryIO) -> tuple[BinaryIO, int]:
+    # streams of unknown length (pipes) are copied to a temporary file first,
+    # since the object header needs the size before any content is hashed.
+    tmp = tempfile.TemporaryFile()
+    shutil.copyfileobj(f, tmp, STREAM_CHUNK_SIZE)
+    size = tmp.tell()
+    tmp.seek(0)
+
+    return tmp, size
+
+
+def hash_stream(
+    f: BinaryIO,
+    size: int,
+    type_: types.GitObjectTypeEnum = types.GitObjectTypeEnum.BLOB,
+    gitdir: Optional[pathlib.Path] = None,
+    writer: Optional[ObjectWriter] = None,
+) -> str:
+    header = f'{type_.name.lower()} {size}\x00'.encode()
+    sha1 = hashlib.sha1(header)
+
+    if writer is None:
+        if not gitdir:
+            for chunk in read_chunks(f, size):
+                sha1.update(chunk)
+            return sha1.hexdigest()
+
+        writer = ObjectWriter(gitdir)
+
+    fd, tmp_path_ = tempfile.mkstemp(prefix='tmp_obj_', dir=writer.objects_dir)
+    tmp_path = pathlib.Path(tmp_path_)
+
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            compressor = zlib.compressobj()
+            out.write(compressor.compress(header))
+            for chunk in read_chunks(f, size):
+                sha1.update(chunk)
+                out.write(compressor.compress(chunk))
+            out.write(compressor.flush())
+            writer.sync_temp(out)
+
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    sha = sha1.hexdigest()
+    if exists(writer.gitdir, sha):
+        tmp_path.unlink()
+        with writer.lock:
+            writer.skipped += 1
+    else:
+        writer.add_temp(sha, tmp_path)
+
+    return sha
+
+
+def hash_file(
+    path: str | pathlib.Path,
+    type_: types.GitObjectTypeEnum = types.GitObjectTypeEnum.BLOB,
+    writer: Optional[ObjectWriter] = None,
+) -> str:
+    with open(path, 'rb') as f:
+        return hash_stream(f, os.fstat(f.fileno()).st_size, type_, writer=writer)
+
+
+def hash_files(
+    paths: Iterable[str | pathlib.Path],
+    type_: types.GitObjectTypeEnum = types.GitObjectTypeEnum.BLOB,
+    writer: Optional[ObjectWriter] = None,
+    threads: Optional[int] = None,
+) -> Iterator[str]:
+    # SHA-1 and zlib release the GIL on large buffers, so files are hashed
+    # on a thread pool.  At most a few files per thread are in flight and
+    # results are yielded in input order.
+    threads = threads or os.cpu_count() or 1
+    window = threads * 4
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        in_flight: collections.deque[concurrent.futures.Future[str]] = collections.deque()
+        for path in paths:
+            in_flight.append(executor.submit(hash_file, path, type_, writer))
+            if len(in_flight) >= window:
+                yield in_flight.popleft().result()
+
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def read_chunks(f: BinaryIO, size: int) -> Iterator[bytes]:
+    remaining = size
+
+    while remaining:
+        chunk = f.read(min(remaining, STREAM_CHUNK_SIZE))
+        if not chunk:
+            raise Exception(f'Unexpected end of input: expected {size} bytes')
+
+        yield chunk
+        remaining -= len(chunk)
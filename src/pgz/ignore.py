@@ -0,0 +1,104 @@
+import os
+import pathlib
+import re
+from typing import Optional
+
+
+# directory prefix the pattern is relative to, compiled pattern, matches
+# against the whole relative path (else the basename), negated, directories only
+Rule = tuple[str, re.Pattern[str], bool, bool, bool]
+
+
+def translate(pattern: str) -> str:
+    # gitignore glob -> regex: `*` and `?` stop at `/`, `**` crosses it
+    res: list[str] = []
+    i = 0
+
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            res.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            res.append('.*')
+            i += 2
+            continue
+
+        if c == '*':
+            res.append('[^/]*')
+        elif c == '?':
+            res.append('[^/]')
+        elif c == '\\' and i + 1 < len(pattern):
+            i += 1
+            res.append(re.escape(pattern[i]))
+        elif c == '[' and (end := pattern.find(']', i + 2)) > 0:
+            body = pattern[i + 1:end]
+            if body[0] in '!^':
+                body = '^' + body[1:]
+            res.append(f'[{body}]')
+            i = end
+        else:
+            res.append(re.escape(c))
+        i += 1
+
+    return ''.join(res)
+
+
+def parse_rules(text: str, base: str) -> list[Rule]:
+    rules: list[Rule] = []
+
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        elif line.startswith('\\'):
+            line = line[1:]
+
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+
+        # a slash anywhere but at the end anchors the pattern to `base`
+        anchored = '/' in line
+        rules.append((base, re.compile(translate(line.lstrip('/'))), anchored, negate, dir_only))
+
+    return rules
+
+
+def read_rules(path: pathlib.Path, base: str = '') -> list[Rule]:
+    try:
+        return parse_rules(path.read_text(errors='replace'), base)
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+
+def is_ignored(rules: list[Rule], path: str, is_dir: bool) -> bool:
+    # the last matching rule wins
+    basename = path.rpartition('/')[2]
+
+    for base, regex, anchored, negate, dir_only in reversed(rules):
+        if dir_only and not is_dir:
+            continue
+        if not path.startswith(base):
+            continue
+
+        if regex.fullmatch(path[len(base):] if anchored else basename):
+            return not negate
+
+    return False
+
+
+def global_rules(gitdir: pathlib.Path, excludes_file: Optional[str] = None) -> list[Rule]:
+    # core.excludesFile (default: $XDG_CONFIG_HOME/git/ignore), then
+    # .git/info/exclude; per-directory .gitignore files are added on top
+    if not excludes_file:
+        config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+        excludes_file = os.path.join(config_home, 'git', 'ignore')
+
+    return read_rules(pathlib.Path(os.path.expanduser(excludes_file))) + read_rules(gitdir / 'info' / 'exclude')
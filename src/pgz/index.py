@@ -0,0 +1,383 @@
+import bisect
+import hashlib
+import itertools
+import mmap
+import os
+import pathlib
+import stat
+import struct
+from typing import Optional
+
+from . import git_object
+from . import pack
+from . import refs
+from . import types
+
+
+SIGNATURE = b'DIRC'
+SUPPORTED_VERSIONS = (2, 3, 4)
+HEADER = struct.Struct('>4sII')
+# ctime sec/nsec, mtime sec/nsec, dev, ino, mode, uid, gid, size, sha, flags
+ENTRY = struct.Struct('>10I20sH')
+EXTENDED_FLAGS = struct.Struct('>H')
+EXTENSION_HEADER = struct.Struct('>4sI')
+
+FLAG_EXTENDED = 0x4000
+FLAG_STAGE_MASK = 0x3000
+FLAG_STAGE_SHIFT = 12
+NAME_MASK = 0xfff
+
+EXTENSION_CACHE_TREE = b'TREE'
+EXTENSION_RESOLVE_UNDO = b'REUC'
+# optional extensions that stay valid as long as no entry is added, removed
+# or changes content; the others (untracked cache, fsmonitor, offset tables)
+# describe the file they were read from and are dropped on write
+KEPT_EXTENSIONS = (EXTENSION_CACHE_TREE, EXTENSION_RESOLVE_UNDO)
+
+MODE_FILE = 0o100644
+MODE_EXECUTABLE = 0o100755
+MODE_SYMLINK = 0o120000
+MODE_GITLINK = 0o160000
+
+# the 10 stat fields of an entry, in on-disk order
+Stat = tuple[int, int, int, int, int, int, int, int, int, int]
+
+
+def entry_mode(st_mode: int) -> int:
+    if stat.S_ISLNK(st_mode):
+        return MODE_SYMLINK
+    if stat.S_ISDIR(st_mode):
+        return MODE_GITLINK
+
+    return MODE_EXECUTABLE if st_mode & 0o100 else MODE_FILE
+
+
+def stat_data(st: os.stat_result) -> Stat:
+    # truncated to 32 bits, as git stores them
+    ctime_sec, ctime_nsec = divmod(st.st_ctime_ns, 1_000_000_000)
+    mtime_sec, mtime_nsec = divmod(st.st_mtime_ns, 1_000_000_000)
+    st_mode = st.st_mode
+
+    return (
+        ctime_sec & 0xffffffff,
+        ctime_nsec,
+        mtime_sec & 0xffffffff,
+        mtime_nsec,
+        st.st_dev & 0xffffffff,
+        st.st_ino & 0xffffffff,
+        (MODE_EXECUTABLE if st_mode & 0o100 else MODE_FILE) if stat.S_ISREG(st_mode) else entry_mode(st_mode),
+        st.st_uid & 0xffffffff,
+        st.st_gid & 0xffffffff,
+        st.st_size & 0xffffffff,
+    )
+
+
+class IndexEntry:
+    __slots__ = ('path', 'sha', 'stat', 'flags', 'extended_flags')
+
+    def __init__(self, path: str, sha: str, stat: Stat, flags: int = 0, extended_flags: int = 0) -> None:
+        self.path = path
+        self.sha = sha
+        self.stat = stat
+        self.flags = flags
+        self.extended_flags = extended_flags
+
+    @property
+    def mode(self) -> int:
+        return self.stat[6]
+
+    @property
+    def stage(self) -> int:
+        return (self.flags & FLAG_STAGE_MASK) >> FLAG_STAGE_SHIFT
+
+
+class Index:
+    __slots__ = ('path', 'version', 'entries', 'extensions', 'mtime_ns')
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        version: int = 2,
+        entries: Optional[list[IndexEntry]] = None,
+        extensions: Optional[list[tuple[bytes, bytes]]] = None,
+        mtime_ns: int = 0,
+    ) -> None:
+        self.path = path
+        self.version = version
+        # sorted by path, then stage
+        self.entries = entries or []
+        self.extensions = extensions or []
+        # mtime of the file the entries were read from: an entry modified
+        # at or after it may have changed without its stat data changing
+        self.mtime_ns = mtime_ns
+
+    def cache_tree(self) -> dict[str, tuple[int, Optional[str]]]:
+        # directory prefix ('' for the top, 'dir/sub/' below) -> (entries
+        # covered, tree SHA).  Invalidated directories have a count of -1
+        # and no SHA.
+        data = dict(self.extensions).get(EXTENSION_CACHE_TREE)
+        res: dict[str, tuple[int, Optional[str]]] = {}
+        if not data:
+            return res
+
+        # the nodes are stored depth first; (prefix, subtrees still to come)
+        stack: list[tuple[str, int]] = []
+        pos = 0
+
+        while pos < len(data):
+            name_end = data.index(b'\x00', pos)
+            line_end = data.index(b'\n', name_end)
+            count_, subtrees_ = data[name_end + 1:line_end].split(b' ')
+            count = int(count_)
+            name = data[pos:name_end].decode()
+            pos = line_end + 1
+
+            sha: Optional[str] = None
+            if count >= 0:
+                sha = data[pos:pos + 20].hex()
+                pos += 20
+
+            while stack and not stack[-1][1]:
+                stack.pop()
+
+            prefix = ''
+            if stack:
+                parent, left = stack[-1]
+                stack[-1] = (parent, left - 1)
+                prefix = parent + name + '/'
+
+            res[prefix] = (count, sha)
+            stack.append((prefix, int(subtrees_)))
+
+        return res
+
+    def set_cache_tree(self, nodes: dict[str, tuple[int, Optional[str]]]) -> None:
+        # `nodes` as returned by cache_tree(), parents before their children
+        data = format_cache_tree(nodes)
+        self.extensions = [elm for elm in self.extensions if elm[0] != EXTENSION_CACHE_TREE]
+        self.extensions.insert(0, (EXTENSION_CACHE_TREE, data))
+
+
+def format_cache_tree(nodes: dict[str, tuple[int, Optional[str]]]) -> bytes:
+    subtrees: dict[str, int] = {}
+    for prefix in nodes:
+        if prefix:
+            parent = prefix[:-1].rpartition('/')[0]
+            parent = parent + '/' if parent else ''
+            subtrees[parent] = subtrees.get(parent, 0) + 1
+
+    res = bytearray()
+    for prefix, (count, sha) in nodes.items():
+        name = prefix[:-1].rpartition('/')[2]
+        res += f'{name}\x00{count} {subtrees.get(prefix, 0)}\n'.encode()
+        if count >= 0 and sha:
+            res += bytes.fromhex(sha)
+
+    return bytes(res)
+
+
+def write_tree(index: Index, writer: git_object.ObjectWriter) -> str:
+    # Writes the trees for the (sorted) entries bottom-up and returns the
+    # top tree.  A directory whose cache-tree node is still valid is taken
+    # as is; the cache tree is then rebuilt to cover every directory.
+    if any(entry.stage for entry in index.entries):
+        raise Exception('Cannot write a tree from an index with unmerged entries')
+
+    entries = index.entries
+    paths = [entry.path for entry in entries]
+    old_nodes = index.cache_tree()
+    old_prefixes = list(old_nodes)
+    old_positions = {prefix: pos for pos, prefix in enumerate(old_prefixes)}
+    nodes: dict[str, tuple[int, Optional[str]]] = {}
+
+    def build(prefix: str, lo: int, hi: int) -> str:
+        cached = old_nodes.get(prefix)
+        if cached and cached[1] and cached[0] == hi - lo:
+            # the node and its descendants follow each other in the old tree
+            pos = old_positions[prefix]
+            for old_prefix in itertools.takewhile(lambda elm: elm.startswith(prefix), old_prefixes[pos:]):
+                nodes[old_prefix] = old_nodes[old_prefix]
+            return cached[1]
+
+        nodes[prefix] = (-1, None)
+        items: list[types.GitObjectTreeItem] = []
+        i = lo
+
+        # index order is tree order: a directory sorts where `name/` would
+        while i < hi:
+            name, sep, _ = paths[i][len(prefix):].partition('/')
+            if sep:
+                end = bisect.bisect_left(paths, prefix + name + '0', i, hi)
+                items.append(types.GitObjectTreeItem('040000', name, build(prefix + name + '/', i, end)))
+                i = end
+            else:
+                items.append(types.GitObjectTreeItem(f'{entries[i].mode:06o}', name, entries[i].sha))
+                i += 1
+
+        sha = writer.write_object(types.GitObjectTree(items=items))
+        nodes[prefix] = (hi - lo, sha)
+
+        return sha
+
+    sha = build('', 0, len(entries))
+    index.set_cache_tree(nodes)
+
+    return sha
+
+
+def index_path(gitdir: pathlib.Path) -> pathlib.Path:
+    return gitdir / 'index'
+
+
+def read_varint(mm: mmap.mmap, pos: int) -> tuple[int, int]:
+    # the OFS_DELTA encoding: each continuation adds 1 before shifting
+    c = mm[pos]
+    value = c & 0x7f
+    pos += 1
+
+    while c & 0x80:
+        c = mm[pos]
+        value = ((value + 1) << 7) | (c & 0x7f)
+        pos += 1
+
+    return value, pos
+
+
+def read(path: pathlib.Path) -> Index:
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return Index(path)
+
+    mm = pack.mmap_file(path)
+    try:
+        return parse(path, mm, mtime_ns)
+    finally:
+        mm.close()
+
+
+def parse(path: pathlib.Path, mm: mmap.mmap, mtime_ns: int) -> Index:
+    if len(mm) < HEADER.size + 20:
+        raise Exception(f'Truncated index: {path}')
+
+    signature, version, count = HEADER.unpack_from(mm, 0)
+    if signature != SIGNATURE or version not in SUPPORTED_VERSIONS:
+        raise Exception(f'Unsupported index: {path}')
+
+    # an all-zero trailer means the checksum was skipped (index.skipHash)
+    end = len(mm) - 20
+    trailer = mm[end:]
+    if trailer != bytes(20):
+        with memoryview(mm) as view:
+            if hashlib.sha1(view[:end]).digest() != trailer:
+                raise Exception(f'Index checksum mismatch: {path}')
+
+    entries: list[IndexEntry] = []
+    append = entries.append
+    unpack = ENTRY.unpack_from
+    find = mm.find
+    new_entry = IndexEntry
+    prev = b''
+    pos = HEADER.size
+
+    for _ in range(count):
+        values = unpack(mm, pos)
+        flags = values[11]
+        name_pos = pos + ENTRY.size
+
+        extended_flags = 0
+        if flags & FLAG_EXTENDED:
+            if version < 3:
+                raise Exception(f'Extended flags in a version {version} index: {path}')
+            extended_flags, = EXTENDED_FLAGS.unpack_from(mm, name_pos)
+            name_pos += EXTENDED_FLAGS.size
+
+        if version == 4:
+            # the name is stored as the number of bytes to drop from the end
+            # of the previous name, followed by the NUL-terminated remainder
+            strip, name_pos = read_varint(mm, name_pos)
+            name_end = find(b'\x00', name_pos)
+            name = prev[:len(prev) - strip] + mm[name_pos:name_end]
+            prev = name
+            pos = name_end + 1
+        else:
+            length = flags & NAME_MASK
+            name_end = find(b'\x00', name_pos + length) if length == NAME_MASK else name_pos + length
+            name = mm[name_pos:name_end]
+            # 1-8 NULs pad each entry to a multiple of 8 bytes
+            pos += (name_end - pos + 8) & ~7
+
+        if name_end < 0 or pos > end:
+            raise Exception(f'Truncated index: {path}')
+
+        append(new_entry(name.decode(), values[10].hex(), values[:10], flags, extended_flags))
+
+    extensions: list[tuple[bytes, bytes]] = []
+    while pos + EXTENSION_HEADER.size <= end:
+        signature, size = EXTENSION_HEADER.unpack_from(mm, pos)
+        pos += EXTENSION_HEADER.size
+        if pos + size > end:
+            raise Exception(f'Truncated index extension {signature!r}: {path}')
+
+        if signature in KEPT_EXTENSIONS:
+            extensions.append((signature, mm[pos:pos + size]))
+        elif not b'A' <= signature[:1] <= b'Z':
+            # only extensions starting with an upper-case letter are optional
+            raise Exception(f'Unsupported index extension {signature.decode(errors="replace")}: {path}')
+
+        pos += size
+
+    return Index(path, version, entries, extensions, mtime_ns)
+
+
+def serialize(index: Index) -> bytes:
+    version = index.version
+    if version == 2 and any(entry.extended_flags for entry in index.entries):
+        version = 3
+
+    res = bytearray(HEADER.pack(SIGNATURE, version, len(index.entries)))
+    pack_entry = ENTRY.pack
+    prev = b''
+
+    for entry in index.entries:
+        name = entry.path.encode()
+        flags = (entry.flags & ~(NAME_MASK | FLAG_EXTENDED)) | min(len(name), NAME_MASK)
+        if entry.extended_flags:
+            flags |= FLAG_EXTENDED
+
+        res += pack_entry(*entry.stat, bytes.fromhex(entry.sha), flags)
+        size = ENTRY.size
+        if entry.extended_flags:
+            res += EXTENDED_FLAGS.pack(entry.extended_flags)
+            size += EXTENDED_FLAGS.size
+
+        if version == 4:
+            common = len(os.path.commonprefix([prev, name]))
+            res += pack.encode_ofs_distance(len(prev) - common)
+            res += name[common:]
+            res += b'\x00'
+            prev = name
+        else:
+            size += len(name)
+            res += name
+            res += bytes(8 - size % 8)
+
+    for signature, data in index.extensions:
+        res += EXTENSION_HEADER.pack(signature, len(data))
+        res += data
+
+    res += hashlib.sha1(res).digest()
+
+    return bytes(res)
+
+
+def write(index: Index) -> None:
+    lock = refs.LockFile(index.path)
+    try:
+        lock.write(serialize(index))
+        lock.commit()
+    except BaseException:
+        lock.rollback()
+        raise
+
+    index.mtime_ns = index.path.stat().st_mtime_ns
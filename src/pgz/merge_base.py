@@ -0,0 +1,182 @@
+import heapq
+from typing import Optional
+
+from . import commit_graph
+from . import repository
+from . import types
+
+
+PARENT1 = 1
+PARENT2 = 2
+STALE = 4
+RESULT = 8
+
+# the generation of a commit the commit-graph does not know; such commits
+# are walked first and never cut a walk short
+GENERATION_INFINITY = 0xffffffff
+
+# queries whose answers are kept per Repository, see Repository.ancestry
+ANCESTRY_CACHE_SIZE = 4096
+
+# generation, commit time, parents
+CommitInfo = tuple[int, int, list[str]]
+
+
+class Painter:
+    # The paint-down walk of git's merge-base: the commits of `one` side are
+    # painted PARENT1, those of the other PARENT2, and a commit carrying both
+    # is a common ancestor whose own ancestors are then painted STALE.  When
+    # looking for one commit, the queue pops by generation (then commit
+    # time), so once it is below that commit's generation nothing left can
+    # reach it and the rest is left unwalked.
+    __slots__ = ('repo', 'graph', 'infos')
+
+    def __init__(self, repo: repository.Repository) -> None:
+        self.repo = repo
+        self.graph = commit_graph.load(repo.gitdir)
+        self.infos: dict[str, CommitInfo] = {}
+
+    def info(self, sha: str) -> CommitInfo:
+        res = self.infos.get(sha)
+        if res is not None:
+            return res
+
+        pos = self.graph.find(bytes.fromhex(sha)) if self.graph else None
+        if self.graph and pos is not None:
+            generation, commit_time = self.graph.generation_and_time(pos)
+            res = (generation or GENERATION_INFINITY, commit_time, self.graph.parents(pos))
+        else:
+            commit = self.repo.read_object(sha)
+            if not isinstance(commit, types.GitObjectCommit):
+                raise Exception(f'Not a commit: {sha}')
+            res = (GENERATION_INFINITY, commit.commit_time, commit.parents)
+
+        self.infos[sha] = res
+
+        return res
+
+    def generation(self, sha: str) -> int:
+        return self.info(sha)[0]
+
+    def paint(self, one: str, twos: list[str], min_generation: int = 0) -> tuple[list[str], dict[str, int]]:
+        # the common ancestors found (newest first) and the paint of every
+        # commit walked
+        flags: dict[str, int] = {one: PARENT1}
+        for two in twos:
+            flags[two] = flags.get(two, 0) | PARENT2
+
+        # newest first, but by generation first when there is a cut-off;
+        # ties pop in the order they were pushed, as in git
+        queue: list[tuple[int, int, int, str]] = []
+        # queue entries per commit, and how many entries are not STALE; the
+        # walk ends once only STALE ones are left
+        queued: dict[str, int] = {}
+        active = 0
+        pushed = 0
+
+        def push(sha: str) -> None:
+            nonlocal active, pushed
+            generation, commit_time, _ = self.info(sha)
+            heapq.heappush(queue, (-generation if min_generation else 0, -commit_time, pushed, sha))
+            pushed += 1
+            queued[sha] = queued.get(sha, 0) + 1
+            if not flags[sha] & STALE:
+                active += 1
+
+        for sha in flags:
+            push(sha)
+
+        found: list[tuple[int, str]] = []
+        while active:
+            _, neg_time, _, sha = heapq.heappop(queue)
+            queued[sha] -= 1
+            paint = flags[sha]
+            if not paint & STALE:
+                active -= 1
+            if self.generation(sha) < min_generation:
+                break
+
+            paint &= PARENT1 | PARENT2 | STALE
+            if paint == PARENT1 | PARENT2:
+                if not flags[sha] & RESULT:
+                    flags[sha] |= RESULT
+                    found.append((neg_time, sha))
+                paint |= STALE
+
+            for parent in self.info(sha)[2]:
+                painted = flags.get(parent, 0)
+                if painted & paint == paint:
+                    continue
+                if paint & STALE and not painted & STALE:
+                    active -= queued.get(parent, 0)
+                flags[parent] = painted | paint
+                push(parent)
+
+        found.sort(key=lambda elm: elm[0])
+
+        return [sha for _, sha in found], flags
+
+    def is_ancestor(self, ancestor: str, descendants: list[str]) -> bool:
+        if ancestor in descendants:
+            return True
+
+        # an ancestor's generation is below that of each of its descendants,
+        # so there is nothing to walk when it is not below any of them
+        generation = self.generation(ancestor)
+        if generation != GENERATION_INFINITY and all(generation >= self.generation(sha) for sha in descendants):
+            return False
+
+        _, flags = self.paint(ancestor, descendants, generation if generation != GENERATION_INFINITY else 0)
+
+        return bool(flags[ancestor] & PARENT2)
+
+    def merge_bases(self, one: str, twos: list[str]) -> list[str]:
+        if one in twos:
+            return [one]
+
+        found, flags = self.paint(one, twos)
+        # a base painted STALE later on is an ancestor of another base
+        bases = [sha for sha in found if not flags[sha] & STALE]
+        if len(bases) < 2:
+            return bases
+
+        return [
+            sha for i, sha in enumerate(bases)
+            if not self.is_ancestor(sha, bases[:i] + bases[i + 1:])
+        ]
+
+
+def remember(repo: repository.Repository, key: tuple[str, ...], value: tuple[str, ...]) -> None:
+    repo.ancestry[key] = value
+    if len(repo.ancestry) > ANCESTRY_CACHE_SIZE:
+        repo.ancestry.popitem(last=False)
+
+
+def recall(repo: repository.Repository, key: tuple[str, ...]) -> Optional[tuple[str, ...]]:
+    res = repo.ancestry.get(key)
+    if res is not None:
+        repo.ancestry.move_to_end(key)
+
+    return res
+
+
+def merge_bases(repo: repository.Repository, one: str, twos: list[str], all_: bool = False) -> list[str]:
+    # the best common ancestors of `one` and (a merge of) `twos`; commits
+    # never change, so answers are kept for the life of the repository
+    key = ('merge-base', one, *sorted(set(twos)))
+    res = recall(repo, key)
+    if res is None:
+        res = tuple(Painter(repo).merge_bases(one, twos))
+        remember(repo, key, res)
+
+    return list(res[:1] if not all_ else res)
+
+
+def is_ancestor(repo: repository.Repository, ancestor: str, descendant: str) -> bool:
+    key = ('is-ancestor', ancestor, descendant)
+    res = recall(repo, key)
+    if res is None:
+        res = (descendant,) if Painter(repo).is_ancestor(ancestor, [descendant]) else ()
+        remember(repo, key, res)
+
+    return bool(res)
@@ -0,0 +1,102 @@
+import bisect
+import pathlib
+from typing import Optional
+
+from . import pack
+
+
+MIN_ABBREV = 4
+HEX_DIGITS = frozenset('0123456789abcdef')
+
+
+class AmbiguousObjectName(Exception):
+    pass
+
+
+def is_hex(name: str) -> bool:
+    return bool(name) and all(c in HEX_DIGITS for c in name)
+
+
+class ObjectNameIndex:
+    # Sorted object names for prefix lookups.  Pack indexes are already
+    # sorted, so they are binary-searched in place; loose names are listed
+    # one fanout directory (objects/xx) at a time on first use and kept
+    # until that directory's mtime changes.
+    __slots__ = ('gitdir', 'loose')
+
+    def __init__(self, gitdir: pathlib.Path) -> None:
+        self.gitdir = gitdir
+        self.loose: dict[str, tuple[int, list[bytes]]] = {}
+
+    def loose_names(self, fanout: str) -> list[bytes]:
+        path = self.gitdir / 'objects' / fanout
+
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return []
+
+        cached = self.loose.get(fanout)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        names = sorted(
+            bytes.fromhex(fanout + child.name)
+            for child in path.iterdir()
+            if len(child.name) == 38 and is_hex(child.name)
+        )
+        self.loose[fanout] = (mtime, names)
+
+        return names
+
+    def matches(self, prefix: str, limit: int = 2) -> list[str]:
+        # up to `limit` distinct object names starting with `prefix`
+        prefix = prefix.lower()
+        if len(prefix) < 2 or len(prefix) > 40 or not is_hex(prefix):
+            return []
+
+        low = bytes.fromhex(prefix.ljust(40, '0'))
+        res: set[bytes] = set()
+
+        for p in pack.packs(self.gitdir):
+            index = p.index
+            pos = index.lower_bound(low)
+            for pos in range(pos, min(pos + limit, index.count)):
+                sha = index.sha_at(pos)
+                if not sha.hex().startswith(prefix):
+                    break
+                res.add(sha)
+
+        names = self.loose_names(prefix[:2])
+        pos = bisect.bisect_left(names, low)
+        for sha in names[pos:pos + limit]:
+            if not sha.hex().startswith(prefix):
+                break
+            res.add(sha)
+
+        return [sha.hex() for sha in sorted(res)[:limit]]
+
+    def resolve(self, prefix: str) -> Optional[str]:
+        if len(prefix) < MIN_ABBREV:
+            return None
+
+        found = self.matches(prefix)
+        if len(found) > 1:
+            raise AmbiguousObjectName(f'Short object ID {prefix} is ambiguous')
+
+        return found[0] if found else None
+
+
+_indexes: dict[pathlib.Path, ObjectNameIndex] = {}
+
+
+def index(gitdir: pathlib.Path) -> ObjectNameIndex:
+    res = _indexes.get(gitdir)
+    if not res:
+        res = _indexes[gitdir] = ObjectNameIndex(gitdir)
+
+    return res
+
+
+def resolve_prefix(gitdir: pathlib.Path, prefix: str) -> Optional[str]:
+    return index(gitdir).resolve(prefix)
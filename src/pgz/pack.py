@@ -0,0 +1,798 @@
+import array
+import collections
+import hashlib
+import mmap
+import os
+import pathlib
+import struct
+import sys
+import tempfile
+import threading
+from types import TracebackType
+from typing import BinaryIO, Callable, Optional
+import zlib
+
+from . import delta
+from . import lib
+from . import types
+
+
+PACK_SIGNATURE = b'PACK'
+IDX_SIGNATURE = b'\377tOc'
+RIDX_SIGNATURE = b'RIDX'
+
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+TYPE_MAPPING = {
+    OBJ_COMMIT: types.GitObjectTypeEnum.COMMIT,
+    OBJ_TREE: types.GitObjectTypeEnum.TREE,
+    OBJ_BLOB: types.GitObjectTypeEnum.BLOB,
+    OBJ_TAG: types.GitObjectTypeEnum.TAG,
+}
+TYPE_NUMS = {type_: type_num for type_num, type_ in TYPE_MAPPING.items()}
+
+INFLATE_CHUNK_SIZE = 64 * 1024
+PEEK_CHUNK_SIZE = 64
+STREAM_READ_SIZE = 1024 * 1024
+# small, since what a chunk holds past the end of an entry is copied back
+STREAM_INFLATE_CHUNK_SIZE = 8 * 1024
+DEFAULT_DELTA_BASE_CACHE_SIZE = 96 * 1024 * 1024  # same as core.deltaBaseCacheLimit
+
+CacheKey = tuple[pathlib.Path, int]
+PackedObject = tuple[types.GitObjectTypeEnum, bytes]
+PackedHeader = tuple[types.GitObjectTypeEnum, int]
+
+
+class DeltaBaseCache:
+    # shared by concurrent readers (see git_object.read_many), hence the lock
+    __slots__ = ('max_bytes', 'size', 'entries', 'hits', 'misses', 'evictions', 'lock')
+
+    def __init__(self, max_bytes: int = DEFAULT_DELTA_BASE_CACHE_SIZE) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: collections.OrderedDict[CacheKey, PackedObject] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> Optional[PackedObject]:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+            return value
+
+    def put(self, key: CacheKey, value: PackedObject) -> None:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+
+            size = len(value[1])
+            if size > self.max_bytes:
+                return
+
+            self.entries[key] = value
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'size': self.size,
+            'max_bytes': self.max_bytes,
+        }
+
+
+delta_base_cache = DeltaBaseCache()
+
+
+def mmap_file(path: pathlib.Path) -> mmap.mmap:
+    with path.open('rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class PackIndex:
+    # v2 layout: header, 256 fanout entries, sorted SHAs, CRC32s,
+    # 32-bit offsets, 64-bit offsets (for entries with the MSB set), trailer.
+    __slots__ = ('path', 'mm', 'fanout', 'count', 'sha_start', 'crc_start', 'offset_start', 'offset64_start')
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.mm = mmap_file(path)
+
+        if self.mm[:4] != IDX_SIGNATURE:
+            raise Exception(f'Unsupported pack index: {path}')
+
+        version, = struct.unpack_from('>I', self.mm, 4)
+        if version != 2:
+            raise Exception(f'Unsupported pack index version {version}: {path}')
+
+        self.fanout = struct.unpack_from('>256I', self.mm, 8)
+        self.count = self.fanout[255]
+        self.sha_start = 8 + 256 * 4
+        self.crc_start = self.sha_start + 20 * self.count
+        self.offset_start = self.crc_start + 4 * self.count
+        self.offset64_start = self.offset_start + 4 * self.count
+
+    def sha_at(self, pos: int) -> bytes:
+        start = self.sha_start + 20 * pos
+        return self.mm[start:start + 20]
+
+    def offset_at(self, pos: int) -> int:
+        offset, = struct.unpack_from('>I', self.mm, self.offset_start + 4 * pos)
+        if offset & 0x80000000:
+            offset, = struct.unpack_from('>Q', self.mm, self.offset64_start + 8 * (offset & 0x7fffffff))
+
+        return offset
+
+    def find(self, sha: bytes) -> Optional[int]:
+        lo = self.fanout[sha[0] - 1] if sha[0] else 0
+        hi = self.fanout[sha[0]]
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_sha = self.sha_at(mid)
+            if mid_sha < sha:
+                lo = mid + 1
+            elif mid_sha > sha:
+                hi = mid
+            else:
+                return mid
+
+        return None
+
+    def lower_bound(self, sha: bytes) -> int:
+        # position of the first entry >= `sha`
+        lo = self.fanout[sha[0] - 1] if sha[0] else 0
+        hi = self.fanout[sha[0]]
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.sha_at(mid) < sha:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+class Pack:
+    __slots__ = ('path', 'index', 'mm')
+
+    def __init__(self, idx_path: pathlib.Path) -> None:
+        self.path = idx_path.with_suffix('.pack')
+        self.index = PackIndex(idx_path)
+        self.mm = mmap_file(self.path)
+
+        if self.mm[:4] != PACK_SIGNATURE:
+            raise Exception(f'Unsupported pack: {self.path}')
+
+        version, = struct.unpack_from('>I', self.mm, 4)
+        if version not in (2, 3):
+            raise Exception(f'Unsupported pack version {version}: {self.path}')
+
+    def offset_of(self, sha: bytes) -> Optional[int]:
+        pos = self.index.find(sha)
+        if pos is None:
+            return None
+
+        return self.index.offset_at(pos)
+
+    def entry_header(self, offset: int) -> tuple[int, int, int]:
+        # type and size are packed into a little-endian varint whose first
+        # byte also carries 3 type bits.
+        mm = self.mm
+        c = mm[offset]
+        type_num = (c >> 4) & 0x7
+        size = c & 0x0f
+        shift = 4
+        offset += 1
+
+        while c & 0x80:
+            c = mm[offset]
+            size |= (c & 0x7f) << shift
+            shift += 7
+            offset += 1
+
+        return type_num, size, offset
+
+    def inflate(self, offset: int, size: int) -> bytes:
+        # feed the mmap through a memoryview in chunks so that neither the
+        # input slice nor `unconsumed_tail` ever copies the rest of the pack.
+        decompressor = zlib.decompressobj()
+        view = memoryview(self.mm)
+        chunks: list[bytes] = []
+
+        try:
+            while not decompressor.eof:
+                chunk = view[offset:offset + INFLATE_CHUNK_SIZE]
+                if not chunk:
+                    raise Exception(f'Truncated pack entry in {self.path}')
+                chunks.append(decompressor.decompress(chunk))
+                offset += len(chunk)
+        finally:
+            view.release()
+
+        data = b''.join(chunks)
+        if len(data) != size:
+            raise Exception(f'Malformed pack entry in {self.path}: bad length')
+
+        return data
+
+    def inflate_prefix(self, offset: int, size: int) -> bytes:
+        decompressor = zlib.decompressobj()
+        res = b''
+
+        while len(res) < size and not decompressor.eof:
+            chunk = self.mm[offset:offset + PEEK_CHUNK_SIZE]
+            if not chunk:
+                raise Exception(f'Truncated pack entry in {self.path}')
+            res += decompressor.decompress(chunk, size - len(res))
+            offset += len(chunk) - len(decompressor.unconsumed_tail)
+
+        return res
+
+    def ofs_delta_base(self, offset: int, data_offset: int) -> tuple[int, int]:
+        # big-endian varint where each continuation adds 1 before shifting
+        mm = self.mm
+        c = mm[data_offset]
+        distance = c & 0x7f
+        data_offset += 1
+
+        while c & 0x80:
+            c = mm[data_offset]
+            distance = ((distance + 1) << 7) | (c & 0x7f)
+            data_offset += 1
+
+        return offset - distance, data_offset
+
+    def read_at(
+        self,
+        offset: int,
+        lookup: Optional[Callable[[bytes], PackedObject]] = None,
+        cache: DeltaBaseCache = delta_base_cache,
+    ) -> PackedObject:
+        # walk down the delta chain until a full object (or a cached base) is
+        # found, then replay the deltas upwards caching every intermediate base.
+        chain: list[tuple[int, bytes]] = []
+        base_key: Optional[CacheKey] = None
+
+        while True:
+            key = (self.path, offset)
+            cached = cache.get(key)
+            if cached:
+                type_, data = cached
+                break
+
+            type_num, size, data_offset = self.entry_header(offset)
+
+            if type_num == OBJ_OFS_DELTA:
+                base_offset, data_offset = self.ofs_delta_base(offset, data_offset)
+                chain.append((offset, self.inflate(data_offset, size)))
+                offset = base_offset
+                continue
+
+            if type_num == OBJ_REF_DELTA:
+                base_sha = self.mm[data_offset:data_offset + 20]
+                chain.append((offset, self.inflate(data_offset + 20, size)))
+                base_offset = self.offset_of(base_sha)
+                if base_offset is not None:
+                    offset = base_offset
+                    continue
+
+                if not lookup:
+                    raise Exception(f'Missing delta base {base_sha.hex()} for {self.path}')
+                type_, data = lookup(base_sha)
+                break
+
+            type_ = TYPE_MAPPING.get(type_num)
+            if not type_:
+                raise Exception(f'Unsupported pack entry type {type_num} in {self.path}')
+
+            data = self.inflate(data_offset, size)
+            base_key = key
+            break
+
+        if base_key and chain:
+            cache.put(base_key, (type_, data))
+
+        while chain:
+            delta_offset, delta_data = chain.pop()
+            data = delta.apply_delta(data, delta_data)
+            if chain:
+                cache.put((self.path, delta_offset), (type_, data))
+
+        return type_, data
+
+    def read_header_at(
+        self,
+        offset: int,
+        lookup: Optional[Callable[[bytes], PackedHeader]] = None,
+    ) -> PackedHeader:
+        # the size of a deltified object is stored at the start of its delta
+        # and the type is that of the chain's base; neither needs the chain
+        # to be inflated.
+        size: Optional[int] = None
+
+        while True:
+            type_num, entry_size, data_offset = self.entry_header(offset)
+
+            if type_num == OBJ_OFS_DELTA:
+                base_offset, data_offset = self.ofs_delta_base(offset, data_offset)
+                if size is None:
+                    size = self.delta_result_size(data_offset)
+                offset = base_offset
+                continue
+
+            if type_num == OBJ_REF_DELTA:
+                base_sha = self.mm[data_offset:data_offset + 20]
+                if size is None:
+                    size = self.delta_result_size(data_offset + 20)
+                base_offset = self.offset_of(base_sha)
+                if base_offset is not None:
+                    offset = base_offset
+                    continue
+
+                if not lookup:
+                    raise Exception(f'Missing delta base {base_sha.hex()} for {self.path}')
+                return lookup(base_sha)[0], size
+
+            type_ = TYPE_MAPPING.get(type_num)
+            if not type_:
+                raise Exception(f'Unsupported pack entry type {type_num} in {self.path}')
+
+            return type_, entry_size if size is None else size
+
+    def delta_result_size(self, data_offset: int) -> int:
+        # two varints of at most 10 bytes each
+        prefix = self.inflate_prefix(data_offset, 20)
+        _, pos = delta.read_size(prefix, 0)
+
+        return delta.read_size(prefix, pos)[0]
+
+    def close(self) -> None:
+        self.index.close()
+        self.mm.close()
+
+
+_packs: dict[pathlib.Path, tuple[int, list[Pack]]] = {}
+# packs() is called from the reader threads of git_object.read_many
+_packs_lock = threading.Lock()
+
+
+def packs(gitdir: pathlib.Path) -> list[Pack]:
+    pack_dir = gitdir / 'objects' / 'pack'
+
+    try:
+        mtime = pack_dir.stat().st_mtime_ns
+    except FileNotFoundError:
+        return []
+
+    cached = _packs.get(pack_dir)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with _packs_lock:
+        cached = _packs.get(pack_dir)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        # packs that went away are not closed here: another thread may still
+        # be reading one, and its maps are released once it is unreferenced
+        known = {pack.index.path: pack for pack in cached[1]} if cached else {}
+        res: list[Pack] = []
+        for idx_path in sorted(pack_dir.glob('pack-*.idx')):
+            if not idx_path.with_suffix('.pack').exists():
+                continue
+            res.append(known.pop(idx_path, None) or Pack(idx_path))
+
+        _packs[pack_dir] = (mtime, res)
+
+    return res
+
+
+def find(gitdir: pathlib.Path, binsha: bytes) -> Optional[tuple[Pack, int]]:
+    for pack in packs(gitdir):
+        offset = pack.offset_of(binsha)
+        if offset is not None:
+            return pack, offset
+
+    return None
+
+
+def read(
+    gitdir: pathlib.Path,
+    sha: str,
+    lookup: Optional[Callable[[bytes], PackedObject]] = None,
+) -> Optional[PackedObject]:
+    if len(sha) != 40:
+        return None
+
+    found = find(gitdir, bytes.fromhex(sha))
+    if not found:
+        return None
+
+    pack, offset = found
+
+    return pack.read_at(offset, lookup)
+
+
+def read_header(
+    gitdir: pathlib.Path,
+    sha: str,
+    lookup: Optional[Callable[[bytes], PackedHeader]] = None,
+) -> Optional[PackedHeader]:
+    if len(sha) != 40:
+        return None
+
+    found = find(gitdir, bytes.fromhex(sha))
+    if not found:
+        return None
+
+    pack, offset = found
+
+    return pack.read_header_at(offset, lookup)
+
+
+def reverse_index(pack: Pack) -> 'array.array[int]':
+    # index positions in pack order (by offset), from the pack's `.rev` file
+    # when there is a valid one
+    count = pack.index.count
+    try:
+        data = pack.path.with_suffix('.rev').read_bytes()
+    except FileNotFoundError:
+        data = b''
+
+    res = array.array('I')
+    if data[:12] == RIDX_SIGNATURE + struct.pack('>II', 1, 1) and len(data) == 12 + 4 * count + 40:
+        res.frombytes(data[12:12 + 4 * count])
+        if sys.byteorder == 'little':
+            res.byteswap()
+        return res
+
+    offsets = [pack.index.offset_at(pos) for pos in range(count)]
+    res.extend(sorted(range(count), key=offsets.__getitem__))
+
+    return res
+
+
+def write_reverse_index(pack: Pack, order: 'array.array[int]') -> pathlib.Path:
+    # `.rev` v1: header, index positions in pack order, pack checksum, trailer
+    data = array.array('I', order)
+    if sys.byteorder == 'little':
+        data.byteswap()
+
+    body = RIDX_SIGNATURE + struct.pack('>II', 1, 1) + data.tobytes() + pack.mm[-20:]
+    path = pack.path.with_suffix('.rev')
+    with tempfile.NamedTemporaryFile(prefix='tmp_rev_', dir=path.parent, delete=False) as f:
+        f.write(body + hashlib.sha1(body).digest())
+
+    os.chmod(f.name, 0o444)
+    pathlib.Path(f.name).replace(path)
+
+    return path
+
+
+def encode_entry_header(type_num: int, size: int) -> bytes:
+    res = bytearray()
+    c = (type_num << 4) | (size & 0x0f)
+    size >>= 4
+
+    while size:
+        res.append(c | 0x80)
+        c = size & 0x7f
+        size >>= 7
+
+    res.append(c)
+
+    return bytes(res)
+
+
+def encode_ofs_distance(distance: int) -> bytes:
+    res = bytearray([distance & 0x7f])
+    distance >>= 7
+
+    while distance:
+        distance -= 1
+        res.append(0x80 | (distance & 0x7f))
+        distance >>= 7
+
+    res.reverse()
+
+    return bytes(res)
+
+
+def write_index(
+    path: pathlib.Path,
+    entries: dict[bytes, tuple[int, int]],
+    pack_checksum: bytes,
+) -> None:
+    shas = sorted(entries)
+
+    fanout = [0] * 256
+    for sha in shas:
+        fanout[sha[0]] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+
+    offsets = bytearray()
+    offsets64 = bytearray()
+    for sha in shas:
+        offset = entries[sha][0]
+        if offset < 0x80000000:
+            offsets += struct.pack('>I', offset)
+        else:
+            offsets += struct.pack('>I', 0x80000000 | (len(offsets64) // 8))
+            offsets64 += struct.pack('>Q', offset)
+
+    checksum = hashlib.sha1()
+    with path.open('wb') as f:
+        for part in (
+            IDX_SIGNATURE + struct.pack('>I', 2),
+            struct.pack('>256I', *fanout),
+            b''.join(shas),
+            b''.join(struct.pack('>I', entries[sha][1]) for sha in shas),
+            offsets,
+            offsets64,
+            pack_checksum,
+        ):
+            checksum.update(part)
+            f.write(part)
+
+        f.write(checksum.digest())
+
+
+class PackWriter:
+    # Objects are appended as they come; the object count in the header is
+    # patched and the trailer checksum computed in `finish`.
+    __slots__ = ('pack_dir', 'tmp_path', 'f', 'offset', 'entries')
+
+    def __init__(self, gitdir: pathlib.Path) -> None:
+        self.pack_dir = lib.get_or_create_repo_dir(gitdir, 'objects/pack')
+        fd, tmp_path = tempfile.mkstemp(prefix='tmp_pack_', dir=self.pack_dir)
+        self.tmp_path = pathlib.Path(tmp_path)
+        self.f = os.fdopen(fd, 'w+b')
+        self.f.write(PACK_SIGNATURE + struct.pack('>II', 2, 0))
+        self.offset = 12
+        self.entries: dict[bytes, tuple[int, int]] = {}
+
+    def __enter__(self) -> 'PackWriter':
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if exc_type:
+            self.abort()
+
+    def __contains__(self, sha: str) -> bool:
+        return bytes.fromhex(sha) in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def write_entry(self, sha: str, header: bytes, data: bytes) -> None:
+        binsha = bytes.fromhex(sha)
+        if binsha in self.entries:
+            return
+
+        raw = header + zlib.compress(data)
+        self.f.write(raw)
+        self.entries[binsha] = (self.offset, zlib.crc32(raw))
+        self.offset += len(raw)
+
+    def add(self, sha: str, type_: types.GitObjectTypeEnum, data: bytes) -> None:
+        self.write_entry(sha, encode_entry_header(TYPE_NUMS[type_], len(data)), data)
+
+    def add_delta(self, sha: str, base_sha: str, delta_data: bytes) -> None:
+        base = self.entries.get(bytes.fromhex(base_sha))
+        if not base:
+            raise Exception(f'Delta base {base_sha} must be written before {sha}')
+
+        header = encode_entry_header(OBJ_OFS_DELTA, len(delta_data)) + encode_ofs_distance(self.offset - base[0])
+        self.write_entry(sha, header, delta_data)
+
+    def read(self, sha: str) -> Optional[PackedObject]:
+        # reads back a whole (non-delta) object written earlier, e.g. a tree
+        # that fast-import has to modify again
+        entry = self.entries.get(bytes.fromhex(sha))
+        if not entry:
+            return None
+
+        f = self.f
+        f.seek(entry[0])
+        c = f.read(1)[0]
+        type_num = (c >> 4) & 0x7
+        while c & 0x80:
+            c = f.read(1)[0]
+
+        if type_num not in TYPE_MAPPING:
+            raise Exception(f'Cannot read back delta {sha} from the pack being written')
+
+        decompressor = zlib.decompressobj()
+        chunks: list[bytes] = []
+        while not decompressor.eof:
+            chunk = f.read(INFLATE_CHUNK_SIZE)
+            if not chunk:
+                raise Exception(f'Truncated pack entry for {sha}')
+            chunks.append(decompressor.decompress(chunk))
+
+        f.seek(self.offset)
+
+        return TYPE_MAPPING[type_num], b''.join(chunks)
+
+    def finish(self) -> Optional[pathlib.Path]:
+        if not self.entries:
+            self.abort()
+            return None
+
+        f = self.f
+        f.seek(8)
+        f.write(struct.pack('>I', len(self.entries)))
+        f.seek(0)
+
+        checksum = hashlib.sha1()
+        while chunk := f.read(INFLATE_CHUNK_SIZE):
+            checksum.update(chunk)
+        pack_checksum = checksum.digest()
+
+        f.write(pack_checksum)
+        f.close()
+
+        name = f'pack-{pack_checksum.hex()}'
+        idx_tmp_path = self.tmp_path.with_name(self.tmp_path.name + '.idx')
+        write_index(idx_tmp_path, self.entries, pack_checksum)
+
+        idx_path = self.pack_dir / f'{name}.idx'
+        self.tmp_path.rename(self.pack_dir / f'{name}.pack')
+        idx_tmp_path.rename(idx_path)
+
+        return idx_path
+
+    def abort(self) -> None:
+        self.f.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class PackStream:
+    # Reads a pack front to back from a file that cannot seek, e.g. a pipe.
+    # Only a window of the input is buffered; the offset of the next entry
+    # is tracked and everything consumed is hashed for the trailer checksum.
+    __slots__ = ('f', 'path', 'buf', 'pos', 'start', 'checksum')
+
+    def __init__(self, f: BinaryIO, path: pathlib.Path) -> None:
+        self.f = f
+        self.path = path
+        self.buf = b''
+        self.pos = 0
+        # offset of `buf` in the pack
+        self.start = 0
+        self.checksum = hashlib.sha1()
+
+    @property
+    def offset(self) -> int:
+        return self.start + self.pos
+
+    def fill(self, n: int) -> None:
+        # at least `n` unread bytes in the buffer
+        if len(self.buf) - self.pos >= n:
+            return
+
+        self.checksum.update(memoryview(self.buf)[:self.pos])
+        self.start += self.pos
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+
+        while len(self.buf) < n:
+            chunk = self.f.read(max(n - len(self.buf), STREAM_READ_SIZE))
+            if not chunk:
+                raise Exception(f'Truncated pack: {self.path}')
+            self.buf += chunk
+
+    def read(self, n: int) -> bytes:
+        self.fill(n)
+        res = self.buf[self.pos:self.pos + n]
+        self.pos += n
+
+        return res
+
+    def read_byte(self) -> int:
+        self.fill(1)
+        c = self.buf[self.pos]
+        self.pos += 1
+
+        return c
+
+    def read_header(self) -> int:
+        # the number of entries
+        header = self.read(12)
+        if header[:4] != PACK_SIGNATURE:
+            raise Exception(f'Unsupported pack: {self.path}')
+
+        version, count = struct.unpack_from('>II', header, 4)
+        if version not in (2, 3):
+            raise Exception(f'Unsupported pack version {version}: {self.path}')
+
+        return count
+
+    def entry_header(self) -> tuple[int, int]:
+        # see Pack.entry_header
+        c = self.read_byte()
+        type_num = (c >> 4) & 0x7
+        size = c & 0x0f
+        shift = 4
+
+        while c & 0x80:
+            c = self.read_byte()
+            size |= (c & 0x7f) << shift
+            shift += 7
+
+        return type_num, size
+
+    def ofs_distance(self) -> int:
+        # see Pack.ofs_delta_base
+        c = self.read_byte()
+        distance = c & 0x7f
+
+        while c & 0x80:
+            c = self.read_byte()
+            distance = ((distance + 1) << 7) | (c & 0x7f)
+
+        return distance
+
+    def inflate(self, size: int) -> bytes:
+        decompressor = zlib.decompressobj()
+        chunks: list[bytes] = []
+
+        while not decompressor.eof:
+            self.fill(1)
+            end = min(len(self.buf), self.pos + STREAM_INFLATE_CHUNK_SIZE)
+            chunks.append(decompressor.decompress(memoryview(self.buf)[self.pos:end]))
+            self.pos = end - len(decompressor.unused_data)
+
+        data = b''.join(chunks)
+        if len(data) != size:
+            raise Exception(f'Malformed pack entry in {self.path}: bad length')
+
+        return data
+
+    def check_trailer(self) -> None:
+        self.fill(20)
+        self.checksum.update(memoryview(self.buf)[:self.pos])
+        trailer = self.buf[self.pos:self.pos + 20]
+        if trailer != self.checksum.digest():
+            raise Exception(f'Pack checksum mismatch: {self.path}')
+
+        self.start += self.pos + 20
+        self.buf = self.buf[self.pos + 20:]
+        self.pos = 0
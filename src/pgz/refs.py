@@ -0,0 +1,418 @@
+import os
+import pathlib
+from typing import Iterator, Optional
+
+from . import git_object
+from . import types
+
+
+ZERO_SHA = '0' * 40
+PACKED_REFS_HEADER = '# pack-refs with: peeled fully-peeled sorted \n'
+MAX_SYMREF_DEPTH = 10
+
+
+def read_ref_file(path: pathlib.Path | str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+
+
+def parse_packed_refs(text: str) -> tuple[dict[str, str], dict[str, str]]:
+    # `<sha> <name>` lines, each optionally followed by `^<peeled sha>`
+    refs: dict[str, str] = {}
+    peeled: dict[str, str] = {}
+    name = None
+
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+
+        if line.startswith('^'):
+            if name:
+                peeled[name] = line[1:]
+            continue
+
+        sha, _, name = line.partition(' ')
+        refs[name] = sha
+
+    return refs, peeled
+
+
+def peel_object(gitdir: pathlib.Path, sha: str) -> Optional[str]:
+    # the object an annotated tag finally points at, None for non-tags;
+    # only tags are inflated, anything else is recognized from its header
+    peeled = None
+    for _ in range(MAX_SYMREF_DEPTH):
+        try:
+            type_, _ = git_object.read_header(gitdir, sha)
+        except (OSError, ValueError):
+            return peeled
+        if type_ != types.GitObjectTypeEnum.TAG:
+            return peeled
+
+        obj = git_object.from_sha(gitdir, sha)
+        assert isinstance(obj, types.GitObjectTag)
+        sha = peeled = obj.object
+
+    return peeled
+
+
+class LockFile:
+    # `<path>.lock` created with O_EXCL: holding it is holding the ref.
+    # commit() renames it over the target; rollback() just removes it.
+    __slots__ = ('path', 'lock_path', 'fd')
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.lock_path = path.with_name(path.name + '.lock')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            self.fd: Optional[int] = os.open(self.lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            raise Exception(f'Unable to lock {path}: {self.lock_path} exists')
+
+    def write(self, data: str | bytes) -> None:
+        assert self.fd is not None
+        view = memoryview(data.encode() if isinstance(data, str) else data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def commit(self) -> None:
+        self.close()
+        os.replace(self.lock_path, self.path)
+
+    def rollback(self) -> None:
+        self.close()
+        try:
+            os.unlink(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+
+class RefStore:
+    # Merged view of loose refs and packed-refs.  packed-refs is parsed once
+    # and re-read only when its mtime or size changes.  Loose refs are
+    # cached per directory and keyed by the directory's mtime, which changes
+    # whenever a ref in it is created, deleted or replaced by a lock-file
+    # rename (the only way git and pgz write refs).
+    __slots__ = ('gitdir', '_packed', '_loose_dirs')
+
+    def __init__(self, gitdir: pathlib.Path) -> None:
+        self.gitdir = gitdir
+        self._packed: Optional[tuple[tuple[int, int], dict[str, str], dict[str, str]]] = None
+        self._loose_dirs: dict[str, tuple[int, dict[str, str], list[str]]] = {}
+
+    @property
+    def packed_refs_path(self) -> pathlib.Path:
+        return self.gitdir / 'packed-refs'
+
+    def packed(self) -> tuple[dict[str, str], dict[str, str]]:
+        try:
+            st = self.packed_refs_path.stat()
+        except FileNotFoundError:
+            return {}, {}
+
+        key = (st.st_mtime_ns, st.st_size)
+        if not self._packed or self._packed[0] != key:
+            self._packed = (key, *parse_packed_refs(self.packed_refs_path.read_text()))
+
+        return self._packed[1], self._packed[2]
+
+    def loose(self) -> dict[str, str]:
+        res: dict[str, str] = {}
+        stack = ['refs']
+
+        while stack:
+            dirname = stack.pop()
+            path = self.gitdir / dirname
+            try:
+                mtime = path.stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+
+            cached = self._loose_dirs.get(dirname)
+            if not cached or cached[0] != mtime:
+                files: dict[str, str] = {}
+                subdirs: list[str] = []
+                with os.scandir(path) as it:
+                    for entry in it:
+                        name = f'{dirname}/{entry.name}'
+                        if entry.is_dir():
+                            subdirs.append(name)
+                        elif not entry.name.endswith('.lock'):
+                            value = read_ref_file(entry.path)
+                            if value:
+                                files[name] = value
+                cached = self._loose_dirs[dirname] = (mtime, files, subdirs)
+
+            res.update(cached[1])
+            stack.extend(cached[2])
+
+        return res
+
+    def invalidate(self) -> None:
+        self._packed = None
+        self._loose_dirs.clear()
+
+    def read_raw(self, name: str) -> Optional[str]:
+        # the stored value: an object name or `ref: <target>`
+        value = read_ref_file(self.gitdir / name)
+        if value is not None:
+            return value
+
+        return self.packed()[0].get(name)
+
+    def resolve_name(self, name: str) -> tuple[str, Optional[str]]:
+        # follows symbolic refs; returns the final ref name and its value
+        for _ in range(MAX_SYMREF_DEPTH):
+            value = self.read_raw(name)
+            if not value or not value.startswith('ref: '):
+                return name, value
+            name = value[5:]
+
+        raise Exception(f'Symbolic ref loop: {name}')
+
+    def resolve(self, name: str) -> Optional[str]:
+        return self.resolve_name(name)[1]
+
+    def peeled(self, name: str) -> Optional[str]:
+        # the peeled value recorded in packed-refs (only for packed tags)
+        if read_ref_file(self.gitdir / name) is not None:
+            return None
+
+        return self.packed()[1].get(name)
+
+    def refs(self) -> dict[str, str]:
+        # every ref under refs/, symbolic refs resolved, sorted by name
+        merged = dict(self.packed()[0])
+        merged.update(self.loose())
+
+        res: dict[str, str] = {}
+        for name in sorted(merged):
+            value = merged[name]
+            if value.startswith('ref: '):
+                value = self.resolve(name) or ''
+            if value:
+                res[name] = value
+
+        return res
+
+    def transaction(self) -> 'RefTransaction':
+        return RefTransaction(self)
+
+    def pack(self, all_refs: bool = False, prune: bool = True) -> int:
+        # Writes every tag (every ref with `all_refs`) plus whatever was
+        # packed before into packed-refs, with peeled values for annotated
+        # tags, then removes the loose copies that were packed.
+        packed_lock = LockFile(self.packed_refs_path)
+        try:
+            packed, _ = self.packed()
+            loose = {
+                name: value
+                for name, value in self.loose().items()
+                if not value.startswith('ref: ') and (all_refs or name.startswith('refs/tags/') or name in packed)
+            }
+            merged = {**packed, **loose}
+            packed_lock.write(format_packed_refs(self.gitdir, merged, self.packed()[1], set(loose)))
+            packed_lock.commit()
+        except BaseException:
+            packed_lock.rollback()
+            raise
+        finally:
+            self.invalidate()
+
+        if prune:
+            for name, value in loose.items():
+                self.prune_loose(name, value)
+
+        return len(merged)
+
+    def prune_loose(self, name: str, expected: str) -> None:
+        path = self.gitdir / name
+        lock = LockFile(path)
+        try:
+            if read_ref_file(path) == expected:
+                path.unlink()
+                remove_empty_dirs(self.gitdir, path.parent)
+        finally:
+            lock.rollback()
+
+
+def format_packed_refs(
+    gitdir: pathlib.Path,
+    refs: dict[str, str],
+    peeled: dict[str, str],
+    changed: set[str],
+) -> str:
+    lines = [PACKED_REFS_HEADER]
+    # many tags usually point at the same few objects
+    peel_cache: dict[str, Optional[str]] = {}
+
+    for name in sorted(refs):
+        sha = refs[name]
+        lines.append(f'{sha} {name}\n')
+
+        peeled_sha = peeled.get(name) if name not in changed else None
+        if peeled_sha is None and name.startswith('refs/tags/'):
+            if sha not in peel_cache:
+                peel_cache[sha] = peel_object(gitdir, sha)
+            peeled_sha = peel_cache[sha]
+        if peeled_sha:
+            lines.append(f'^{peeled_sha}\n')
+
+    return ''.join(lines)
+
+
+def remove_empty_dirs(gitdir: pathlib.Path, path: pathlib.Path) -> None:
+    # prunes directories left empty by a deleted ref, keeping refs/<kind>/
+    while len(path.relative_to(gitdir).parts) > 2:
+        try:
+            path.rmdir()
+        except OSError:
+            return
+        path = path.parent
+
+
+class RefTransaction:
+    # Queued updates are applied all-or-nothing: every ref is locked first,
+    # old values are checked while the locks are held, and only then are
+    # the lock files renamed into place.  A ref deleted from packed-refs
+    # takes the packed-refs lock as well.
+    __slots__ = ('store', 'updates')
+
+    def __init__(self, store: RefStore) -> None:
+        self.store = store
+        # name, new value (None deletes, '' only verifies), expected old value
+        self.updates: list[tuple[str, Optional[str], Optional[str], bool]] = []
+
+    def update(self, name: str, new: str, old: Optional[str] = None, deref: bool = True) -> None:
+        self.updates.append((name, new, old, deref))
+
+    def create(self, name: str, new: str, deref: bool = True) -> None:
+        self.update(name, new, ZERO_SHA, deref)
+
+    def delete(self, name: str, old: Optional[str] = None, deref: bool = True) -> None:
+        self.updates.append((name, None, old, deref))
+
+    def verify(self, name: str, old: str, deref: bool = True) -> None:
+        self.updates.append((name, '', old, deref))
+
+    def commit(self) -> None:
+        store = self.store
+        gitdir = store.gitdir
+
+        # resolve symbolic refs up front so that locks are taken on the refs
+        # that are actually written
+        updates: dict[str, tuple[Optional[str], Optional[str]]] = {}
+        for name, new, old, deref in self.updates:
+            check_refname(name)
+            target = store.resolve_name(name)[0] if deref else name
+            if target in updates:
+                raise Exception(f'Multiple updates for ref {target} not allowed')
+            updates[target] = (new, old)
+
+        locks: dict[str, LockFile] = {}
+        packed_lock: Optional[LockFile] = None
+        try:
+            for name in sorted(updates):
+                locks[name] = LockFile(gitdir / name)
+
+            deleted = {name for name, (new, _) in updates.items() if new is None}
+            if deleted:
+                packed_lock = LockFile(store.packed_refs_path)
+
+            # refs and packed-refs are read again only now that they are
+            # locked, so that old values are checked against what is there
+            # and a pack-refs that ran meanwhile is not undone by writing
+            # back a stale packed-refs
+            store.invalidate()
+            for name, (new, old) in updates.items():
+                if old is None:
+                    continue
+                current = store.read_raw(name)
+                if old == ZERO_SHA and current is not None:
+                    raise Exception(f'Cannot create {name}: reference already exists')
+                if old != ZERO_SHA and current != old:
+                    raise Exception(f'Cannot update {name}: expected {old}, found {current or "nothing"}')
+
+            if packed_lock:
+                packed, peeled = store.packed()
+                if deleted & packed.keys():
+                    remaining = {name: sha for name, sha in packed.items() if name not in deleted}
+                    packed_lock.write(format_packed_refs(gitdir, remaining, peeled, set()))
+                else:
+                    # nothing to remove from packed-refs
+                    packed_lock.rollback()
+                    packed_lock = None
+
+            for name, (new, _) in updates.items():
+                if new:
+                    locks[name].write(new + '\n')
+
+            # point of no return
+            if packed_lock:
+                packed_lock.commit()
+                packed_lock = None
+            for name, (new, _) in updates.items():
+                if new:
+                    locks[name].commit()
+                elif new is None:
+                    path = gitdir / name
+                    if path.is_file():
+                        path.unlink()
+                        remove_empty_dirs(gitdir, path.parent)
+        finally:
+            if packed_lock:
+                packed_lock.rollback()
+            for lock in locks.values():
+                lock.rollback()
+            store.invalidate()
+
+
+def check_refname(name: str) -> None:
+    parts = name.split('/')
+    if (
+        not name
+        or name.endswith(('/', '.', '.lock'))
+        or any(not part or part.startswith('.') for part in parts)
+        or any(c in name for c in ' ~^:?*[\\\x7f')
+        or any(ord(c) < 0x20 for c in name)
+        or '..' in name
+        or '@{' in name
+    ):
+        raise Exception(f'Invalid ref name: {name}')
+
+    if len(parts) == 1 and not name.isupper():
+        raise Exception(f'Invalid ref name: {name} (refs live under refs/)')
+
+
+_stores: dict[pathlib.Path, RefStore] = {}
+
+
+def store(gitdir: pathlib.Path) -> RefStore:
+    res = _stores.get(gitdir)
+    if not res:
+        res = _stores[gitdir] = RefStore(gitdir)
+
+    return res
+
+
+def read_packed_refs(gitdir: pathlib.Path) -> dict[str, str]:
+    return store(gitdir).packed()[0]
+
+
+def read_ref(gitdir: pathlib.Path, name: str) -> Optional[str]:
+    # follows symbolic refs (`ref: refs/heads/master`) down to an object name
+    return store(gitdir).resolve(name)
+
+
+def iter_refs(gitdir: pathlib.Path) -> Iterator[tuple[str, str]]:
+    yield from store(gitdir).refs().items()
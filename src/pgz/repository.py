@@ -0,0 +1,233 @@
+import collections
+import configparser
+import datetime
+import os
+import pathlib
+import re
+import time
+from typing import Iterable, Optional
+
+from . import git_object
+from . import lib
+from . import pack
+from . import refs
+from . import types
+
+
+DEFAULT_OBJECT_CACHE_SIZE = 64 * 1024 * 1024
+# rough per-object overhead of the Python object itself
+OBJECT_OVERHEAD = 200
+
+# git's internal date format, the only one accepted in GIT_*_DATE
+IDENT_DATE_RE = re.compile(r'^@?[0-9]+ [+-][0-9]{4}$')
+
+
+def object_size(obj: types.GitObject) -> int:
+    if isinstance(obj, types.GitObjectBlob):
+        return len(obj.blob) + OBJECT_OVERHEAD
+
+    raw = getattr(obj, 'raw', None)
+
+    return len(raw or b'') + OBJECT_OVERHEAD
+
+
+class ObjectCache:
+    # memory-bounded LRU of parsed objects keyed by SHA
+    __slots__ = ('max_bytes', 'size', 'entries', 'hits', 'misses', 'evictions')
+
+    def __init__(self, max_bytes: int = DEFAULT_OBJECT_CACHE_SIZE) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: collections.OrderedDict[str, tuple[types.GitObject, int]] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, sha: str) -> Optional[types.GitObject]:
+        entry = self.entries.get(sha)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(sha)
+
+        return entry[0]
+
+    def put(self, sha: str, obj: types.GitObject) -> None:
+        if sha in self.entries:
+            self.entries.move_to_end(sha)
+            return
+
+        # a single huge blob would flush everything else
+        size = object_size(obj)
+        if size > self.max_bytes // 4:
+            return
+
+        self.entries[sha] = (obj, size)
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'size': self.size,
+            'max_bytes': self.max_bytes,
+        }
+
+
+class Repository:
+    # One handle per gitdir, shared by every command and library function
+    # that works on it: the config is parsed once (and again only when the
+    # file changes), refs go through a single RefStore, and parsed objects
+    # are kept in an LRU so repeated reads in a walk skip inflate + parse.
+    # Answers to merge-base and ancestry queries are kept as well, since
+    # the commits they are about can never change.
+    __slots__ = ('gitdir', 'objects', 'ancestry', '_config')
+
+    def __init__(self, gitdir: pathlib.Path, cache_size: int = DEFAULT_OBJECT_CACHE_SIZE) -> None:
+        self.gitdir = gitdir
+        self.objects = ObjectCache(cache_size)
+        # (query, commits...) -> answer, see merge_base.py
+        self.ancestry: collections.OrderedDict[tuple[str, ...], tuple[str, ...]] = collections.OrderedDict()
+        self._config: Optional[tuple[int, configparser.ConfigParser]] = None
+
+    @property
+    def worktree(self) -> pathlib.Path:
+        return self.gitdir.parent
+
+    @property
+    def refs(self) -> refs.RefStore:
+        return refs.store(self.gitdir)
+
+    @property
+    def config(self) -> configparser.ConfigParser:
+        path = self.gitdir / 'config'
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = 0
+
+        if not self._config or self._config[0] != mtime:
+            # git allows repeated keys and sections, configparser does not
+            # by default
+            parser = configparser.ConfigParser(strict=False, interpolation=None)
+            if mtime:
+                parser.read(path)
+            self._config = (mtime, parser)
+
+        return self._config[1]
+
+    def config_get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        # `section.key` or `section.subsection.key`, as in `git config`
+        section, _, name = key.rpartition('.')
+        head, _, subsection = section.partition('.')
+        if subsection:
+            section = f'{head} "{subsection}"'
+
+        return self.config.get(section, name, fallback=default)
+
+    def ident(self, role: str = 'committer') -> bytes:
+        # `Name <email> <unix time> <tz>` for an author/committer/tagger line,
+        # from GIT_<ROLE>_{NAME,EMAIL,DATE} or user.name / user.email
+        env = 'GIT_COMMITTER' if role == 'tagger' else f'GIT_{role.upper()}'
+        name = os.environ.get(f'{env}_NAME') or self.config_get('user.name')
+        email = os.environ.get(f'{env}_EMAIL') or self.config_get('user.email')
+        if not name or not email:
+            raise Exception('Unknown identity: set user.name and user.email')
+
+        date = os.environ.get(f'{env}_DATE')
+        if date:
+            if not IDENT_DATE_RE.match(date):
+                raise Exception(f'Unsupported date format (expected `<unix time> <+hhmm>`): {date}')
+            date = date.lstrip('@')
+        else:
+            now = time.time()
+            offset = (datetime.datetime.fromtimestamp(now).astimezone().utcoffset() or datetime.timedelta()).total_seconds()
+            sign = '-' if offset < 0 else '+'
+            date = f'{int(now)} {sign}{int(abs(offset)) // 3600:02}{int(abs(offset)) % 3600 // 60:02}'
+
+        return f'{name} <{email}> {date}'.encode()
+
+    def read_object(self, sha: str) -> types.GitObject:
+        obj = self.objects.get(sha)
+        if obj is None:
+            obj = git_object.from_sha(self.gitdir, sha)
+            self.objects.put(sha, obj)
+
+        return obj
+
+    def prefetch(self, shas: Iterable[str], threads: Optional[int] = None) -> None:
+        # loads `shas` into the object cache concurrently so that the reads
+        # that follow (e.g. the entries of a tree) are cache hits
+        missing = [sha for sha in shas if sha not in self.objects.entries]
+        if len(missing) < 2:
+            return
+
+        for sha, type_, data in git_object.read_many(self.gitdir, missing, threads):
+            self.objects.put(sha, git_object.from_data(type_, data))
+
+    def read_raw(self, sha: str) -> tuple[types.GitObjectTypeEnum, bytes]:
+        return git_object.read_raw(self.gitdir, sha)
+
+    def read_header(self, sha: str) -> tuple[types.GitObjectTypeEnum, int]:
+        obj = self.objects.entries.get(sha)
+        if obj is not None:
+            return obj[0].type_, len(git_object.serialize(obj[0]))
+
+        return git_object.read_header(self.gitdir, sha)
+
+    def exists(self, sha: str) -> bool:
+        return sha in self.objects.entries or git_object.exists(self.gitdir, sha)
+
+    def writer(self) -> git_object.ObjectWriter:
+        return git_object.ObjectWriter(self.gitdir)
+
+    def write_object(self, obj: types.GitObject) -> str:
+        sha = self.writer().write_object(obj)
+        self.objects.put(sha, obj)
+
+        return sha
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {
+            'objects': self.objects.stats(),
+            'delta_base_cache': pack.delta_base_cache.stats(),
+        }
+
+
+_repositories: dict[pathlib.Path, Repository] = {}
+_discovered: dict[pathlib.Path, Optional[pathlib.Path]] = {}
+
+
+def load(gitdir: pathlib.Path) -> Repository:
+    res = _repositories.get(gitdir)
+    if not res:
+        res = _repositories[gitdir] = Repository(gitdir)
+
+    return res
+
+
+def discover(path: Optional[pathlib.Path] = None) -> Repository:
+    # the repository containing `path` (default: the current directory)
+    start = (path or pathlib.Path.cwd()).resolve()
+
+    if start not in _discovered:
+        _discovered[start] = lib.locate_dominating_file(start, '.git')
+
+    gitdir = _discovered[start]
+    if not gitdir:
+        raise Exception('Not a git repository')
+
+    return load(gitdir)
@@ -0,0 +1,132 @@
+import pathlib
+import re
+from typing import Optional
+
+from . import diff
+from . import object_names
+from . import refs
+from . import repository
+from . import types
+
+
+# `^`, `^N`, `~`, `~N` and `^{type}` / `^{}` at the end of a revision
+SUFFIX_RE = re.compile(r'(\^\{[a-z]*\}|[~^][0-9]*)$')
+
+REF_PATTERNS = (
+    '{}',
+    'refs/{}',
+    'refs/tags/{}',
+    'refs/heads/{}',
+    'refs/remotes/{}',
+    'refs/remotes/{}/HEAD',
+)
+
+
+def resolve_ref(gitdir: pathlib.Path, name: str) -> Optional[str]:
+    for pattern in REF_PATTERNS:
+        refname = pattern.format(name)
+        # only pseudo refs (HEAD, ORIG_HEAD, ...) live at the top of gitdir
+        if not refname.startswith('refs/') and not refname.isupper():
+            continue
+
+        sha = refs.read_ref(gitdir, refname)
+        if sha:
+            return sha
+
+    return None
+
+
+def resolve_name(gitdir: pathlib.Path, name: str) -> str:
+    if len(name) == 40 and object_names.is_hex(name):
+        return name
+
+    sha = resolve_ref(gitdir, name) or object_names.resolve_prefix(gitdir, name)
+    if not sha:
+        raise Exception(f'Unknown revision: {name}')
+
+    return sha
+
+
+def peel(gitdir: pathlib.Path, sha: str, type_: Optional[types.GitObjectTypeEnum] = None) -> str:
+    # follows tags (and commit -> tree) until an object of `type_` is
+    # reached, or until the first non-tag when `type_` is None
+    while True:
+        obj = repository.load(gitdir).read_object(sha)
+        if obj.type_ == type_:
+            return sha
+
+        if isinstance(obj, types.GitObjectTag):
+            sha = obj.object
+        elif isinstance(obj, types.GitObjectCommit) and type_ == types.GitObjectTypeEnum.TREE:
+            sha = obj.tree
+        elif type_ is None:
+            return sha
+        else:
+            raise Exception(f'{sha} cannot be peeled to a {type_.name.lower()}')
+
+
+def parent_of(gitdir: pathlib.Path, sha: str, n: int) -> str:
+    commit = repository.load(gitdir).read_object(peel(gitdir, sha, types.GitObjectTypeEnum.COMMIT))
+    assert isinstance(commit, types.GitObjectCommit)
+
+    parents = commit.parents
+    if n > len(parents):
+        raise Exception(f'{sha} has no parent {n}')
+
+    return parents[n - 1]
+
+
+def apply_suffix(gitdir: pathlib.Path, sha: str, suffix: str) -> str:
+    if suffix.startswith('^{'):
+        type_name = suffix[2:-1]
+        if not type_name:
+            return peel(gitdir, sha)
+
+        type_ = types.GitObjectTypeEnum.from_str(type_name)
+        if not type_:
+            raise Exception(f'Unknown type: {type_name}')
+
+        return peel(gitdir, sha, type_)
+
+    n = int(suffix[1:]) if len(suffix) > 1 else 1
+    if suffix[0] == '^':
+        if n == 0:
+            return peel(gitdir, sha, types.GitObjectTypeEnum.COMMIT)
+        return parent_of(gitdir, sha, n)
+
+    for _ in range(n):
+        sha = parent_of(gitdir, sha, 1)
+
+    return sha
+
+
+def resolve(gitdir: pathlib.Path, rev: str) -> str:
+    # <rev>:<path> names an entry in the tree of <rev>
+    base, sep, path = rev.partition(':')
+    if sep:
+        tree = peel(gitdir, resolve(gitdir, base or 'HEAD'), types.GitObjectTypeEnum.TREE)
+        if not path.strip('/'):
+            return tree
+
+        item = diff.lookup_path(gitdir, tree, path)
+        if not item:
+            raise Exception(f'Path {path} does not exist in {base or "HEAD"}')
+
+        return item.sha
+
+    suffixes: list[str] = []
+    while match := SUFFIX_RE.search(rev):
+        if not match.start():
+            break
+        suffixes.append(match.group())
+        rev = rev[:match.start()]
+
+    sha = resolve_name(gitdir, rev or 'HEAD')
+    for suffix in reversed(suffixes):
+        sha = apply_suffix(gitdir, sha, suffix)
+
+    return sha
+
+
+def resolve_commit(gitdir: pathlib.Path, rev: str) -> str:
+    return peel(gitdir, resolve(gitdir, rev), types.GitObjectTypeEnum.COMMIT)
@@ -0,0 +1,405 @@
+import heapq
+import pathlib
+from typing import Callable, Iterator, Optional
+
+from . import bloom
+from . import commit_graph
+from . import diff
+from . import merge_base
+from . import repository
+from . import revparse
+from . import types
+
+
+# commit time, parents and tree
+CommitInfo = tuple[int, list[str], str]
+CommitLoader = Callable[[str], CommitInfo]
+
+
+def load_commit(gitdir: pathlib.Path, sha: str) -> types.GitObjectCommit:
+    obj = repository.load(gitdir).read_object(sha)
+    if not isinstance(obj, types.GitObjectCommit):
+        raise Exception(f'Not a commit: {sha}')
+
+    return obj
+
+
+def commit_info_loader(gitdir: pathlib.Path) -> CommitLoader:
+    # answer from the commit-graph when it knows the commit, so the walk
+    # does not have to inflate and parse commit objects
+    graph = commit_graph.load(gitdir)
+    # parents are remembered by graph position so that loading them later
+    # skips the binary search
+    positions: dict[str, int] = {}
+
+    def load(sha: str) -> CommitInfo:
+        if graph:
+            pos = positions.pop(sha, None)
+            if pos is None:
+                pos = graph.find(bytes.fromhex(sha))
+            if pos is not None:
+                _, commit_time = graph.generation_and_time(pos)
+                parents = []
+                for parent_pos in graph.parent_positions(pos):
+                    parent = graph.sha_at(parent_pos)
+                    positions[parent] = parent_pos
+                    parents.append(parent)
+                return commit_time, parents, graph.tree(pos)
+
+        commit = load_commit(gitdir, sha)
+
+        return commit.commit_time, commit.parents, commit.tree
+
+    return load
+
+
+class PathFilter:
+    # Decides whether a commit is TREESAME to a parent for `paths`.  For the
+    # first parent the commit-graph's changed-path Bloom filter is asked
+    # first; only when it answers "maybe" are the trees along each path read.
+    __slots__ = ('gitdir', 'paths', 'graph', 'filters', 'entries', 'bloom_skips', 'tree_diffs')
+
+    def __init__(self, gitdir: pathlib.Path, paths: list[str]) -> None:
+        self.gitdir = gitdir
+        self.paths = [path.strip('/') for path in paths]
+        self.graph = commit_graph.load(gitdir)
+        self.filters = bloom.ChangedPathFilters.load(self.graph)
+        self.entries: dict[tuple[str, str], Optional[tuple[str, str]]] = {}
+        self.bloom_skips = 0
+        self.tree_diffs = 0
+
+    def entry(self, tree: str, path: str) -> Optional[tuple[str, str]]:
+        key = (tree, path)
+        if key not in self.entries:
+            item = diff.lookup_path(self.gitdir, tree, path)
+            self.entries[key] = (item.mode, item.sha) if item else None
+
+        return self.entries[key]
+
+    def treesame(self, sha: str, tree: str, parent_tree: Optional[str], first_parent: bool) -> bool:
+        if first_parent and self.filters and self.graph:
+            pos = self.graph.find(bytes.fromhex(sha))
+            if pos is not None and not any(self.filters.might_change(pos, path) for path in self.paths):
+                self.bloom_skips += 1
+                return True
+
+        self.tree_diffs += 1
+        return all(
+            self.entry(tree, path) == (self.entry(parent_tree, path) if parent_tree else None)
+            for path in self.paths
+        )
+
+    def simplify(self, sha: str, tree: str, parents: list[tuple[str, CommitInfo]]) -> Optional[str]:
+        # returns the first TREESAME parent (the only one worth following),
+        # '' for a root commit that does not touch the paths, None otherwise
+        if not parents:
+            return '' if self.treesame(sha, tree, None, False) else None
+
+        for i, (parent, (_, _, parent_tree)) in enumerate(parents):
+            if self.treesame(sha, tree, parent_tree, i == 0):
+                return parent
+
+        return None
+
+
+def parse_revisions(revisions: list[str]) -> tuple[list[str], list[str]]:
+    include: list[str] = []
+    exclude: list[str] = []
+
+    for revision in revisions:
+        if '..' in revision:
+            left, _, right = revision.partition('..')
+            exclude.append(left or 'HEAD')
+            include.append(right or 'HEAD')
+        elif revision.startswith('^'):
+            exclude.append(revision[1:])
+        else:
+            include.append(revision)
+
+    return include, exclude
+
+
+def resolve_revisions(
+    gitdir: pathlib.Path,
+    revisions: list[str],
+    resolve: Callable[[pathlib.Path, str], str] = revparse.resolve_commit,
+) -> tuple[list[str], list[str]]:
+    # parse_revisions, resolved to object names by `resolve`.  The
+    # symmetric difference `A...B` includes both sides and excludes their
+    # merge bases, as in git.
+    include: list[str] = []
+    exclude: list[str] = []
+
+    for revision in revisions:
+        if '...' in revision:
+            left, _, right = revision.partition('...')
+            left_sha = revparse.resolve_commit(gitdir, left or 'HEAD')
+            right_sha = revparse.resolve_commit(gitdir, right or 'HEAD')
+            include.extend((left_sha, right_sha))
+            exclude.extend(merge_base.merge_bases(repository.load(gitdir), left_sha, [right_sha], all_=True))
+            continue
+
+        names, excluded_names = parse_revisions([revision])
+        include.extend(resolve(gitdir, name) for name in names)
+        exclude.extend(resolve(gitdir, name) for name in excluded_names)
+
+    return include, exclude
+
+
+# commits walked on after only uninteresting ones are queued, to absorb
+# committer dates that are out of order (git's SLOP)
+LIMIT_SLOP = 5
+
+
+def limit(
+    load: CommitLoader,
+    include: list[str],
+    exclude: list[str],
+    first_parent: bool = False,
+) -> set[str]:
+    # The commits reachable from `exclude` as far as the walk from `include`
+    # goes, like git's limit_list.  A commit can come off the date queue
+    # before the uninteresting mark reaches it when dates are skewed, so the
+    # mark is also carried down through the commits already walked, and the
+    # walk goes on for LIMIT_SLOP commits after the last interesting one.
+    uninteresting: set[str] = set()
+    walked: dict[str, list[str]] = {}
+    queue: list[tuple[int, int, str]] = []
+    queued: set[str] = set()
+    interesting_queued: set[str] = set()
+    counter = 0
+
+    def push(sha: str) -> None:
+        nonlocal counter
+        if sha in queued or sha in walked:
+            return
+
+        queued.add(sha)
+        if sha not in uninteresting:
+            interesting_queued.add(sha)
+        counter += 1
+        heapq.heappush(queue, (-load(sha)[0], counter, sha))
+
+    def mark(sha: str) -> None:
+        pending = [sha]
+        while pending:
+            sha = pending.pop()
+            if sha in uninteresting:
+                continue
+            uninteresting.add(sha)
+            interesting_queued.discard(sha)
+            pending.extend(walked.get(sha, ()))
+
+    for sha in exclude:
+        mark(sha)
+        push(sha)
+    for sha in include:
+        push(sha)
+
+    slop = LIMIT_SLOP
+    # the date of the last interesting commit walked
+    date = float('inf')
+    while queue and slop:
+        _, _, sha = heapq.heappop(queue)
+        queued.discard(sha)
+        interesting_queued.discard(sha)
+
+        commit_time, parents, _ = load(sha)
+        if sha not in uninteresting:
+            walked[sha] = parents = parents[:1] if first_parent else parents
+            for parent in parents:
+                push(parent)
+            date = commit_time
+            continue
+
+        walked[sha] = parents
+        for parent in parents:
+            mark(parent)
+            push(parent)
+
+        # go on while interesting commits are queued, or ones no older
+        # than the last interesting commit
+        if interesting_queued or (queue and date <= -queue[0][0]):
+            slop = LIMIT_SLOP
+        else:
+            slop -= 1
+
+    return uninteresting
+
+
+def walk(
+    gitdir: pathlib.Path,
+    include: list[str],
+    exclude: Optional[list[str]] = None,
+    max_count: Optional[int] = None,
+    first_parent: bool = False,
+    load: Optional[CommitLoader] = None,
+    paths: Optional[list[str]] = None,
+) -> Iterator[tuple[str, list[str]]]:
+    # Commits are popped newest-first by committer date.  Commits reachable
+    # from `exclude` are marked uninteresting and propagate the mark to their
+    # parents; the walk stops once only uninteresting commits are queued.
+    # With `exclude`, those commits are found by `limit` first, so commits
+    # whose dates are out of order are not shown by mistake.
+    # With `paths`, commits TREESAME to a parent are hidden and only that
+    # parent is followed, like git's default history simplification.
+    load_ = load or commit_info_loader(gitdir)
+    path_filter = PathFilter(gitdir, paths) if paths else None
+
+    queue: list[tuple[int, int, str, CommitInfo]] = []
+    uninteresting: dict[str, bool] = dict.fromkeys(limit(load_, include, exclude, first_parent) if exclude else (), True)
+    interesting_queued: set[str] = set()
+    counter = 0
+
+    def push(sha: str, flag: bool, info: Optional[CommitInfo] = None) -> None:
+        nonlocal counter
+        if sha in uninteresting:
+            return
+
+        info = info or load_(sha)
+        uninteresting[sha] = flag
+        if not flag:
+            interesting_queued.add(sha)
+        counter += 1
+        heapq.heappush(queue, (-info[0], counter, sha, info))
+
+    for sha in exclude or []:
+        push(sha, True)
+    for sha in include:
+        push(sha, False)
+
+    emitted = 0
+    while queue and interesting_queued:
+        _, _, sha, (_, parents, tree) = heapq.heappop(queue)
+        interesting_queued.discard(sha)
+        flag = uninteresting[sha]
+
+        if first_parent:
+            parents = parents[:1]
+        parent_infos: dict[str, CommitInfo] = {}
+
+        shown = not flag
+        if path_filter and not flag:
+            parent_infos = {parent: load_(parent) for parent in parents if parent not in uninteresting}
+            treesame_parent = path_filter.simplify(
+                sha,
+                tree,
+                [(parent, parent_infos.get(parent) or load_(parent)) for parent in parents],
+            )
+            if treesame_parent is not None:
+                shown = False
+                parents = [treesame_parent] if treesame_parent else []
+
+        for parent in parents:
+            if flag and uninteresting.get(parent) is False:
+                uninteresting[parent] = True
+                interesting_queued.discard(parent)
+            push(parent, flag, parent_infos.get(parent))
+
+        if not shown:
+            continue
+
+        yield sha, parents
+
+        emitted += 1
+        if max_count is not None and emitted >= max_count:
+            return
+
+
+def peel_tips(repo: repository.Repository, shas: list[str]) -> tuple[list[str], list[tuple[str, str]], list[str]]:
+    # (commits, [(tag, tag name)], trees and blobs) for revisions that may
+    # name annotated tags
+    commits: list[str] = []
+    tags: list[tuple[str, str]] = []
+    others: list[str] = []
+
+    for sha in shas:
+        obj = repo.read_object(sha)
+        while isinstance(obj, types.GitObjectTag):
+            tags.append((sha, obj.tag))
+            sha = obj.object
+            obj = repo.read_object(sha)
+
+        (commits if isinstance(obj, types.GitObjectCommit) else others).append(sha)
+
+    return commits, tags, others
+
+
+def walk_objects(
+    gitdir: pathlib.Path,
+    include: list[str],
+    exclude: Optional[list[str]] = None,
+    objects: bool = True,
+) -> Iterator[tuple[str, Optional[str]]]:
+    # (sha, name) like `git rev-list --objects`: the commits of the walk,
+    # then the tags, trees and blobs reachable from them, each once and
+    # with its path.  Objects reachable from the commits at the edge of
+    # `exclude` are left out.
+    repo = repository.load(gitdir)
+    load = commit_info_loader(gitdir)
+
+    commits, tags, others = peel_tips(repo, include)
+    excluded_commits, _, excluded_others = peel_tips(repo, exclude or [])
+
+    trees: list[str] = []
+    shown: set[str] = set()
+    edge: set[str] = set(excluded_commits)
+    for sha, parents in walk(gitdir, commits, excluded_commits, load=load):
+        yield sha, None
+        shown.add(sha)
+        edge.update(parents)
+        trees.append(load(sha)[2])
+
+    if not objects:
+        return
+
+    seen: set[str] = set()
+
+    def tree_entries(tree: str) -> list[types.GitObjectTreeItem]:
+        _, data = repo.read_raw(tree)
+        # a submodule commit is not part of this repository
+        return [item for item in types.iter_tree_items(data) if item.mode != '160000']
+
+    def mark_seen(sha: str) -> None:
+        pending = [sha]
+        while pending:
+            sha = pending.pop()
+            if sha in seen:
+                continue
+            seen.add(sha)
+            if repo.read_header(sha)[0] == types.GitObjectTypeEnum.TREE:
+                pending.extend(item.sha for item in tree_entries(sha))
+
+    for sha in edge - shown:
+        mark_seen(load(sha)[2])
+    for sha in excluded_others:
+        mark_seen(sha)
+
+    def walk_tree(tree: str, path: str) -> Iterator[tuple[str, Optional[str]]]:
+        if tree in seen:
+            return
+        seen.add(tree)
+        yield tree, path
+
+        for item in tree_entries(tree):
+            name = path + '/' + item.path if path else item.path
+            if diff.is_tree(item):
+                yield from walk_tree(item.sha, name)
+            elif item.sha not in seen:
+                seen.add(item.sha)
+                yield item.sha, name
+
+    for sha, name in tags:
+        if sha not in seen:
+            seen.add(sha)
+            yield sha, name
+
+    for sha in others:
+        if repo.read_header(sha)[0] == types.GitObjectTypeEnum.TREE:
+            yield from walk_tree(sha, '')
+        elif sha not in seen:
+            seen.add(sha)
+            yield sha, ''
+
+    for tree in trees:
+        yield from walk_tree(tree, '')
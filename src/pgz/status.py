@@ -0,0 +1,250 @@
+import bisect
+import concurrent.futures
+import os
+import stat
+import time
+from typing import Iterator, Optional
+
+from . import diff
+from . import git_object
+from . import ignore
+from . import index
+from . import repository
+from . import types
+
+
+# git's 'untracked files' modes: `normal` shows a wholly untracked directory
+# as `dir/`, `all` lists the files inside it
+UNTRACKED_MODES = ('no', 'normal', 'all')
+
+
+def staged_changes(
+    repo: repository.Repository,
+    idx: index.Index,
+    tree: Optional[str],
+) -> Iterator[tuple[str, str]]:
+    # HEAD against the index, one directory at a time.  The index is sorted,
+    # so the entries below a directory are a contiguous run; a directory
+    # whose cache-tree SHA equals the HEAD subtree is skipped unread.
+    entries = [entry for entry in idx.entries if not entry.stage]
+    paths = [entry.path for entry in entries]
+    cache_tree = idx.cache_tree()
+
+    def removed(item: types.GitObjectTreeItem, prefix: str) -> Iterator[tuple[str, str]]:
+        if not diff.is_tree(item):
+            yield 'D', prefix + item.path
+            return
+
+        for _status, path, _old, _new in diff.diff_trees(repo.gitdir, item.sha, None, prefix=prefix + item.path + '/'):
+            yield 'D', path
+
+    def diff_dir(tree: Optional[str], prefix: str, lo: int, hi: int) -> Iterator[tuple[str, str]]:
+        cached = cache_tree.get(prefix)
+        if tree and cached and cached[1] == tree:
+            return
+
+        items = {item.path: item for item in diff.read_tree(repo.gitdir, tree)}
+        i = lo
+
+        while i < hi:
+            name, sep, _ = paths[i][len(prefix):].partition('/')
+            item = items.pop(name, None)
+
+            if sep:
+                # every path below `name/` sorts before `name0`
+                end = bisect.bisect_left(paths, prefix + name + '0', i, hi)
+                subtree: Optional[str] = None
+                if item and diff.is_tree(item):
+                    subtree = item.sha
+                elif item:
+                    yield 'D', prefix + name
+
+                yield from diff_dir(subtree, prefix + name + '/', i, end)
+                i = end
+                continue
+
+            entry = entries[i]
+            if item and diff.is_tree(item):
+                yield from removed(item, prefix)
+                item = None
+
+            if not item:
+                yield 'A', entry.path
+            elif item.sha != entry.sha or int(item.mode, 8) != entry.mode:
+                yield 'M', entry.path
+            i += 1
+
+        for item in items.values():
+            yield from removed(item, prefix)
+
+    yield from diff_dir(tree, '', 0, len(paths))
+
+
+def hash_worktree_file(path: str) -> Optional[str]:
+    # None for a file deleted since the worktree was scanned
+    try:
+        return git_object.hash_file(path)
+    except FileNotFoundError:
+        return None
+
+
+def worktree_changes(
+    repo: repository.Repository,
+    idx: index.Index,
+    untracked: str = 'normal',
+    threads: Optional[int] = None,
+) -> tuple[list[tuple[str, str]], list[str], int]:
+    # The index against the worktree.  Files whose stat data matches the
+    # index entry are taken as unchanged; only the others (and entries too
+    # new to trust) are hashed, on a thread pool.  Hashed
+    # files that turn out unchanged get their stat data refreshed in `idx`.
+    # Returns (changes, untracked paths, refreshed entries).
+    started = time.time_ns()
+    # a file modified at or after the index was written may have changed
+    # again within the same timestamp, so its stat data proves nothing
+    racy_ns = idx.mtime_ns or started
+    # unmerged paths (stages 1-3) are tracked but not compared
+    paths = [entry.path for entry in idx.entries]
+    unmerged = {entry.path for entry in idx.entries if entry.stage}
+    remaining = {entry.path: entry for entry in idx.entries if not entry.stage}
+
+    changes: list[tuple[str, str]] = []
+    suspects: list[tuple[index.IndexEntry, os.stat_result]] = []
+    untracked_paths: list[str] = []
+
+    def tracked_below(prefix: str) -> bool:
+        i = bisect.bisect_left(paths, prefix)
+        return i < len(paths) and paths[i].startswith(prefix)
+
+    def read_dir(dirpath: str, prefix: str, rules: list[ignore.Rule]) -> tuple[list[os.DirEntry[str]], list[ignore.Rule]]:
+        with os.scandir(dirpath) as it:
+            dir_entries = list(it)
+
+        if any(dir_entry.name == '.gitignore' for dir_entry in dir_entries):
+            rules = rules + ignore.read_rules(repo.worktree / prefix / '.gitignore', prefix)
+
+        return dir_entries, rules
+
+    def has_untracked(dirpath: str, prefix: str, rules: list[ignore.Rule]) -> bool:
+        dir_entries, rules = read_dir(dirpath, prefix, rules)
+        for dir_entry in dir_entries:
+            path = prefix + dir_entry.name
+            is_dir = dir_entry.is_dir(follow_symlinks=False)
+            if dir_entry.name == '.git' or ignore.is_ignored(rules, path, is_dir):
+                continue
+            if not is_dir or has_untracked(dir_entry.path, path + '/', rules):
+                return True
+
+        return False
+
+    def scan(dirpath: str, prefix: str, rules: list[ignore.Rule], excluded: bool = False) -> None:
+        # `excluded`: an ignored directory that holds tracked files, where
+        # everything untracked is ignored too
+        dir_entries, rules = read_dir(dirpath, prefix, rules)
+
+        for dir_entry in dir_entries:
+            name = dir_entry.name
+            path = prefix + name
+
+            if dir_entry.is_dir(follow_symlinks=False):
+                if name == '.git':
+                    continue
+                if remaining.pop(path, None):
+                    # a submodule
+                    continue
+
+                if tracked_below(path + '/'):
+                    scan(dir_entry.path, path + '/', rules, excluded or ignore.is_ignored(rules, path, True))
+                elif untracked != 'no' and not excluded and not ignore.is_ignored(rules, path, True):
+                    if untracked == 'all':
+                        scan(dir_entry.path, path + '/', rules)
+                    elif has_untracked(dir_entry.path, path + '/', rules):
+                        untracked_paths.append(path + '/')
+                continue
+
+            entry = remaining.pop(path, None)
+            if not entry:
+                if path in unmerged:
+                    continue
+                if untracked != 'no' and not excluded and not ignore.is_ignored(rules, path, False):
+                    untracked_paths.append(path)
+                continue
+
+            try:
+                st = dir_entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                changes.append(('D', path))
+                continue
+            current = index.stat_data(st)
+            if current == entry.stat and st.st_mtime_ns < racy_ns:
+                continue
+
+            if current[6] != entry.mode:
+                # a symlink or submodule replaced by a file, or the other way
+                # round, is a type change; else the executable bit changed
+                same_type = stat.S_IFMT(current[6]) == stat.S_IFMT(entry.mode)
+                changes.append(('M' if same_type else 'T', path))
+            elif current[9] != entry.stat[9] and entry.stat[9]:
+                changes.append(('M', path))
+            else:
+                suspects.append((entry, st))
+
+    scan(str(repo.worktree), '', ignore.global_rules(repo.gitdir, repo.config_get('core.excludesFile')))
+
+    for path in remaining:
+        changes.append(('D', path))
+
+    # a file deleted between the scan and here is reported deleted, as git does
+    files = [os.path.join(repo.worktree, entry.path) for entry, _st in suspects if entry.mode != index.MODE_SYMLINK]
+
+    refreshed = 0
+    with concurrent.futures.ThreadPoolExecutor(threads or os.cpu_count() or 1) as executor:
+        hashed = executor.map(hash_worktree_file, files)
+
+        for entry, st in suspects:
+            sha: Optional[str]
+            if entry.mode == index.MODE_SYMLINK:
+                try:
+                    target = os.readlink(os.path.join(repo.worktree, entry.path))
+                    sha, _raw = git_object.encode(types.GitObjectTypeEnum.BLOB, os.fsencode(target))
+                except FileNotFoundError:
+                    sha = None
+            else:
+                sha = next(hashed)
+
+            if sha is None:
+                changes.append(('D', entry.path))
+            elif sha != entry.sha:
+                changes.append(('M', entry.path))
+            elif st.st_mtime_ns < started:
+                # a file modified after the scan started could change again
+                # without its stat data changing, so it stays unrefreshed
+                entry.stat = index.stat_data(st)
+                refreshed += 1
+
+    return changes, untracked_paths, refreshed
+
+
+def status(
+    repo: repository.Repository,
+    idx: index.Index,
+    tree: Optional[str],
+    untracked: str = 'normal',
+    threads: Optional[int] = None,
+) -> tuple[list[tuple[str, str]], list[str], int]:
+    # ([(XY, path)] sorted by path, untracked paths, refreshed entries) where
+    # X is the index against `tree` (HEAD) and Y the worktree against the index
+    codes: dict[str, list[str]] = {}
+
+    for code, path in staged_changes(repo, idx, tree):
+        codes.setdefault(path, [' ', ' '])[0] = code
+
+    changes, untracked_paths, refreshed = worktree_changes(repo, idx, untracked, threads)
+    for code, path in changes:
+        codes.setdefault(path, [' ', ' '])[1] = code
+
+    for entry in idx.entries:
+        if entry.stage:
+            codes[entry.path] = ['U', 'U']
+
+    return [(''.join(codes[path]), path) for path in sorted(codes)], sorted(untracked_paths), refreshed
@@ -0,0 +1,84 @@
+import pathlib
+from typing import Iterator, Optional
+
+from . import diff
+from . import repository
+from . import types
+
+
+# sibling subtrees loaded ahead of the one being descended into
+PREFETCH_WINDOW = 32
+
+
+def match(path: str, specs: Optional[list[str]]) -> tuple[bool, bool]:
+    # (matched: `path` is named by a pathspec or lies inside one,
+    #  leads: a pathspec lies below `path`, so it has to be descended into)
+    if specs is None:
+        return True, False
+
+    matched = leads = False
+    for spec in specs:
+        if spec.startswith(path + '/'):
+            leads = True
+        elif path == spec or path.startswith(spec if spec.endswith('/') else spec + '/'):
+            matched = True
+
+    return matched, leads
+
+
+def walk(
+    gitdir: pathlib.Path,
+    tree: str,
+    paths: Optional[list[str]] = None,
+    recursive: bool = False,
+    show_trees: bool = False,
+) -> Iterator[tuple[str, types.GitObjectTreeItem]]:
+    # Yields (path, entry) in tree order, like `git ls-tree`.  Pathspecs are
+    # literal prefixes from the top of the tree; subtrees are entered only
+    # when a pathspec reaches into them (or, with `recursive`, when they
+    # match), and are shown when not entered or with `show_trees`.
+    specs = [path.lstrip('/') for path in paths] if paths else None
+
+    yield from walk_tree(repository.load(gitdir), tree, '', specs, recursive, show_trees)
+
+
+def walk_tree(
+    repo: repository.Repository,
+    tree: str,
+    prefix: str,
+    specs: Optional[list[str]],
+    recursive: bool,
+    show_trees: bool,
+) -> Iterator[tuple[str, types.GitObjectTreeItem]]:
+    obj = repo.read_object(tree)
+    if not isinstance(obj, types.GitObjectTree):
+        raise Exception(f'Not a tree: {tree}')
+
+    # (entry, show it, descend into it, pathspecs for its subtree)
+    plan: list[tuple[types.GitObjectTreeItem, bool, bool, Optional[list[str]]]] = []
+    subtrees: list[str] = []
+
+    for item in obj.iter_items():
+        matched, leads = match(prefix + item.path, specs)
+        if diff.is_tree(item) and (leads or (matched and recursive)):
+            # everything below a matched tree matches
+            plan.append((item, show_trees, True, specs if leads else None))
+            subtrees.append(item.sha)
+        elif matched:
+            plan.append((item, True, False, specs))
+
+    # subtrees are loaded concurrently a window at a time, right before the
+    # walk reaches them, so the object cache holds at most a window per level
+    descended = 0
+    for item, show, descend, child_specs in plan:
+        path = prefix + item.path
+        if show:
+            yield path, item
+        if not descend:
+            continue
+
+        if item.sha not in repo.objects.entries:
+            repo.prefetch(subtrees[descended:descended + PREFETCH_WINDOW])
+        descended += 1
+
+        yield from walk_tree(repo, item.sha, path + '/', child_specs, recursive, show_trees)
@@ -1,8 +1,6 @@
 from __future__ import annotations
 import enum
-from typing import Optional
-
-import pydantic
+from typing import ClassVar, Iterator, Optional, Self
 
 
 class GitObjectTypeEnum(enum.Enum):
@@ -23,39 +21,309 @@ class GitObjectTypeEnum(enum.Enum):
         return mapping.get(arg.upper())
 
 
-class GitObject(pydantic.BaseModel):
-    type_: GitObjectTypeEnum
+def parse_headers(raw: bytes) -> tuple[list[tuple[str, bytes]], bytes]:
+    end = raw.find(b'\n\n')
+    if end < 0:
+        header_block, message = raw.rstrip(b'\n'), b''
+    else:
+        header_block, message = raw[:end], raw[end + 2:]
+
+    headers: list[tuple[str, bytes]] = []
+    if not header_block:
+        return headers, message
+
+    for line in header_block.split(b'\n'):
+        if line[:1] == b' ' and headers:
+            # continuation line, e.g. inside gpgsig
+            key, value = headers[-1]
+            headers[-1] = (key, value + b'\n' + line[1:])
+            continue
+
+        key, sep, value = line.partition(b' ')
+        if not sep:
+            raise Exception(f'Malformed header: {line!r}')
+        headers.append((key.decode(), value))
+
+    return headers, message
+
+
+def iter_tree_items(raw: bytes) -> Iterator[GitObjectTreeItem]:
+    # walks `raw` by offset; only the small mode/path/sha fields are sliced,
+    # the remainder of the buffer is never copied.
+    find = raw.find
+    new_item = GitObjectTreeItem
+    size = len(raw)
+    pos = 0
+
+    while pos < size:
+        mode_end = find(b' ', pos)
+        path_end = find(b'\x00', mode_end)
+        if mode_end < 0 or path_end < 0 or path_end + 21 > size:
+            raise Exception('Malformed tree: truncated entry')
+
+        mode = raw[pos:mode_end].decode()
+        if len(mode) < 6:
+            mode = f'{mode:0>6}'  # pad 0 with right align
+
+        yield new_item(mode, raw[mode_end + 1:path_end].decode(), raw[path_end + 1:path_end + 21].hex())
+
+        pos = path_end + 21
+
+
+def parse_tree_items(raw: bytes) -> list[GitObjectTreeItem]:
+    return list(iter_tree_items(raw))
+
+
+class GitObject:
+    __slots__ = ('type_',)
+
+    def __init__(self, type_: GitObjectTypeEnum) -> None:
+        self.type_ = type_
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(type_={self.type_})'
 
 
 class GitObjectBlob(GitObject):
-    blob: bytes
+    __slots__ = ('blob',)
+
+    def __init__(self, type_: GitObjectTypeEnum = GitObjectTypeEnum.BLOB, blob: bytes = b'') -> None:
+        super().__init__(type_)
+        self.blob = blob
+
+
+class GitObjectWithHeaders(GitObject):
+    # Commits and tags keep their raw bytes and split them into headers only
+    # when a field is first read.  Headers without a dedicated property are
+    # still reachable as attributes (e.g. `obj.gpgsig`).
+    __slots__ = ('raw', '_headers', '_fields', '_message')
+    default_type: ClassVar[GitObjectTypeEnum]
+
+    def __init__(
+        self,
+        type_: GitObjectTypeEnum,
+        headers: Optional[list[tuple[str, bytes]]] = None,
+        message: bytes = b'',
+        raw: Optional[bytes] = None,
+    ) -> None:
+        super().__init__(type_)
+        self.raw = raw
+        self._headers = headers
+        self._fields = dict(headers) if headers is not None else None
+        self._message = message
+
+    @classmethod
+    def from_raw(cls, raw: bytes) -> Self:
+        obj = cls.__new__(cls)
+        obj.type_ = cls.default_type
+        obj.raw = raw
+        obj._headers = None
+        obj._fields = None
+        obj._message = b''
+
+        return obj
+
+    def parse(self) -> dict[str, bytes]:
+        self._headers, self._message = parse_headers(self.raw or b'')
+        self._fields = dict(self._headers)
+
+        return self._fields
+
+    @property
+    def headers(self) -> list[tuple[str, bytes]]:
+        if self._headers is None:
+            self.parse()
+
+        return self._headers or []
+
+    @property
+    def message(self) -> bytes:
+        if self._headers is None:
+            self.parse()
+
+        return self._message
+
+    def get(self, key: str) -> Optional[bytes]:
+        fields = self._fields if self._fields is not None else self.parse()
+
+        return fields.get(key)
+
+    def get_all(self, key: str) -> list[bytes]:
+        return [value for header_key, value in self.headers if header_key == key]
 
+    def __getattr__(self, name: str) -> bytes:
+        if name.startswith('_') or name == 'raw':
+            raise AttributeError(name)
 
-class GitObjectCommit(GitObject):
-    model_config = pydantic.ConfigDict(extra='allow')
+        value = self.get(name)
+        if value is None:
+            raise AttributeError(name)
 
-    tree: str
-    parent: Optional[str] = None
-    author: bytes
-    committer: bytes
-    message: bytes
+        return value
 
 
-class GitObjectTreeItem(pydantic.BaseModel):
-    mode: str
-    path: str
-    sha: str
+def encode(value: str | bytes) -> bytes:
+    return value.encode() if isinstance(value, str) else value
+
+
+class GitObjectCommit(GitObjectWithHeaders):
+    __slots__ = ()
+    default_type = GitObjectTypeEnum.COMMIT
+
+    def __init__(
+        self,
+        type_: GitObjectTypeEnum = GitObjectTypeEnum.COMMIT,
+        tree: str = '',
+        parent: Optional[str] = None,
+        author: bytes = b'',
+        committer: bytes = b'',
+        message: bytes = b'',
+        **extra: str | bytes,
+    ) -> None:
+        headers = [('tree', tree.encode())]
+        if parent:
+            headers.append(('parent', parent.encode()))
+        headers.append(('author', author))
+        headers.append(('committer', committer))
+        headers.extend((key, encode(value)) for key, value in extra.items())
+
+        super().__init__(type_, headers, message)
+
+    # `tree` and `parent` lines have a fixed layout at the start of a commit,
+    # so they are sliced out of the raw bytes without parsing the headers.
+
+    @property
+    def tree(self) -> str:
+        raw = self.raw
+        if self._fields is None and raw is not None and raw.startswith(b'tree '):
+            return raw[5:45].decode()
+
+        return (self.get('tree') or b'').decode()
+
+    @property
+    def parents(self) -> list[str]:
+        raw = self.raw
+        if self._fields is None and raw is not None and raw.startswith(b'tree '):
+            parents = []
+            pos = 46
+            while raw.startswith(b'parent ', pos):
+                parents.append(raw[pos + 7:pos + 47].decode())
+                pos += 48
+            return parents
+
+        return [parent.decode() for parent in self.get_all('parent')]
+
+    @property
+    def parent(self) -> Optional[str]:
+        parents = self.parents
+        return parents[0] if parents else None
+
+    @property
+    def author(self) -> bytes:
+        return self.get('author') or b''
+
+    @property
+    def committer(self) -> bytes:
+        return self.get('committer') or b''
+
+    @property
+    def commit_time(self) -> int:
+        # committer is `Name <email> <epoch> <tz>`
+        fields = self.committer.rsplit(b' ', 2)
+        return int(fields[1]) if len(fields) == 3 else 0
+
+
+class GitObjectTreeItem:
+    __slots__ = ('mode', 'path', 'sha')
+
+    def __init__(self, mode: str, path: str, sha: str) -> None:
+        self.mode = mode
+        self.path = path
+        self.sha = sha
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, GitObjectTreeItem):
+            return NotImplemented
+
+        return (self.mode, self.path, self.sha) == (other.mode, other.path, other.sha)
+
+    def __repr__(self) -> str:
+        return f'GitObjectTreeItem(mode={self.mode!r}, path={self.path!r}, sha={self.sha!r})'
 
 
 class GitObjectTree(GitObject):
-    items: list[GitObjectTreeItem]
+    __slots__ = ('raw', '_items')
+
+    def __init__(
+        self,
+        type_: GitObjectTypeEnum = GitObjectTypeEnum.TREE,
+        items: Optional[list[GitObjectTreeItem]] = None,
+        raw: Optional[bytes] = None,
+    ) -> None:
+        super().__init__(type_)
+        self.raw = raw
+        self._items = items
+
+    @classmethod
+    def from_raw(cls, raw: bytes) -> Self:
+        obj = cls.__new__(cls)
+        obj.type_ = GitObjectTypeEnum.TREE
+        obj.raw = raw
+        obj._items = None
+
+        return obj
+
+    @property
+    def items(self) -> list[GitObjectTreeItem]:
+        if self._items is None:
+            self._items = parse_tree_items(self.raw or b'')
+
+        return self._items
+
+    def iter_items(self) -> Iterator[GitObjectTreeItem]:
+        # streams entries without materializing (or caching) the whole list
+        if self._items is not None:
+            return iter(self._items)
+
+        return iter_tree_items(self.raw or b'')
+
+
+class GitObjectTag(GitObjectWithHeaders):
+    __slots__ = ()
+    default_type = GitObjectTypeEnum.TAG
+
+    def __init__(
+        self,
+        type_: GitObjectTypeEnum = GitObjectTypeEnum.TAG,
+        object: str = '',
+        type: str = '',
+        tag: str = '',
+        tagger: bytes = b'',
+        message: bytes = b'',
+        **extra: str | bytes,
+    ) -> None:
+        headers = [
+            ('object', object.encode()),
+            ('type', type.encode()),
+            ('tag', tag.encode()),
+            ('tagger', tagger),
+        ]
+        headers.extend((key, encode(value)) for key, value in extra.items())
+
+        super().__init__(type_, headers, message)
+
+    @property
+    def object(self) -> str:
+        return (self.get('object') or b'').decode()
 
+    @property
+    def type(self) -> str:
+        return (self.get('type') or b'').decode()
 
-class GitObjectTag(GitObject):
-    model_config = pydantic.ConfigDict(extra='allow')
+    @property
+    def tag(self) -> str:
+        return (self.get('tag') or b'').decode()
 
-    object: str
-    type: str
-    tag: str
-    tagger: bytes
-    message: bytes
+    @property
+    def tagger(self) -> bytes:
+        return self.get('tagger') or b''
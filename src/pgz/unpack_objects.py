@@ -0,0 +1,151 @@
+import array
+import bisect
+import collections
+import pathlib
+from typing import BinaryIO, Optional, Union
+
+from . import delta
+from . import git_object
+from . import pack
+from . import repository
+from . import types
+
+
+# objects written per ObjectWriter batch (one sync each); bounds the
+# temporary files and names a writer keeps track of
+BATCH_SIZE = 10000
+
+
+class Unpacker:
+    # Explodes a pack read from a stream into loose objects, front to back
+    # and without seeking, so it works on a pipe and never holds the whole
+    # pack.  A delta base is taken from a bounded cache of recent objects,
+    # else read back from the objects written so far; a delta whose base
+    # comes later in the pack (or is itself waiting) is kept until the
+    # base is written.  Beyond that, memory grows only with the number of
+    # objects, by the 28 bytes that map an offset to its SHA.
+    __slots__ = (
+        'repo', 'stream', 'cache', 'offsets', 'shas', 'late', 'waiting', 'writer',
+        'counts', 'deltas', 'written', 'skipped',
+    )
+
+    def __init__(
+        self,
+        repo: repository.Repository,
+        input: BinaryIO,
+        path: pathlib.Path = pathlib.Path('<stdin>'),
+        cache_size: int = pack.DEFAULT_DELTA_BASE_CACHE_SIZE,
+    ) -> None:
+        self.repo = repo
+        self.stream = pack.PackStream(input, path)
+        self.cache = pack.DeltaBaseCache(cache_size)
+        # entry offsets in pack order, and their binary SHAs end to end
+        self.offsets = array.array('Q')
+        self.shas = bytearray()
+        # offsets of the deltas that were resolved out of order
+        self.late: dict[int, bytes] = {}
+        # base SHA or offset -> [(offset, delta)]
+        self.waiting: dict[Union[bytes, int], list[tuple[int, bytes]]] = {}
+        self.writer: Optional[git_object.ObjectWriter] = None
+        self.counts: collections.Counter[types.GitObjectTypeEnum] = collections.Counter()
+        self.deltas = 0
+        self.written = 0
+        self.skipped = 0
+
+    def run(self) -> None:
+        count = self.stream.read_header()
+
+        for start in range(0, count, BATCH_SIZE):
+            with self.repo.writer() as self.writer:
+                for _ in range(min(BATCH_SIZE, count - start)):
+                    self.unpack_entry()
+            self.written += self.writer.written
+            self.skipped += self.writer.skipped
+
+        self.stream.check_trailer()
+
+        if self.waiting:
+            missing = sum(len(deltas) for deltas in self.waiting.values())
+            raise Exception(f'{missing} deltas have no base in the pack or the repository')
+
+    def unpack_entry(self) -> None:
+        offset = self.stream.offset
+        type_num, size = self.stream.entry_header()
+
+        if type_num == pack.OBJ_OFS_DELTA:
+            base_offset = offset - self.stream.ofs_distance()
+            self.add_delta(offset, base_offset, self.stream.inflate(size))
+            return
+
+        if type_num == pack.OBJ_REF_DELTA:
+            base_sha = self.stream.read(20)
+            self.add_delta(offset, base_sha, self.stream.inflate(size))
+            return
+
+        type_ = pack.TYPE_MAPPING.get(type_num)
+        if not type_:
+            raise Exception(f'Unsupported pack entry type {type_num} in {self.stream.path}')
+
+        self.emit(offset, type_, self.stream.inflate(size))
+
+    def add_delta(self, offset: int, base: Union[bytes, int], delta_data: bytes) -> None:
+        self.deltas += 1
+
+        found = self.read_base(base)
+        if not found:
+            self.waiting.setdefault(base, []).append((offset, delta_data))
+            return
+
+        type_, data = found
+        self.emit(offset, type_, delta.apply_delta(data, delta_data))
+
+    def read_base(self, base: Union[bytes, int]) -> Optional[pack.PackedObject]:
+        if isinstance(base, int):
+            cached = self.cache.get((self.stream.path, base))
+            if cached:
+                return cached
+
+            binsha = self.sha_at(base)
+            if not binsha:
+                return None
+        else:
+            binsha = base
+
+        assert self.writer
+        sha = binsha.hex()
+        found = self.writer.read(sha)
+        if found:
+            return found
+        if self.repo.exists(sha):
+            return self.repo.read_raw(sha)
+
+        return None
+
+    def sha_at(self, offset: int) -> Optional[bytes]:
+        i = bisect.bisect_left(self.offsets, offset)
+        if i < len(self.offsets) and self.offsets[i] == offset:
+            return bytes(self.shas[20 * i:20 * i + 20])
+
+        return self.late.get(offset)
+
+    def emit(self, offset: int, type_: types.GitObjectTypeEnum, data: bytes) -> None:
+        assert self.writer
+        # the deltas waiting on an object are resolved from a stack rather
+        # than by recursion, as a chain of them can be arbitrarily long
+        stack: list[tuple[int, bytes, Optional[bytes]]] = [(offset, data, None)]
+        while stack:
+            offset, data, delta_data = stack.pop()
+            if delta_data is not None:
+                data = delta.apply_delta(data, delta_data)
+            binsha = bytes.fromhex(self.writer.write(type_, data))
+            self.counts[type_] += 1
+
+            if not self.offsets or offset > self.offsets[-1]:
+                self.offsets.append(offset)
+                self.shas += binsha
+            else:
+                self.late[offset] = binsha
+            self.cache.put((self.stream.path, offset), (type_, data))
+
+            for key in (binsha, offset):
+                stack.extend((delta_offset, data, waiting) for delta_offset, waiting in self.waiting.pop(key, ()))
@@ -0,0 +1,72 @@
+import io
+import os
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+from pgz import cmd
+
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'pgz',
+    'GIT_AUTHOR_EMAIL': 'pgz@example.com',
+    'GIT_COMMITTER_NAME': 'pgz',
+    'GIT_COMMITTER_EMAIL': 'pgz@example.com',
+}
+
+
+def git(cwd: pathlib.Path, *args: str) -> str:
+    env = {**os.environ, **GIT_ENV}
+    return subprocess.run(['git', *args], cwd=cwd, env=env, check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def repo(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    git(tmp_path, 'init', '-q', '-b', 'main')
+    git(tmp_path, 'commit', '-q', '--allow-empty', '-m', 'first')
+    git(tmp_path, 'commit', '-q', '--allow-empty', '-m', 'second')
+    monkeypatch.chdir(tmp_path)
+
+    return tmp_path
+
+
+def run_stdin(monkeypatch: pytest.MonkeyPatch, commands: str) -> None:
+    monkeypatch.setattr(sys, 'stdin', io.TextIOWrapper(io.BytesIO(commands.encode())))
+    cmd.main_update_ref(['--stdin'])
+
+
+def test_stdin_transaction(repo: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    head = git(repo, 'rev-parse', 'HEAD')
+    parent = git(repo, 'rev-parse', 'HEAD~')
+
+    run_stdin(monkeypatch, f'create refs/tags/v1 {parent}\nupdate refs/heads/main {parent} {head}\n')
+
+    assert git(repo, 'rev-parse', 'refs/tags/v1') == parent
+    assert git(repo, 'rev-parse', 'refs/heads/main') == parent
+
+
+def test_stdin_transaction_is_all_or_nothing(repo: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    head = git(repo, 'rev-parse', 'HEAD')
+    parent = git(repo, 'rev-parse', 'HEAD~')
+
+    with pytest.raises(Exception, match='Cannot update refs/heads/main'):
+        # the old value of main is wrong, so the tag must not be created
+        run_stdin(monkeypatch, f'create refs/tags/v1 {head}\nupdate refs/heads/main {head} {parent}\n')
+
+    assert git(repo, 'show-ref', 'refs/heads/main').split()[0] == head
+    assert subprocess.run(['git', 'rev-parse', '-q', '--verify', 'refs/tags/v1'], cwd=repo, capture_output=True).returncode != 0
+
+
+def test_stdin_delete_packed_ref(repo: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    parent = git(repo, 'rev-parse', 'HEAD~')
+    git(repo, 'update-ref', 'refs/heads/old', parent)
+    git(repo, 'update-ref', 'refs/heads/loose', parent)
+    git(repo, 'pack-refs', '--all')
+    git(repo, 'update-ref', 'refs/heads/loose', parent)
+
+    run_stdin(monkeypatch, f'delete refs/heads/old {parent}\ndelete refs/heads/loose {parent}\n')
+
+    assert git(repo, 'for-each-ref', '--format=%(refname)') == 'refs/heads/main'
+    assert not (repo / '.git' / 'packed-refs.lock').exists()